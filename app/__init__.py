@@ -2,9 +2,10 @@
 Application Flask pour Music Streaming API
 """
 import logging
-from flask import Flask
+from flask import Flask, request
 from flask_cors import CORS
 from .config import config
+from compression import compress_flask_response
 
 
 def create_app(config_name='default'):
@@ -26,6 +27,11 @@ def create_app(config_name='default'):
         }
     })
     
+    # gzip/brotli négociés sur Accept-Encoding; corps en cache compressés une seule fois
+    @app.after_request
+    def compress_response(response):
+        return compress_flask_response(response, request.headers.get('Accept-Encoding'))
+    
     # Configurer les logs
     logging.basicConfig(
         level=logging.INFO,
@@ -10,6 +10,30 @@ class Config:
     # Dossiers
     BASE_DIR = Path(__file__).parent.parent
     AUDIO_DIR = BASE_DIR / "audio_files"
+    # Cache disque des téléchargements: quota, espace libre minimal (octets, 0 = sans borne)
+    # et politique d'éviction (lru ou lfu)
+    AUDIO_CACHE_MAX_BYTES = int(os.getenv("AUDIO_CACHE_MAX_BYTES", 5 * 1024 ** 3))
+    AUDIO_CACHE_MIN_FREE_BYTES = int(os.getenv("AUDIO_CACHE_MIN_FREE_BYTES", 1024 ** 3))
+    AUDIO_CACHE_EVICTION = os.getenv("AUDIO_CACHE_EVICTION", "lru")
+    # Envoi des fichiers: wsgi (send_file, sendfile du serveur WSGI) ou x-accel
+    # (X-Accel-Redirect: nginx sert le fichier, plages comprises, en sendfile)
+    AUDIO_SENDFILE_MODE = os.getenv("AUDIO_SENDFILE_MODE", "wsgi")
+    AUDIO_ACCEL_REDIRECT_PREFIX = os.getenv("AUDIO_ACCEL_REDIRECT_PREFIX", "/protected-audio/")
+    AUDIO_FILE_MAX_AGE = int(os.getenv("AUDIO_FILE_MAX_AGE", 86400))  # 24 heures
+    # Téléchargement progressif: sur un fichier absent, les octets sont envoyés
+    # pendant que yt-dlp les écrit (désactivable par requête avec ?progressive=false)
+    AUDIO_PROGRESSIVE_DOWNLOAD = os.getenv("AUDIO_PROGRESSIVE_DOWNLOAD", "true").lower() == "true"
+    AUDIO_PROGRESSIVE_START_TIMEOUT = float(os.getenv("AUDIO_PROGRESSIVE_START_TIMEOUT", 30))
+    AUDIO_PROGRESSIVE_IDLE_TIMEOUT = float(os.getenv("AUDIO_PROGRESSIVE_IDLE_TIMEOUT", 60))
+    # Téléchargements yt-dlp en parallèle, et en attente au-delà desquels on répond 503
+    AUDIO_DOWNLOAD_WORKERS = int(os.getenv("AUDIO_DOWNLOAD_WORKERS", 4))
+    AUDIO_DOWNLOAD_QUEUE = int(os.getenv("AUDIO_DOWNLOAD_QUEUE", 8))
+    # Fichiers temporaires non modifiés depuis AUDIO_ORPHAN_MIN_AGE secondes supprimés
+    # au démarrage puis toutes les AUDIO_ORPHAN_SWEEP_INTERVAL secondes (0 = au démarrage
+    # seulement). Un téléchargement actif écrit son fichier en continu (timeout réseau
+    # yt-dlp: 20 s par défaut): quelques minutes sans écriture = téléchargement mort
+    AUDIO_ORPHAN_MIN_AGE = int(os.getenv("AUDIO_ORPHAN_MIN_AGE", 300))  # 5 minutes
+    AUDIO_ORPHAN_SWEEP_INTERVAL = int(os.getenv("AUDIO_ORPHAN_SWEEP_INTERVAL", 600))  # 10 minutes
     
     # API
     HOST = "0.0.0.0"
@@ -45,10 +69,19 @@ class Config:
         {'language': 'en', 'location': 'AU'},
         None  # Fallback
     ]
+    # Connexions HTTP keep-alive partagées par les clients YTMusic des régions
+    YTMUSIC_HTTP_POOL_SIZE = int(os.getenv("YTMUSIC_HTTP_POOL_SIZE", 10))
+    YTMUSIC_HTTP_TIMEOUT = float(os.getenv("YTMUSIC_HTTP_TIMEOUT", 30))  # secondes, par requête HTTP
+    
+    # Recherche multi-région: sequential, race (première réponse) ou merge (fusion)
+    SEARCH_MODE = os.getenv("SEARCH_MODE", "sequential")
+    SEARCH_DEADLINE = float(os.getenv("SEARCH_DEADLINE", 3.0))  # secondes
+    SEARCH_FANOUT_WORKERS = int(os.getenv("SEARCH_FANOUT_WORKERS", 12))
     
     # Cache
     CACHE_TTL = 3600  # 1 heure
-    STREAM_CACHE_TTL = 1800  # 30 minutes
+    STREAM_CACHE_TTL = 1800  # 30 minutes, si l'URL ne porte pas sa propre expiration
+    STREAM_URL_SAFETY_MARGIN = int(os.getenv("STREAM_URL_SAFETY_MARGIN", 600))  # 10 minutes
     
     @classmethod
     def init_app(cls, app):
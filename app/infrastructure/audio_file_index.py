@@ -0,0 +1,355 @@
+"""
+Index en mémoire des fichiers audio téléchargés: video_id -> fichier
+
+Le dossier est parcouru une seule fois au démarrage; chaque téléchargement et
+chaque suppression met ensuite l'index à jour. Les recherches sont en O(1) et
+comparent le video_id exact (plus de préfixe: "abc" ne trouve pas "abcd.m4a").
+
+L'index sert aussi de cache disque borné: quota en octets, espace libre
+minimal, éviction LRU ou LFU. Les accès sont comptés en mémoire seulement
+(aucune écriture disque par fichier servi); au démarrage, le dernier accès
+d'un fichier vaut sa date de modification.
+
+Les téléchargements s'écrivent dans un sous-dossier temporaire (jamais
+parcouru par l'index) et n'apparaissent dans le dossier qu'une fois
+complets, par un renommage atomique.
+"""
+import logging
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Fichiers intermédiaires de yt-dlp, jamais indexés
+PARTIAL_EXTENSIONS = {'part', 'ytdl', 'temp', 'tmp'}
+# Sous-dossier des téléchargements en cours (même système de fichiers: renommage atomique)
+TEMP_DIRNAME = '.incoming'
+
+EVICTION_POLICIES = ('lru', 'lfu')
+
+# Type MIME par extension, quand l'en-tête du conteneur n'est pas reconnu
+AUDIO_MIMETYPES = {
+    'webm': 'audio/webm', 'weba': 'audio/webm', 'mka': 'audio/x-matroska',
+    'm4a': 'audio/mp4', 'mp4': 'audio/mp4', 'aac': 'audio/aac',
+    'opus': 'audio/ogg', 'ogg': 'audio/ogg', 'oga': 'audio/ogg',
+    'mp3': 'audio/mpeg', 'flac': 'audio/flac', 'wav': 'audio/wav'
+}
+
+
+def is_partial_filename(filename: str) -> bool:
+    """'abc.webm.part', 'abc.f251.webm.ytdl' -> True"""
+    return any(part in PARTIAL_EXTENSIONS for part in filename.lower().split('.')[1:])
+
+
+def parse_filename(filename: str) -> Optional[Dict]:
+    """'dQw4w9WgXcQ.m4a' -> {'video_id': 'dQw4w9WgXcQ', 'ext': 'm4a'}; None pour un fichier partiel"""
+    video_id, _, rest = filename.partition('.')
+    if not video_id or is_partial_filename(filename):
+        return None
+    return {'video_id': video_id, 'ext': rest.lower().rpartition('.')[2] if rest else ''}
+
+
+def sniff_audio_mimetype(path: str, ext: str = '') -> str:
+    """Type MIME d'après les premiers octets du conteneur (webm, mp4, ogg, mp3...)"""
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(16)
+    except OSError:
+        head = b''
+    if head.startswith(b'\x1a\x45\xdf\xa3'):
+        # EBML: WebM ou Matroska, yt-dlp nomme .webm les pistes audio WebM
+        return 'audio/x-matroska' if ext == 'mka' else 'audio/webm'
+    if head[4:8] == b'ftyp':
+        return 'audio/mp4'
+    if head.startswith(b'OggS'):
+        return 'audio/ogg'
+    if head.startswith(b'fLaC'):
+        return 'audio/flac'
+    if head.startswith(b'RIFF') and head[8:12] == b'WAVE':
+        return 'audio/wav'
+    if head.startswith(b'ID3'):
+        return 'audio/mpeg'
+    if len(head) >= 2 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0:
+        # Synchronisation de trame: ADTS (AAC) si la couche vaut 0, sinon MPEG audio
+        return 'audio/aac' if head[1] & 0x06 == 0 else 'audio/mpeg'
+    return AUDIO_MIMETYPES.get(ext, 'application/octet-stream')
+
+
+def file_record(path: Path, stat: Optional[os.stat_result] = None) -> Optional[Dict]:
+    """Enregistrement d'index d'un fichier: video_id, filename, path, size, ext, mtime"""
+    parsed = parse_filename(path.name)
+    if parsed is None:
+        return None
+    stat = stat or path.stat()
+    return {
+        'video_id': parsed['video_id'],
+        'filename': path.name,
+        'path': str(path),
+        'size': stat.st_size,
+        'ext': parsed['ext'],
+        'mtime': stat.st_mtime,
+        'last_access': stat.st_mtime,
+        'hits': 0
+    }
+
+
+class AudioFileIndex:
+    """video_id -> enregistrement du fichier audio local
+
+    max_bytes et min_free_bytes à 0 désactivent la borne correspondante.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int = 0, min_free_bytes: int = 0, policy: str = 'lru'):
+        if policy not in EVICTION_POLICIES:
+            raise ValueError(f"Politique d'éviction inconnue: {policy}")
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.min_free_bytes = min_free_bytes
+        self.policy = policy
+        self._records: Dict[str, Dict] = {}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._build_ms = None
+        self._duplicates = 0
+        self._duplicate_failures = 0
+        self._evictions = {'quota': 0, 'free_space': 0}
+        self._bytes_reclaimed = 0
+        self._eviction_failures = 0
+        self._orphans_swept = 0
+
+    @property
+    def temp_dir(self) -> Path:
+        return self.directory / TEMP_DIRNAME
+
+    def sweep_orphans(self, min_age: float = 0, active: Iterable[str] = ()) -> int:
+        """Supprime les fichiers laissés par des téléchargements interrompus
+
+        Tout le dossier temporaire et les fichiers partiels de yt-dlp du dossier
+        audio, s'ils n'ont pas été modifiés depuis min_age secondes (un autre
+        processus peut être en train d'écrire les plus récents). Les chemins
+        `active` (téléchargements en cours dans ce processus) sont toujours gardés.
+        """
+        cutoff = time.time() - min_age
+        active = {os.path.abspath(path) for path in active}
+        swept = 0
+        for directory, partial_only in ((self.temp_dir, False), (self.directory, True)):
+            try:
+                entries = list(os.scandir(directory))
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                if not entry.is_file() or (partial_only and not is_partial_filename(entry.name)):
+                    continue
+                if os.path.abspath(entry.path) in active:
+                    continue
+                try:
+                    if entry.stat().st_mtime > cutoff:
+                        continue
+                    os.unlink(entry.path)
+                    swept += 1
+                except FileNotFoundError:
+                    continue
+                except OSError as e:
+                    logger.warning(f"❌ Suppression impossible de {entry.name}: {e}")
+        with self._lock:
+            self._orphans_swept += swept
+        if swept:
+            logger.info(f"🧹 {swept} fichiers temporaires orphelins supprimés")
+        return swept
+
+    def build(self) -> int:
+        """Parcourt le dossier une fois; en cas de doublon, le fichier le plus récent est gardé
+
+        Les doublons plus anciens (même vidéo, autre conteneur) ne seraient
+        jamais servis ni comptés dans le quota: ils sont supprimés.
+        """
+        started = time.perf_counter()
+        records: Dict[str, Dict] = {}
+        losers: List[Dict] = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                record = file_record(Path(entry.path), entry.stat())
+                if record is None:
+                    continue
+                current = records.get(record['video_id'])
+                if current is not None:
+                    if current['mtime'] >= record['mtime']:
+                        losers.append(record)
+                        continue
+                    losers.append(current)
+                records[record['video_id']] = record
+
+        duplicates = 0
+        for record in losers:
+            try:
+                os.unlink(record['path'])
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"❌ Suppression impossible du doublon {record['filename']}: {e}")
+                continue
+            duplicates += 1
+            self._bytes_reclaimed += record['size']
+        if duplicates:
+            logger.info(f"🧹 {duplicates} doublons supprimés du cache audio")
+
+        with self._lock:
+            self._records = records
+            self._total_bytes = sum(record['size'] for record in records.values())
+            self._duplicates = duplicates
+            self._duplicate_failures = len(losers) - duplicates
+            self._build_ms = round((time.perf_counter() - started) * 1000, 1)
+        logger.info(f"🗂️ Index audio: {len(records)} fichiers en {self._build_ms} ms")
+        return len(records)
+
+    def get(self, video_id: str) -> Optional[Dict]:
+        with self._lock:
+            record = self._records.get(video_id)
+            return dict(record) if record else None
+
+    def mimetype(self, video_id: str) -> Optional[str]:
+        """Type MIME du fichier, détecté une fois puis gardé dans l'enregistrement"""
+        with self._lock:
+            record = self._records.get(video_id)
+            if record is None:
+                return None
+            if 'mimetype' in record:
+                return record['mimetype']
+            path, ext = record['path'], record['ext']
+        mimetype = sniff_audio_mimetype(path, ext)
+        with self._lock:
+            record = self._records.get(video_id)
+            if record is not None and record['path'] == path:
+                record['mimetype'] = mimetype
+        return mimetype
+
+    def touch(self, video_id: str) -> None:
+        """Note un accès (fichier servi), en mémoire seulement"""
+        with self._lock:
+            record = self._records.get(video_id)
+            if record is not None:
+                record['last_access'] = time.time()
+                record['hits'] += 1
+
+    def add(self, path: Path) -> Optional[Dict]:
+        """Indexe (ou réindexe) un fichier qui vient d'être écrit"""
+        record = file_record(Path(path))
+        if record is None:
+            return None
+        record['last_access'] = time.time()
+        with self._lock:
+            previous = self._records.get(record['video_id'])
+            if previous is not None:
+                self._total_bytes -= previous['size']
+            self._records[record['video_id']] = record
+            self._total_bytes += record['size']
+        return dict(record)
+
+    def discard(self, video_id: str) -> Optional[Dict]:
+        """Retire un video_id de l'index et retourne son enregistrement"""
+        with self._lock:
+            record = self._records.pop(video_id, None)
+            if record is not None:
+                self._total_bytes -= record['size']
+            return record
+
+    def clear(self) -> None:
+        with self._lock:
+            self._records.clear()
+            self._total_bytes = 0
+
+    def _bytes_to_free(self) -> Tuple[int, str]:
+        """(octets à libérer, raison): dépassement du quota ou de l'espace libre minimal"""
+        over_quota = self._total_bytes - self.max_bytes if self.max_bytes else 0
+        missing_free = 0
+        if self.min_free_bytes:
+            missing_free = self.min_free_bytes - shutil.disk_usage(self.directory).free
+        if missing_free > over_quota:
+            return missing_free, 'free_space'
+        return over_quota, 'quota'
+
+    def _eviction_order(self, keep: Optional[str]) -> List[Dict]:
+        """Candidats à l'éviction, du premier au dernier à supprimer"""
+        if self.policy == 'lfu':
+            key = lambda record: (record['hits'], record['last_access'])
+        else:
+            key = lambda record: record['last_access']
+        return sorted((record for record in self._records.values() if record['video_id'] != keep), key=key)
+
+    def enforce_quota(self, keep: Optional[str] = None) -> int:
+        """Supprime des fichiers jusqu'à respecter le quota et l'espace libre minimal
+
+        `keep` (le fichier qui vient d'être téléchargé) n'est jamais évincé.
+        Retourne le nombre de fichiers supprimés.
+        """
+        if not self.max_bytes and not self.min_free_bytes:
+            return 0
+        with self._lock:
+            needed, reason = self._bytes_to_free()
+            if needed <= 0:
+                return 0
+            victims = []
+            for record in self._eviction_order(keep):
+                if needed <= 0:
+                    break
+                victims.append(self._records.pop(record['video_id']))
+                self._total_bytes -= record['size']
+                needed -= record['size']
+
+        evicted = 0
+        reclaimed = 0
+        for record in victims:
+            try:
+                os.unlink(record['path'])
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"❌ Éviction impossible de {record['filename']}: {e}")
+                with self._lock:
+                    self._eviction_failures += 1
+                    # Toujours sur le disque: il reste indexé et compté dans le quota
+                    if record['video_id'] not in self._records:
+                        self._records[record['video_id']] = record
+                        self._total_bytes += record['size']
+                continue
+            evicted += 1
+            reclaimed += record['size']
+
+        with self._lock:
+            self._evictions[reason] += evicted
+            self._bytes_reclaimed += reclaimed
+        if evicted:
+            logger.info(f"🧹 Cache audio ({reason}): {evicted} fichiers évincés, {reclaimed / (1024 * 1024):.1f} MB libérés")
+        return evicted
+
+    def records(self) -> List[Dict]:
+        with self._lock:
+            return [dict(record) for record in self._records.values()]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._records)
+
+    def get_stats(self) -> Dict:
+        """Retourne les statistiques de l'index"""
+        with self._lock:
+            return {
+                'files': len(self._records),
+                'total_bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+                'min_free_bytes': self.min_free_bytes,
+                'eviction_policy': self.policy,
+                'evictions': dict(self._evictions),
+                'bytes_reclaimed': self._bytes_reclaimed,
+                'eviction_failures': self._eviction_failures,
+                'orphans_swept': self._orphans_swept,
+                'build_ms': self._build_ms,
+                'duplicates_removed_at_build': self._duplicates,
+                'duplicate_removal_failures': self._duplicate_failures
+            }
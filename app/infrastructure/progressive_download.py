@@ -0,0 +1,311 @@
+"""
+Téléchargements audio en cours, partagés entre requêtes concurrentes
+
+yt-dlp écrit le fichier au fil de l'eau dans le dossier temporaire (fichier
+.part, renommé à la fin), puis AudioService le renomme à sa place définitive.
+Le premier demandeur lance le téléchargement en arrière-plan et reçoit les
+octets dès qu'ils sont sur le disque, en lisant le fichier pendant son
+écriture; les demandeurs suivants du même video_id s'attachent au même
+téléchargement au lieu d'en lancer un autre.
+
+Le descripteur ouvert sur le .part reste valide après les renommages: un
+lecteur va jusqu'au bout du fichier sans le rouvrir.
+
+Les téléchargements tournent dans un pool borné (`max_workers` en parallèle,
+`max_queue` en attente); au-delà, start() lève DownloadsOverloaded. Un
+téléchargement dont le dernier lecteur se déconnecte (et que personne
+n'attend) est annulé au prochain progress_hook.
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+# Attente maximale entre deux notifications de yt-dlp avant de relire le fichier
+POLL_INTERVAL = 0.5
+
+
+class DownloadsOverloaded(Exception):
+    """Toutes les places du pool de téléchargement (workers + file d'attente) sont occupées"""
+
+
+class DownloadCancelled(Exception):
+    """Téléchargement abandonné: plus aucun lecteur ni appelant ne l'attend"""
+
+
+class DownloadIncomplete(IOError):
+    """Le fichier envoyé en flux n'a pas pu être lu jusqu'au bout (échec ou blocage)
+
+    Levée dans le générateur de la réponse: le serveur coupe la connexion au
+    lieu de terminer normalement une réponse tronquée.
+    """
+
+
+class InProgressDownload:
+    """Un téléchargement yt-dlp en cours: chemins, progression, résultat"""
+
+    def __init__(self, video_id: str):
+        self.video_id = video_id
+        self.started_at = time.time()
+        self.partial_path: Optional[str] = None
+        self.filename: Optional[str] = None
+        self.downloaded_bytes = 0
+        self.total_bytes: Optional[int] = None
+        self.first_bytes_at: Optional[float] = None
+        self.done = False
+        self.result: Optional[Dict] = None
+        self.error: Optional[str] = None
+        self.readers = 0
+        self.waiters = 0
+        self.cancelled = False
+        self._on_cancel: Optional[Callable[["InProgressDownload"], None]] = None
+        self._cond = threading.Condition()
+
+    @property
+    def ext(self) -> str:
+        """Extension du fichier final ('webm', 'm4a'...), connue dès le premier progress_hook"""
+        name = os.path.basename(self.filename or '')
+        return name.rpartition('.')[2].lower() if '.' in name else ''
+
+    def on_progress(self, progress: Dict) -> None:
+        """progress_hook yt-dlp: chemins et octets écrits; interrompt yt-dlp si annulé"""
+        if self.cancelled:
+            raise DownloadCancelled(f"Download cancelled for {self.video_id}")
+        with self._cond:
+            if progress.get('filename'):
+                self.filename = progress['filename']
+            if progress.get('status') == 'downloading':
+                self.partial_path = progress.get('tmpfilename') or self.partial_path
+                self.downloaded_bytes = progress.get('downloaded_bytes') or self.downloaded_bytes
+                self.total_bytes = progress.get('total_bytes') or progress.get('total_bytes_estimate') or self.total_bytes
+                if self.first_bytes_at is None:
+                    self.first_bytes_at = time.time()
+            self._cond.notify_all()
+
+    def finish(self, result: Optional[Dict], error: Optional[str] = None) -> None:
+        with self._cond:
+            self.result = result
+            self.error = error if result is None else None
+            self.done = True
+            self._cond.notify_all()
+
+    def wait_until_readable(self, timeout: Optional[float] = None) -> bool:
+        """Attend les premiers octets sur le disque (ou la fin); False si le délai expire"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.partial_path is not None or self.done, timeout)
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[Dict]:
+        """Attend la fin du téléchargement et retourne son résultat (None en cas d'échec)"""
+        with self._cond:
+            self.waiters += 1
+            try:
+                self._cond.wait_for(lambda: self.done, timeout)
+            finally:
+                self.waiters -= 1
+            return self.result
+
+    def cancel(self) -> None:
+        """Demande l'arrêt du téléchargement (pris en compte au prochain progress_hook)"""
+        with self._cond:
+            if self.done or self.cancelled:
+                return
+            self.cancelled = True
+            self._cond.notify_all()
+        logger.info(f"🛑 Téléchargement de {self.video_id} annulé: plus aucun lecteur")
+        if self._on_cancel:
+            self._on_cancel(self)
+
+    def _open(self):
+        """Fichier en cours d'écriture, ou fichier final s'il a déjà été renommé"""
+        while True:
+            with self._cond:
+                paths = [self.partial_path, self.filename]
+                if self.result:
+                    paths.insert(0, self.result['file_path'])
+                done = self.done
+            for path in paths:
+                if path:
+                    try:
+                        return open(path, 'rb')
+                    except FileNotFoundError:
+                        continue
+            if done:
+                return None
+            # Entre deux renommages (.part -> fichier temporaire -> fichier final)
+            with self._cond:
+                self._cond.wait(POLL_INTERVAL)
+
+    def iter_bytes(self, chunk_size: int = CHUNK_SIZE, idle_timeout: float = 60) -> Iterator[bytes]:
+        """Octets du fichier à mesure que yt-dlp les écrit, jusqu'à la fin du téléchargement
+
+        Lève DownloadIncomplete si le téléchargement échoue ou si rien n'est
+        écrit pendant idle_timeout secondes. Si le client part avant la fin et
+        qu'il était le dernier lecteur, le téléchargement est annulé.
+        """
+        with self._cond:
+            self.readers += 1
+        complete = False
+        try:
+            f = self._open()
+            if f is None:
+                raise DownloadIncomplete(f"Download failed for {self.video_id}: {self.error}")
+            with f:
+                last_growth = time.monotonic()
+                while True:
+                    chunk = f.read(chunk_size)
+                    if chunk:
+                        last_growth = time.monotonic()
+                        yield chunk
+                        continue
+                    with self._cond:
+                        if not self.done:
+                            self._cond.wait(POLL_INTERVAL)
+                        finished = self.done
+                    if finished:
+                        # Vider ce qui a été écrit avant la notification de fin
+                        for chunk in iter(lambda: f.read(chunk_size), b''):
+                            yield chunk
+                        if self.result is None:
+                            logger.warning(f"❌ Téléchargement interrompu pour {self.video_id}: {self.error}")
+                            raise DownloadIncomplete(f"Download failed for {self.video_id}: {self.error}")
+                        complete = True
+                        return
+                    if time.monotonic() - last_growth > idle_timeout:
+                        logger.warning(f"⏱️ Téléchargement de {self.video_id} bloqué depuis {idle_timeout}s, réponse interrompue")
+                        raise DownloadIncomplete(f"Download of {self.video_id} stalled for {idle_timeout}s")
+        finally:
+            with self._cond:
+                self.readers -= 1
+                abandoned = not complete and self.readers == 0 and self.waiters == 0 and not self.done
+            if abandoned:
+                self.cancel()
+
+    def get_progress(self) -> Dict:
+        with self._cond:
+            return {
+                'video_id': self.video_id,
+                'downloaded_bytes': self.downloaded_bytes,
+                'total_bytes': self.total_bytes,
+                'readers': self.readers,
+                'waiters': self.waiters,
+                'elapsed_s': round(time.time() - self.started_at, 1)
+            }
+
+
+class ProgressiveDownloads:
+    """video_id -> téléchargement en cours; un seul téléchargement par video_id
+
+    - `max_workers` téléchargements tournent en parallèle
+    - `max_queue` téléchargements supplémentaires peuvent attendre un worker
+    - au-delà, start() lève immédiatement DownloadsOverloaded
+    """
+
+    def __init__(self, max_workers: int = 4, max_queue: int = 8):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="audio-download")
+        self._active: Dict[str, InProgressDownload] = {}
+        self._lock = threading.Lock()
+        self._started = 0
+        self._attached = 0
+        self._completed = 0
+        self._failed = 0
+        self._cancelled = 0
+        self._rejected = 0
+        self._first_bytes_ms_total = 0.0
+        self._first_bytes_count = 0
+
+    def start(self, video_id: str,
+              run: Callable[[InProgressDownload], Optional[Dict]]) -> Tuple[InProgressDownload, bool]:
+        """(téléchargement, lancé_ici): s'attache au téléchargement en cours ou
+        planifie run(download) dans le pool"""
+        with self._lock:
+            download = self._active.get(video_id)
+            if download is not None:
+                self._attached += 1
+                return download, False
+            if len(self._active) >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                raise DownloadsOverloaded("Download pool saturated")
+            download = InProgressDownload(video_id)
+            download._on_cancel = self._forget
+            self._active[video_id] = download
+            self._started += 1
+
+        self._executor.submit(self._run, download, run)
+        return download, True
+
+    def _forget(self, download: InProgressDownload) -> None:
+        """Un téléchargement annulé n'accepte plus de nouveaux lecteurs"""
+        with self._lock:
+            if self._active.get(download.video_id) is download:
+                del self._active[download.video_id]
+
+    def active_paths(self) -> Set[str]:
+        """Fichiers en cours d'écriture (partiels et noms finaux annoncés par yt-dlp)"""
+        with self._lock:
+            active = list(self._active.values())
+        paths = set()
+        for download in active:
+            with download._cond:
+                paths.update(path for path in (download.partial_path, download.filename) if path)
+        return paths
+
+    def get(self, video_id: str) -> Optional[InProgressDownload]:
+        with self._lock:
+            return self._active.get(video_id)
+
+    def _run(self, download: InProgressDownload, run: Callable) -> None:
+        result, error = None, None
+        try:
+            # Annulé pendant qu'il attendait un worker: rien à lancer
+            if download.cancelled:
+                raise DownloadCancelled(f"Download cancelled for {download.video_id}")
+            result = run(download)
+            if result is None:
+                error = 'Download cancelled' if download.cancelled else 'Download failed'
+        except DownloadCancelled as e:
+            error = str(e)
+        except Exception as e:
+            error = str(e)
+            logger.error(f"Erreur de téléchargement pour {download.video_id}: {e}")
+        finally:
+            with self._lock:
+                if self._active.get(download.video_id) is download:
+                    del self._active[download.video_id]
+                if result is not None:
+                    self._completed += 1
+                elif download.cancelled:
+                    self._cancelled += 1
+                else:
+                    self._failed += 1
+                if download.first_bytes_at is not None:
+                    self._first_bytes_ms_total += (download.first_bytes_at - download.started_at) * 1000
+                    self._first_bytes_count += 1
+            download.finish(result, error)
+
+    def get_stats(self) -> Dict:
+        """Retourne les statistiques des téléchargements"""
+        with self._lock:
+            active = list(self._active.values())
+            stats = {
+                'max_workers': self.max_workers,
+                'max_queue': self.max_queue,
+                'started': self._started,
+                'attached': self._attached,
+                'completed': self._completed,
+                'failed': self._failed,
+                'cancelled': self._cancelled,
+                'rejected': self._rejected,
+                'avg_time_to_first_bytes_ms': (
+                    round(self._first_bytes_ms_total / self._first_bytes_count, 1)
+                    if self._first_bytes_count else None
+                )
+            }
+        stats['in_progress'] = [download.get_progress() for download in active]
+        return stats
@@ -0,0 +1,81 @@
+"""
+Clients YouTube Music par région, construits une fois et partagés
+"""
+import functools
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+import requests
+from requests.adapters import HTTPAdapter
+from ytmusicapi import YTMusic
+
+logger = logging.getLogger(__name__)
+
+
+def create_http_session(pool_size: int, timeout: float = 30) -> requests.Session:
+    """Session HTTP partagée, avec un pool de connexions keep-alive vers YouTube Music
+
+    ytmusicapi n'ajoute son timeout par défaut qu'aux sessions qu'il crée
+    lui-même: sans ce timeout, un appel bloqué côté YouTube Music bloquerait
+    son thread indéfiniment.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.request = functools.partial(session.request, timeout=timeout)
+    return session
+
+
+class YTMusicClientPool:
+    """Un client YTMusic par région de Config.BYPASS_REGIONS, créé au démarrage
+
+    Tous les clients partagent la même session HTTP: les connexions TLS sont
+    réutilisées d'une recherche et d'une région à l'autre, et chaque client
+    garde ses en-têtes (dont le visitor id obtenu à la première requête). Les
+    clients ne sont que lus pendant une requête et peuvent donc servir
+    plusieurs threads à la fois.
+    """
+
+    def __init__(self, regions: List[Optional[Dict]], pool_size: int = 10, timeout: float = 30):
+        self.session = create_http_session(pool_size, timeout)
+        self._clients: List[Tuple[Optional[Dict], YTMusic]] = []
+        self._lock = threading.Lock()
+        self._borrowed = 0
+
+        for region in regions:
+            try:
+                if region:
+                    client = YTMusic(
+                        language=region['language'],
+                        location=region['location'],
+                        requests_session=self.session
+                    )
+                else:
+                    client = YTMusic(requests_session=self.session)
+                self._clients.append((region, client))
+                logger.info(f"Client YTMusic prêt pour la région: {region}")
+            except Exception as e:
+                logger.warning(f"Échec initialisation YTMusic avec région {region}: {e}")
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+    def clients(self) -> List[Tuple[Optional[Dict], YTMusic]]:
+        """Emprunter les clients (région, client), dans l'ordre de préférence"""
+        with self._lock:
+            self._borrowed += 1
+        return list(self._clients)
+
+    def default_client(self) -> Optional[YTMusic]:
+        """Client de la première région disponible"""
+        return self._clients[0][1] if self._clients else None
+
+    def get_stats(self) -> Dict:
+        """Statistiques du pool de clients"""
+        with self._lock:
+            return {
+                'regions': [region for region, _ in self._clients],
+                'clients': len(self._clients),
+                'borrowed': self._borrowed
+            }
@@ -0,0 +1,205 @@
+"""
+Envoi des fichiers audio locaux: plages d'octets, validateurs, type MIME
+
+- une seule plage (cas des lecteurs qui cherchent dans le fichier) et les
+  requêtes conditionnelles (If-None-Match, If-Modified-Since, If-Range)
+  passent par send_file de Werkzeug
+- Werkzeug répond 416 à un Range de plusieurs plages (ou de plages qui se
+  chevauchent): celles-ci sont fusionnées, puis servies ici en
+  multipart/byteranges
+- un Range qu'aucune plage ne satisfait reçoit ici un 416; un suffixe nul
+  (`-0`) ne désigne aucun octet, il n'est jamais lu comme "tout le fichier"
+- le fichier entier part par le wsgi.file_wrapper du serveur (sendfile sous
+  gunicorn); en mode x-accel, nginx sert le fichier lui-même (plages et
+  sendfile compris) via X-Accel-Redirect
+- un fichier en cours de téléchargement part en flux (sans Content-Length ni
+  plages), lu sur le disque à mesure que yt-dlp l'écrit
+"""
+import secrets
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote
+from flask import Response, request, send_file
+from werkzeug.http import http_date, is_resource_modified
+from ..config import Config
+from ..infrastructure.audio_file_index import AUDIO_MIMETYPES
+from ..infrastructure.progressive_download import InProgressDownload
+
+# Au-delà, les plages demandées sont regroupées en une seule
+MAX_RANGES = 16
+CHUNK_SIZE = 64 * 1024
+
+
+def file_etag(size: int, mtime: float) -> str:
+    """Validateur fort (sans guillemets) d'un fichier: sa date de modification et sa taille"""
+    return f"{int(mtime * 1000):x}-{size:x}"
+
+
+def parse_byte_ranges(header: Optional[str]) -> Optional[List[Tuple[int, Optional[int]]]]:
+    """'bytes=0-99,200-,-50' -> [(0, 100), (200, None), (-50, None)]; None si absent ou invalide
+
+    Un suffixe nul ('-0') ne désigne aucun octet: il devient la plage vide
+    (0, 0), jamais satisfiable.
+    """
+    if not header or not header.startswith('bytes='):
+        return None
+    ranges = []
+    for spec in header[len('bytes='):].split(','):
+        first, dash, last = spec.strip().partition('-')
+        if not dash or not (first or last) or (first and not first.isdigit()) or (last and not last.isdigit()):
+            return None
+        if not first:
+            ranges.append((-int(last), None) if int(last) else (0, 0))
+        elif not last:
+            ranges.append((int(first), None))
+        elif int(last) >= int(first):
+            ranges.append((int(first), int(last) + 1))
+        else:
+            return None
+    return ranges
+
+
+def send_audio_file(file_info: Dict) -> Response:
+    """Réponse pour un fichier décrit par AudioService (file_path, filename, mimetype, size_bytes, mtime)"""
+    if Config.AUDIO_SENDFILE_MODE == 'x-accel':
+        return _accel_redirect(file_info)
+
+    etag = file_etag(file_info['size_bytes'], file_info['mtime'])
+    byte_ranges = parse_byte_ranges(request.headers.get('Range'))
+    if (byte_ranges is not None
+            and (len(byte_ranges) > 1 or not satisfiable_spans(byte_ranges, file_info['size_bytes']))
+            and _if_range_matches(etag, file_info['mtime'])):
+        return _multi_range_response(file_info, etag, byte_ranges)
+
+    return send_file(
+        file_info['file_path'],
+        mimetype=file_info['mimetype'],
+        as_attachment=False,
+        download_name=file_info['filename'],
+        conditional=True,
+        etag=etag,
+        last_modified=file_info['mtime'],
+        max_age=Config.AUDIO_FILE_MAX_AGE
+    )
+
+
+def send_progressive_download(download: InProgressDownload) -> Response:
+    """Réponse en flux d'un fichier encore en cours d'écriture (taille finale inconnue)"""
+    headers = {
+        'Cache-Control': 'no-store',
+        'Accept-Ranges': 'none',
+        'X-Download-Status': 'in-progress'
+    }
+    return Response(
+        download.iter_bytes(CHUNK_SIZE, Config.AUDIO_PROGRESSIVE_IDLE_TIMEOUT),
+        status=200,
+        mimetype=AUDIO_MIMETYPES.get(download.ext, 'application/octet-stream'),
+        headers=headers,
+        direct_passthrough=True
+    )
+
+
+def _accel_redirect(file_info: Dict) -> Response:
+    """nginx sert le fichier (location interne pointant sur AUDIO_DIR)"""
+    response = Response(status=200, mimetype=file_info['mimetype'])
+    response.headers['X-Accel-Redirect'] = Config.AUDIO_ACCEL_REDIRECT_PREFIX + quote(file_info['filename'])
+    response.headers['Cache-Control'] = f"public, max-age={Config.AUDIO_FILE_MAX_AGE}"
+    return response
+
+
+def _if_range_matches(etag: str, mtime: float) -> bool:
+    """If-Range absent ou toujours valide: les plages peuvent être servies"""
+    if_range = request.if_range
+    if if_range.etag:
+        return if_range.etag == etag
+    if if_range.date:
+        return int(mtime) <= if_range.date.timestamp()
+    return True
+
+
+def _validator_headers(file_info: Dict, etag: str) -> Dict[str, str]:
+    return {
+        'ETag': f'"{etag}"',
+        'Last-Modified': http_date(file_info['mtime']),
+        'Accept-Ranges': 'bytes',
+        'Cache-Control': f"public, max-age={Config.AUDIO_FILE_MAX_AGE}"
+    }
+
+
+def satisfiable_spans(ranges: List, size: int) -> List[List[int]]:
+    """Plages [début, fin[ bornées à la taille du fichier, triées et fusionnées"""
+    spans = []
+    for start, stop in ranges:
+        if start < 0:
+            start, stop = max(0, size + start), size
+        else:
+            stop = size if stop is None else min(stop, size)
+        if start < stop:
+            spans.append([start, stop])
+    spans.sort()
+    merged = []
+    for span in spans:
+        if merged and span[0] <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], span[1])
+        else:
+            merged.append(span)
+    if len(merged) > MAX_RANGES:
+        merged = [[merged[0][0], merged[-1][1]]]
+    return merged
+
+
+def _multi_range_response(file_info: Dict, etag: str, ranges: List) -> Response:
+    size = file_info['size_bytes']
+    headers = _validator_headers(file_info, etag)
+    last_modified = datetime.fromtimestamp(file_info['mtime'], timezone.utc)
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        return Response(status=304, headers=headers)
+
+    spans = satisfiable_spans(ranges, size)
+    if not spans:
+        return Response(status=416, headers={'Content-Range': f"bytes */{size}"})
+
+    path = file_info['file_path']
+    if len(spans) == 1:
+        start, stop = spans[0]
+        headers['Content-Range'] = f"bytes {start}-{stop - 1}/{size}"
+        headers['Content-Length'] = str(stop - start)
+        return Response(_read_spans(path, [(b'', start, stop)], b''), status=206,
+                        mimetype=file_info['mimetype'], headers=headers, direct_passthrough=True)
+
+    boundary = secrets.token_hex(16)
+    parts = [
+        (
+            (f"--{boundary}\r\nContent-Type: {file_info['mimetype']}\r\n"
+             f"Content-Range: bytes {start}-{stop - 1}/{size}\r\n\r\n").encode('latin-1'),
+            start,
+            stop
+        )
+        for start, stop in spans
+    ]
+    trailer = f"--{boundary}--\r\n".encode('latin-1')
+    headers['Content-Length'] = str(sum(len(head) + (stop - start) + 2 for head, start, stop in parts) + len(trailer))
+    return Response(_read_spans(path, parts, trailer, separator=b'\r\n'), status=206,
+                    content_type=f"multipart/byteranges; boundary={boundary}", headers=headers,
+                    direct_passthrough=True)
+
+
+def _read_spans(path: str, parts: List, trailer: bytes, separator: bytes = b'') -> Iterator[bytes]:
+    """Octets des plages (précédées de leur en-tête de partie), lus par blocs"""
+    with open(path, 'rb') as f:
+        for head, start, stop in parts:
+            if head:
+                yield head
+            f.seek(start)
+            remaining = stop - start
+            while remaining > 0:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    return
+                remaining -= len(chunk)
+                yield chunk
+            if separator:
+                yield separator
+        if trailer:
+            yield trailer
+
@@ -2,8 +2,11 @@
 Routes pour la gestion de l'audio
 """
 import logging
-from flask import Blueprint, jsonify, send_file
-from ..services.audio_service import AudioService
+from flask import Blueprint, Response, request, jsonify
+from ..config import Config
+from ..services.audio_service import AudioService, StreamUnavailable
+from ..infrastructure.progressive_download import DownloadsOverloaded
+from .audio_file_responses import send_audio_file, send_progressive_download
 
 logger = logging.getLogger(__name__)
 
@@ -21,13 +24,25 @@ def get_streaming_url(video_id):
         if not video_id:
             return jsonify({'error': 'Video ID is required'}), 400
         
-        result = audio_service.get_streaming_url(video_id)
+        # Hit de cache: octets déjà sérialisés, sans passer par jsonify
+        body = audio_service.get_cached_stream_body(video_id)
+        if body:
+            return Response(body, status=200, mimetype='application/json')
+        
+        # ?retry=true ignore un échec récent mémorisé dans le cache négatif
+        retry = request.args.get('retry', 'false').lower() == 'true'
+        result = audio_service.get_streaming_url(video_id, bypass_negative_cache=retry)
         
         if result:
             return jsonify(result), 200
         else:
             return jsonify({'error': 'Streaming URL not available'}), 404
             
+    except StreamUnavailable as e:
+        return jsonify({
+            'error': 'Streaming URL not available',
+            'error_class': e.error_class
+        }), 404
     except Exception as e:
         logger.error(f"Erreur lors de l'extraction de l'URL pour {video_id}: {e}")
         return jsonify({'error': 'Internal server error'}), 500
@@ -40,35 +55,28 @@ def download_audio(video_id):
         if not video_id:
             return jsonify({'error': 'Video ID is required'}), 400
         
-        # Vérifier si le fichier existe déjà
-        existing_file = audio_service.get_local_file(video_id)
+        # Vérifier si le fichier existe déjà (accès compté pour l'éviction du cache disque)
+        existing_file = audio_service.serve_local_file(video_id)
         if existing_file:
-            file_path = existing_file['file_path']
-            filename = existing_file['filename']
-            
-            return send_file(
-                file_path,
-                as_attachment=False,
-                download_name=filename,
-                mimetype='audio/mpeg'
-            )
+            # Plages d'octets, ETag/Last-Modified et type MIME du conteneur
+            return send_audio_file(existing_file)
         
-        # Télécharger le fichier
-        result = audio_service.download_audio(video_id)
+        # Télécharger le fichier (ou rejoindre le téléchargement déjà en cours)
+        progressive = request.args.get('progressive', str(Config.AUDIO_PROGRESSIVE_DOWNLOAD)).lower() == 'true'
+        download = audio_service.start_download(video_id)
+        if (progressive and download.wait_until_readable(Config.AUDIO_PROGRESSIVE_START_TIMEOUT)
+                and not download.done):
+            # Octets envoyés pendant l'écriture du fichier sur le disque
+            return send_progressive_download(download)
+        result = download.wait()
         
         if result:
-            file_path = result['file_path']
-            filename = result['filename']
-            
-            return send_file(
-                file_path,
-                as_attachment=False,
-                download_name=filename,
-                mimetype='audio/mpeg'
-            )
+            return send_audio_file(result)
         else:
             return jsonify({'error': 'Download failed'}), 404
             
+    except DownloadsOverloaded:
+        return jsonify({'error': 'Download service busy, retry later'}), 503
     except Exception as e:
         logger.error(f"Erreur lors du téléchargement pour {video_id}: {e}")
         return jsonify({'error': 'Internal server error'}), 500
@@ -143,4 +151,15 @@ def get_file_info(video_id):
             
     except Exception as e:
         logger.error(f"Erreur lors de la récupération des infos du fichier {video_id}: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+
+@audio_bp.route('/stats', methods=['GET'])
+def get_stats():
+    """Obtenir les statistiques du service audio"""
+    try:
+        return jsonify(audio_service.get_stats()), 200
+        
+    except Exception as e:
+        logger.error(f"Erreur lors de la récupération des statistiques: {e}")
         return jsonify({'error': 'Internal server error'}), 500
\ No newline at end of file
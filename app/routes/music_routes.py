@@ -2,8 +2,15 @@
 Routes pour la gestion de la musique
 """
 import logging
-from flask import Blueprint, request, jsonify
-from ..services.music_service import MusicService
+from flask import Blueprint, Response, request, jsonify
+from ..services.music_service import MusicService, SEARCH_MODES
+from .audio_routes import audio_service
+from prefetch import playlist_video_ids
+from charts_scheduler import normalize_country, snapshot_headers
+from http_caching import make_etag, serialize_json
+from compression import conditional_compressed_json
+from metadata_cache import entry_view
+from projection import is_projected, parse_fields, parse_profile, project_items, project_playlist
 
 logger = logging.getLogger(__name__)
 
@@ -14,6 +21,19 @@ music_bp = Blueprint('music', __name__, url_prefix='/api/music')
 music_service = MusicService()
 
 
+def conditional_response(body: bytes, etag: str, max_age: int, headers=None) -> Response:
+    """Réponse JSON avec ETag et Cache-Control, ou 304 si If-None-Match correspond"""
+    status, body, headers = conditional_compressed_json(request.headers.get('If-None-Match'),
+                                                        request.headers.get('Accept-Encoding'),
+                                                        body, etag, max_age, headers)
+    return Response(body, status=status, mimetype='application/json', headers=headers)
+
+
+def projection_args():
+    """(profil, champs) depuis ?profile=full|compact&fields=a,b.c; lève ValueError si invalide"""
+    return parse_profile(request.args.get('profile')), parse_fields(request.args.get('fields'))
+
+
 @music_bp.route('/search', methods=['POST'])
 def search_music():
     """Rechercher de la musique"""
@@ -25,12 +45,26 @@ def search_music():
         
         query = data['query']
         limit = data.get('limit', 20)
+        # sequential, race ou merge (Config.SEARCH_MODE par défaut)
+        mode = data.get('mode')
         
         if not query.strip():
             return jsonify({'error': 'Query cannot be empty'}), 400
         
-        result = music_service.search_songs(query, limit)
-        return jsonify(result), 200
+        if mode and mode not in SEARCH_MODES:
+            return jsonify({'error': f"Mode must be one of: {', '.join(SEARCH_MODES)}"}), 400
+        
+        try:
+            profile, fields = projection_args()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        result = music_service.search_songs(query, limit, mode)
+        if is_projected(profile, fields):
+            result = {**result, 'results': project_items(result['results'], profile, fields)}
+        # ETag faible sur les seuls résultats: les diagnostics par région (durées) varient d'un appel à l'autre
+        etag = make_etag(serialize_json(result['results']), weak=True)
+        return conditional_response(serialize_json(result), etag, music_service.search_max_age(result))
         
     except Exception as e:
         logger.error(f"Erreur lors de la recherche: {e}")
@@ -44,10 +78,10 @@ def get_song_info(video_id):
         if not video_id:
             return jsonify({'error': 'Video ID is required'}), 400
         
-        song_info = music_service.get_song_info(video_id)
+        entry = music_service.get_song_entry(video_id)
         
-        if song_info:
-            return jsonify(song_info), 200
+        if entry['body']:
+            return conditional_response(entry['body'], entry['etag'], music_service.max_age('song', entry))
         else:
             return jsonify({'error': 'Song not found'}), 404
             
@@ -63,10 +97,25 @@ def get_playlist(playlist_id):
         if not playlist_id:
             return jsonify({'error': 'Playlist ID is required'}), 400
         
-        playlist = music_service.get_playlist(playlist_id)
+        try:
+            profile, fields = projection_args()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        if playlist:
-            return jsonify(playlist), 200
+        entry = music_service.get_playlist_entry(playlist_id)
+        
+        if entry['body']:
+            # ?prefetch=true&prefetch_count=N: préparer les URLs des premiers titres
+            if request.args.get('prefetch', 'false').lower() == 'true':
+                audio_service.prefetch_streams(
+                    playlist_video_ids(entry['value']),
+                    request.args.get('prefetch_count', type=int)
+                )
+            if is_projected(profile, fields):
+                entry = entry_view(entry, (profile, fields),
+                                   lambda playlist: project_playlist(playlist, profile, fields),
+                                   memoize=not fields)
+            return conditional_response(entry['body'], entry['etag'], music_service.max_age('playlist', entry))
         else:
             return jsonify({'error': 'Playlist not found'}), 404
             
@@ -77,15 +126,37 @@ def get_playlist(playlist_id):
 
 @music_bp.route('/charts', methods=['GET'])
 def get_charts():
-    """Obtenir les charts"""
+    """Obtenir les charts (?country=US, ZZ = monde par défaut)"""
     try:
-        charts = music_service.get_charts()
+        country = normalize_country(request.args.get('country'))
+        if country is None:
+            return jsonify({'error': 'Invalid country code'}), 400
+        
+        # Réponse déjà sérialisée, rafraîchie en arrière-plan (en-tête Age = âge des données)
+        snapshot = music_service.get_charts_snapshot(country)
+        if snapshot:
+            return conditional_response(snapshot['body'], snapshot['etag'],
+                                        music_service.charts.max_age(snapshot), snapshot_headers(snapshot))
         
-        if charts:
-            return jsonify(charts), 200
+        # Pays non planifié ou premier chargement pas encore terminé
+        entry = music_service.get_charts_entry(country)
+        
+        if entry['body']:
+            return conditional_response(entry['body'], entry['etag'], music_service.max_age('charts', entry))
         else:
             return jsonify({'error': 'Charts not available'}), 404
             
     except Exception as e:
         logger.error(f"Erreur lors de la récupération des charts: {e}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+
+@music_bp.route('/stats', methods=['GET'])
+def get_stats():
+    """Obtenir les statistiques du service de musique"""
+    try:
+        return jsonify(music_service.get_stats()), 200
+        
+    except Exception as e:
+        logger.error(f"Erreur lors de la récupération des statistiques: {e}")
         return jsonify({'error': 'Internal server error'}), 500
\ No newline at end of file
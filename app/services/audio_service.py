@@ -2,24 +2,144 @@
 Service pour la gestion de l'audio (téléchargement et streaming)
 """
 import os
+import atexit
+import secrets
 import logging
+import threading
 from typing import Dict, Optional, List
 from pathlib import Path
 import yt_dlp
+from cache_manager import AudioCacheManager, CacheSnapshotter, entry_metadata, expiry_info
+from negative_cache import negative_cache, classify_errors
+from prefetch import stream_prefetcher
+from refresh_ahead import stream_refresher
+from single_flight import SingleFlight
 from ..config import Config
+from ..infrastructure.audio_file_index import AudioFileIndex
+from ..infrastructure.progressive_download import InProgressDownload, ProgressiveDownloads
 
 logger = logging.getLogger(__name__)
 
 
+class StreamUnavailable(Exception):
+    """Aucune URL de streaming n'a pu être extraite pour cette vidéo"""
+    
+    def __init__(self, video_id: str, error_class: str):
+        super().__init__(f"Stream unavailable for {video_id} ({error_class})")
+        self.video_id = video_id
+        self.error_class = error_class
+
+
 class AudioService:
     """Service pour gérer l'audio avec yt-dlp"""
     
     def __init__(self):
         self.audio_dir = Config.AUDIO_DIR
         self.audio_dir.mkdir(exist_ok=True)
+        # Fichiers téléchargés indexés par video_id: dossier parcouru une seule fois,
+        # borné par un quota en octets et un espace libre minimal
+        self.files = AudioFileIndex(
+            self.audio_dir,
+            max_bytes=Config.AUDIO_CACHE_MAX_BYTES,
+            min_free_bytes=Config.AUDIO_CACHE_MIN_FREE_BYTES,
+            policy=Config.AUDIO_CACHE_EVICTION
+        )
+        self.files.temp_dir.mkdir(exist_ok=True)
+        self.files.sweep_orphans(min_age=Config.AUDIO_ORPHAN_MIN_AGE)
+        self.files.build()
+        self.files.enforce_quota()
+        # Téléchargements en cours: un seul par video_id, lisible pendant l'écriture
+        self.downloads = ProgressiveDownloads(
+            max_workers=Config.AUDIO_DOWNLOAD_WORKERS,
+            max_queue=Config.AUDIO_DOWNLOAD_QUEUE
+        )
+        # Fichiers des téléchargements morts en cours de route, supprimés sans attendre un redémarrage
+        self._sweep_stop = threading.Event()
+        if Config.AUDIO_ORPHAN_SWEEP_INTERVAL > 0:
+            threading.Thread(target=self._sweep_orphans_periodically, name="audio-orphan-sweep", daemon=True).start()
+            atexit.register(self._sweep_stop.set)
+        # Extractions d'URL en cours, partagées entre requêtes concurrentes
+        self._url_flight = SingleFlight()
+        # Cache des URLs de streaming, valable jusqu'à l'expiration de l'URL signée
+        # et ré-extrait en arrière-plan pour les vidéos populaires
+        self._url_cache = AudioCacheManager(
+            cache_duration=Config.STREAM_CACHE_TTL,
+            safety_margin=Config.STREAM_URL_SAFETY_MARGIN,
+            refresher=stream_refresher,
+            loader=self._extract_streaming_url,
+            namespace='api_stream',
+            prefetcher=stream_prefetcher
+        )
+        # Restauré au démarrage, sauvegardé périodiquement et à l'arrêt
+        self._url_snapshotter = CacheSnapshotter(self._url_cache, 'api_stream')
+        self._url_snapshotter.start()
+        atexit.register(self._url_snapshotter.stop)
+    
+    def get_streaming_url(self, video_id: str, bypass_negative_cache: bool = False) -> Optional[Dict]:
+        """Obtenir l'URL de streaming pour une vidéo
+        
+        Lève StreamUnavailable si l'extraction échoue ou a échoué récemment
+        (sauf si bypass_negative_cache est vrai).
+        """
+        cache_entry = self._url_cache.get_entry(video_id)
+        if cache_entry:
+            return self._format_stream_entry(cache_entry, cached=True)
+        
+        # Échec récent mémorisé: ne pas relancer les 8 configurations
+        failure = negative_cache.check(video_id, bypass_negative_cache)
+        if failure:
+            raise StreamUnavailable(video_id, failure['error_class'])
+        
+        # Les requêtes concurrentes pour la même vidéo attendent la même extraction
+        return self._url_flight.do(video_id, self._extract_and_cache, video_id)
+    
+    def _extract_and_cache(self, video_id: str) -> Optional[Dict]:
+        """Extraire l'URL et la mettre en cache (ou mémoriser l'échec)"""
+        errors = []
+        result = self._extract_streaming_url(video_id, errors)
+        if not result:
+            error_class = classify_errors(errors)
+            negative_cache.record(video_id, error_class, errors[-1] if errors else '')
+            raise StreamUnavailable(video_id, error_class)
+        
+        # Extraction réussie: l'échec mémorisé éventuel (autre worker, refresh) est oublié
+        negative_cache.delete(video_id)
+        metadata = {key: value for key, value in result.items() if key != 'audio_url'}
+        cache_entry = self._url_cache.set(video_id, result['audio_url'], **metadata)
+        return self._format_stream_entry(cache_entry, cached=False)
+    
+    def prefetch_streams(self, video_ids: List[str], count: Optional[int] = None) -> int:
+        """Précharger en arrière-plan les URLs des premiers titres (ex: d'une playlist)"""
+        return self._url_cache.prefetch(video_ids, count, load=self._prefetch_stream)
+    
+    def _prefetch_stream(self, video_id: str) -> bool:
+        """Extraction de préchargement, partagée avec les requêtes /stream concurrentes"""
+        if negative_cache.get(video_id):
+            return False
+        try:
+            self._url_flight.do(video_id, self._extract_and_cache, video_id)
+            return True
+        except StreamUnavailable:
+            return False
     
-    def get_streaming_url(self, video_id: str) -> Optional[Dict]:
-        """Obtenir l'URL de streaming pour une vidéo"""
+    def get_cached_stream_body(self, video_id: str) -> Optional[bytes]:
+        """Réponse JSON d'une URL en cache, sérialisée une fois par entrée, ou None"""
+        return self._url_cache.get_response_body(video_id, self._cached_stream_fields)
+    
+    def _cached_stream_fields(self, cache_entry: Dict) -> Dict:
+        return {'audio_url': cache_entry['url'], **entry_metadata(cache_entry), 'cached': True}
+    
+    def _format_stream_entry(self, cache_entry: Dict, cached: bool) -> Dict:
+        """Construire la réponse à partir d'une entrée du cache"""
+        return {
+            'audio_url': cache_entry['url'],
+            **entry_metadata(cache_entry),
+            'cached': cached,
+            **expiry_info(cache_entry)
+        }
+    
+    def _extract_streaming_url(self, video_id: str, errors: Optional[List[str]] = None) -> Optional[Dict]:
+        """Parcourir les configurations de contournement jusqu'à obtenir une URL"""
         youtube_url = f"https://www.youtube.com/watch?v={video_id}"
         
         # Configurations de contournement géographique
@@ -53,94 +173,167 @@ class AudioService:
                         
             except Exception as e:
                 logger.warning(f"❌ Échec extraction avec {country}: {str(e)[:100]}")
+                if errors is not None:
+                    errors.append(str(e))
                 continue
         
         logger.error(f"Impossible d'extraire l'URL pour {video_id}")
         return None
     
     def download_audio(self, video_id: str) -> Optional[Dict]:
-        """Télécharger un fichier audio"""
+        """Télécharger un fichier audio (attend la fin du téléchargement)"""
         # Vérifier si le fichier existe déjà
         existing_file = self.get_local_file(video_id)
         if existing_file:
             logger.info(f"Fichier existant trouvé: {existing_file['filename']}")
             return existing_file
         
+        # Un téléchargement déjà en cours pour ce video_id est attendu, pas relancé
+        return self.start_download(video_id).wait()
+    
+    def start_download(self, video_id: str) -> InProgressDownload:
+        """Lancer le téléchargement en arrière-plan, ou s'attacher à celui en cours
+        
+        Lève DownloadsOverloaded si le pool de téléchargement est saturé.
+        """
+        download, started = self.downloads.start(video_id, self._download)
+        if not started:
+            logger.info(f"🔗 Téléchargement de {video_id} déjà en cours, requête rattachée")
+        return download
+    
+    def _download(self, download: InProgressDownload) -> Optional[Dict]:
+        """Téléchargement yt-dlp (pool de ProgressiveDownloads)
+        
+        Le fichier est écrit sous un nom unique dans le dossier temporaire, puis
+        renommé à sa place: le dossier audio ne contient que des fichiers complets.
+        """
+        video_id = download.video_id
+        # Terminé juste avant que ce téléchargement ne soit lancé
+        existing_file = self.get_local_file(video_id)
+        if existing_file:
+            return existing_file
+        
         youtube_url = f"https://www.youtube.com/watch?v={video_id}"
-        output_path = self.audio_dir / f"{video_id}.%(ext)s"
+        temp_prefix = f"{video_id}.{os.getpid()}-{secrets.token_hex(4)}"
+        output_path = self.files.temp_dir / f"{temp_prefix}.%(ext)s"
         
         # Configurations de téléchargement
         download_configs = self._get_download_configs(str(output_path))
         
-        for i, config in enumerate(download_configs):
-            try:
-                country = config.get('geo_bypass_country', 'default')
-                logger.info(f"Tentative téléchargement {i+1}/{len(download_configs)} avec pays: {country}")
-                
-                with yt_dlp.YoutubeDL(config) as ydl:
-                    ydl.download([youtube_url])
-                
-                # Trouver le fichier téléchargé
-                downloaded_files = [f for f in os.listdir(self.audio_dir) if f.startswith(video_id)]
-                if downloaded_files:
-                    filename = downloaded_files[0]
-                    file_path = self.audio_dir / filename
-                    size_mb = file_path.stat().st_size / (1024 * 1024)
+        try:
+            for i, config in enumerate(download_configs):
+                if download.cancelled:
+                    logger.info(f"Téléchargement de {video_id} abandonné")
+                    return None
+                try:
+                    country = config.get('geo_bypass_country', 'default')
+                    logger.info(f"Tentative téléchargement {i+1}/{len(download_configs)} avec pays: {country}")
                     
-                    logger.info(f"✅ Téléchargement réussi: {filename} ({size_mb:.2f} MB)")
-                    return {
-                        'video_id': video_id,
-                        'filename': filename,
-                        'file_path': str(file_path),
-                        'size_mb': round(size_mb, 2),
-                        'country_used': country
-                    }
+                    # Progression suivie pour servir le fichier pendant son écriture
+                    with yt_dlp.YoutubeDL({**config, 'progress_hooks': [download.on_progress]}) as ydl:
+                        info = ydl.extract_info(youtube_url, download=True)
+                        downloaded_path = self._downloaded_path(ydl, info)
                     
-            except Exception as e:
-                logger.warning(f"❌ Échec téléchargement avec {country}: {str(e)[:100]}")
-                continue
+                    # Mettre le fichier en place et l'indexer (chemin donné par yt-dlp, sans parcourir le dossier)
+                    final_path = self._publish(video_id, downloaded_path) if downloaded_path and os.path.exists(downloaded_path) else None
+                    record = self.files.add(final_path) if final_path else None
+                    if record:
+                        self.files.enforce_quota(keep=video_id)
+                        file_info = self._file_info(record)
+                        
+                        logger.info(f"✅ Téléchargement réussi: {record['filename']} ({file_info['size_mb']:.2f} MB)")
+                        return {**file_info, 'country_used': country}
+                        
+                except Exception as e:
+                    logger.warning(f"❌ Échec téléchargement avec {country}: {str(e)[:100]}")
+                    continue
+        finally:
+            self._remove_temp_files(temp_prefix)
         
         logger.error(f"Impossible de télécharger {video_id}")
         return None
     
+    def _publish(self, video_id: str, downloaded_path: str) -> Path:
+        """Renomme le fichier temporaire complet en <video_id>.<ext> (os.replace: atomique)"""
+        final_path = self.audio_dir / f"{video_id}{Path(downloaded_path).suffix}"
+        previous = self.files.get(video_id)
+        os.replace(downloaded_path, final_path)
+        if previous and previous['path'] != str(final_path):
+            # Même vidéo dans un autre conteneur: l'ancien fichier n'est plus servi
+            try:
+                os.unlink(previous['path'])
+            except OSError:
+                pass
+        return final_path
+    
+    def _remove_temp_files(self, temp_prefix: str) -> None:
+        """Supprime les restes (.part, fragments) d'un téléchargement terminé ou échoué"""
+        with os.scandir(self.files.temp_dir) as entries:
+            leftovers = [entry.path for entry in entries if entry.name.startswith(temp_prefix + '.')]
+        for path in leftovers:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+    
+    def _file_info(self, record: Dict) -> Dict:
+        """Description d'un fichier indexé, avec son type MIME détecté depuis le conteneur"""
+        return {
+            'video_id': record['video_id'],
+            'filename': record['filename'],
+            'file_path': record['path'],
+            'size_mb': round(record['size'] / (1024 * 1024), 2),
+            'size_bytes': record['size'],
+            'ext': record['ext'],
+            'mimetype': self.files.mimetype(record['video_id']),
+            'mtime': record['mtime']
+        }
+    
+    @staticmethod
+    def _downloaded_path(ydl, info: Optional[Dict]) -> Optional[str]:
+        """Chemin final du fichier écrit par yt-dlp"""
+        if not info:
+            return None
+        for download in info.get('requested_downloads') or []:
+            if download.get('filepath'):
+                return download['filepath']
+        return ydl.prepare_filename(info)
+    
     def get_local_file(self, video_id: str) -> Optional[Dict]:
-        """Obtenir un fichier local s'il existe"""
+        """Obtenir un fichier local s'il existe (recherche O(1) dans l'index)"""
         try:
-            files = [f for f in os.listdir(self.audio_dir) if f.startswith(video_id)]
-            if files:
-                filename = files[0]
-                file_path = self.audio_dir / filename
-                if file_path.exists():
-                    size_mb = file_path.stat().st_size / (1024 * 1024)
-                    return {
-                        'video_id': video_id,
-                        'filename': filename,
-                        'file_path': str(file_path),
-                        'size_mb': round(size_mb, 2),
-                        'exists': True
-                    }
-            return None
+            record = self.files.get(video_id)
+            if record is None:
+                return None
+            if not os.path.exists(record['path']):
+                # Supprimé en dehors de l'API: l'index est corrigé au passage
+                self.files.discard(video_id)
+                return None
+            return {**self._file_info(record), 'exists': True}
         except Exception as e:
             logger.error(f"Erreur lors de la vérification du fichier local {video_id}: {e}")
             return None
     
+    def serve_local_file(self, video_id: str) -> Optional[Dict]:
+        """Comme get_local_file(), en comptant l'accès pour l'éviction LRU/LFU"""
+        local_file = self.get_local_file(video_id)
+        if local_file:
+            self.files.touch(video_id)
+        return local_file
+    
     def list_files(self) -> List[Dict]:
         """Lister tous les fichiers audio"""
         try:
-            files = []
-            for file_path in self.audio_dir.iterdir():
-                if file_path.is_file():
-                    video_id = file_path.stem.split('.')[0]
-                    size_mb = file_path.stat().st_size / (1024 * 1024)
-                    created_at = file_path.stat().st_ctime
-                    
-                    files.append({
-                        'video_id': video_id,
-                        'filename': file_path.name,
-                        'file_path': str(file_path),
-                        'size_mb': round(size_mb, 2),
-                        'created_at': created_at
-                    })
+            files = [
+                {
+                    'video_id': record['video_id'],
+                    'filename': record['filename'],
+                    'file_path': record['path'],
+                    'size_mb': round(record['size'] / (1024 * 1024), 2),
+                    'created_at': record['mtime']
+                }
+                for record in self.files.records()
+            ]
             
             logger.info(f"Listage de {len(files)} fichiers")
             return files
@@ -151,17 +344,16 @@ class AudioService:
     def delete_file(self, video_id: str) -> bool:
         """Supprimer un fichier audio"""
         try:
-            files = [f for f in os.listdir(self.audio_dir) if f.startswith(video_id)]
-            deleted_count = 0
-            
-            for filename in files:
-                file_path = self.audio_dir / filename
-                if file_path.exists():
-                    file_path.unlink()
-                    deleted_count += 1
-                    logger.info(f"Fichier supprimé: {filename}")
+            record = self.files.discard(video_id)
+            if record is None:
+                return False
             
-            return deleted_count > 0
+            try:
+                os.unlink(record['path'])
+            except FileNotFoundError:
+                return False
+            logger.info(f"Fichier supprimé: {record['filename']}")
+            return True
         except Exception as e:
             logger.error(f"Erreur lors de la suppression du fichier {video_id}: {e}")
             return False
@@ -174,6 +366,7 @@ class AudioService:
                 if file_path.is_file():
                     file_path.unlink()
                     deleted_count += 1
+            self.files.clear()
             
             logger.info(f"Suppression de {deleted_count} fichiers")
             return deleted_count
@@ -181,6 +374,23 @@ class AudioService:
             logger.error(f"Erreur lors de la suppression de tous les fichiers: {e}")
             return 0
     
+    def _sweep_orphans_periodically(self) -> None:
+        while not self._sweep_stop.wait(Config.AUDIO_ORPHAN_SWEEP_INTERVAL):
+            try:
+                self.files.sweep_orphans(min_age=Config.AUDIO_ORPHAN_MIN_AGE, active=self.downloads.active_paths())
+            except Exception as e:
+                logger.warning(f"❌ Échec du nettoyage des fichiers temporaires: {e}")
+    
+    def get_stats(self) -> Dict:
+        """Statistiques du service audio"""
+        return {
+            'streaming_cache': self._url_cache.get_cache_stats(),
+            'streaming_single_flight': self._url_flight.get_stats(),
+            'negative_cache': negative_cache.get_stats(),
+            'audio_files': self.files.get_stats(),
+            'downloads': self.downloads.get_stats()
+        }
+    
     def _get_bypass_configs(self) -> List[Dict]:
         """Obtenir les configurations de contournement pour streaming"""
         countries = ['US', 'GB', 'FR', 'CA', 'AU', 'DE', 'NL']
@@ -1,122 +1,308 @@
 """
 Service pour la gestion de la musique avec YouTube Music API
 """
+import atexit
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from typing import List, Dict, Optional
-from ytmusicapi import YTMusic
 from ..config import Config
+from ..infrastructure.youtube_music_repository import YTMusicClientPool
+from search_cache import search_cache
+from cache_manager import CacheSnapshotter
+from metadata_cache import metadata_cache
+from charts_scheduler import ChartsScheduler
+from http_caching import remaining_max_age
+from compression import response_compressor
 
 logger = logging.getLogger(__name__)
 
+SEARCH_MODES = ('sequential', 'race', 'merge')
+
+# Constante de la fusion par rang réciproque (RRF) utilisée en mode merge
+RRF_K = 60
+
+
+def merge_region_results(region_results: List[List[Dict]], limit: int) -> List[Dict]:
+    """Fusionner les résultats de plusieurs régions, dédoublonnés par videoId
+
+    Classement par fusion de rang réciproque: un titre bien placé dans
+    plusieurs régions passe devant un titre présent dans une seule.
+    """
+    scores: Dict[str, float] = {}
+    items: Dict[str, Dict] = {}
+    for results in region_results:
+        for rank, item in enumerate(results):
+            key = item.get('videoId') or item.get('browseId')
+            if not key:
+                continue
+            scores[key] = scores.get(key, 0.0) + 1.0 / (RRF_K + rank + 1)
+            items.setdefault(key, item)
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    return [items[key] for key in ranked[:limit]]
+
 
 class MusicService:
     """Service pour interagir avec YouTube Music"""
     
     def __init__(self):
         self.ytmusic = None
+        self.clients = None
         self._init_ytmusic()
+        # Recherches parallèles sur les régions (modes race et merge)
+        self._search_executor = ThreadPoolExecutor(
+            max_workers=Config.SEARCH_FANOUT_WORKERS,
+            thread_name_prefix="region-search"
+        )
+        # Charts des pays CHARTS_COUNTRIES, rechargés en arrière-plan et servis depuis la mémoire
+        self.charts = ChartsScheduler(self.ytmusic.get_charts)
+        self.charts.start()
+        atexit.register(self.charts.stop)
+        # Métadonnées restaurées au démarrage, sauvegardées périodiquement et à l'arrêt
+        self._metadata_snapshotter = CacheSnapshotter(metadata_cache, 'api_metadata')
+        self._metadata_snapshotter.start()
+        atexit.register(self._metadata_snapshotter.stop)
     
     def _init_ytmusic(self):
-        """Initialiser YTMusic avec gestion des régions"""
-        for region in Config.BYPASS_REGIONS:
-            try:
-                if region:
-                    self.ytmusic = YTMusic(
-                        language=region['language'], 
-                        location=region['location']
-                    )
-                    logger.info(f"YTMusic initialisé avec région: {region}")
-                else:
-                    self.ytmusic = YTMusic()
-                    logger.info("YTMusic initialisé sans région spécifique")
-                break
-            except Exception as e:
-                logger.warning(f"Échec initialisation YTMusic avec région {region}: {e}")
-                continue
+        """Initialiser une fois les clients YTMusic de toutes les régions"""
+        self.clients = YTMusicClientPool(Config.BYPASS_REGIONS, pool_size=Config.YTMUSIC_HTTP_POOL_SIZE,
+                                         timeout=Config.YTMUSIC_HTTP_TIMEOUT)
+        self.ytmusic = self.clients.default_client()
         
         if not self.ytmusic:
             raise Exception("Impossible d'initialiser YTMusic")
     
-    def search_songs(self, query: str, limit: int = 20) -> Dict:
-        """Rechercher des chansons"""
+    def search_songs(self, query: str, limit: int = 20, mode: Optional[str] = None) -> Dict:
+        """Rechercher des chansons
+        
+        Modes:
+        - sequential: les régions l'une après l'autre, jusqu'au premier résultat
+        - race: toutes les régions en parallèle, la première réponse non vide gagne
+        - merge: toutes les régions en parallèle, résultats fusionnés et dédoublonnés
+        race et merge s'arrêtent à Config.SEARCH_DEADLINE secondes.
+        """
+        mode = mode or Config.SEARCH_MODE
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Mode de recherche inconnu: {mode}")
+        
         try:
-            # Essayer avec différentes régions si la première échoue
-            for region in Config.BYPASS_REGIONS:
-                try:
-                    if region:
-                        temp_ytmusic = YTMusic(
-                            language=region['language'], 
-                            location=region['location']
-                        )
-                    else:
-                        temp_ytmusic = self.ytmusic
-                    
-                    results = temp_ytmusic.search(query, filter="songs", limit=limit)
-                    
-                    if results:
-                        logger.info(f"Recherche réussie avec région {region}: {len(results)} résultats")
-                        return {
-                            'results': results,
-                            'total_results': len(results),
-                            'region_used': region,
-                            'query': query
-                        }
-                except Exception as e:
-                    logger.warning(f"Échec recherche avec région {region}: {e}")
-                    continue
-            
-            # Si aucune région ne fonctionne
-            logger.error(f"Aucune région disponible pour la recherche: {query}")
-            return {
-                'results': [],
-                'total_results': 0,
-                'region_used': None,
-                'query': query,
-                'error': 'Aucune région disponible'
-            }
-            
+            if mode == 'sequential':
+                return self._search_sequential(query, limit)
+            return self._search_fanout(query, limit, mode)
         except Exception as e:
             logger.error(f"Erreur lors de la recherche '{query}': {e}")
             raise
     
+    def _cached_region_answer(self, region: Optional[Dict], query: str, limit: int) -> Optional[Dict]:
+        """Réponse d'une région servie par le cache de recherche, sans appel réseau"""
+        results = search_cache.get(query, "songs", limit, region)
+        if results is None:
+            return None
+        report = {'region': region, 'status': 'cached', 'elapsed_ms': 0.0, 'total_results': len(results)}
+        return {'report': report, 'results': results}
+    
+    def _search_region(self, region: Optional[Dict], client, query: str, limit: int) -> Dict:
+        """Recherche dans une région, depuis le cache si possible"""
+        return self._cached_region_answer(region, query, limit) or self._fetch_region(region, client, query, limit)
+    
+    def _fetch_region(self, region: Optional[Dict], client, query: str, limit: int) -> Dict:
+        """Recherche réseau dans une région, chronométrée et mise en cache"""
+        temp_ytmusic = client if region else self.ytmusic
+        started = time.perf_counter()
+        try:
+            # ytmusicapi peut renvoyer plus que `limit`: tronqué comme un hit de cache
+            results = (temp_ytmusic.search(query, filter="songs", limit=limit) or [])[:limit]
+            status = 'ok' if results else 'empty'
+            error = None
+            if results:
+                search_cache.set(query, "songs", limit, results, region)
+        except Exception as e:
+            logger.warning(f"Échec recherche avec région {region}: {e}")
+            results, status, error = [], 'error', str(e)[:200]
+        report = {
+            'region': region,
+            'status': status,
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+            'total_results': len(results)
+        }
+        if error:
+            report['error'] = error
+        return {'report': report, 'results': results}
+    
+    def _search_sequential(self, query: str, limit: int) -> Dict:
+        """Essayer avec différentes régions si la première échoue"""
+        reports = []
+        for region, client in self.clients.clients():
+            answer = self._search_region(region, client, query, limit)
+            reports.append(answer['report'])
+            results = answer['results']
+            
+            if results:
+                logger.info(f"Recherche réussie avec région {region}: {len(results)} résultats")
+                return {
+                    'results': results,
+                    'total_results': len(results),
+                    'region_used': region,
+                    'query': query,
+                    'mode': 'sequential',
+                    'regions': reports
+                }
+        
+        return self._no_region_available(query, 'sequential', reports)
+    
+    def _search_fanout(self, query: str, limit: int, mode: str) -> Dict:
+        """Interroger toutes les régions en parallèle, avec une échéance"""
+        started = time.perf_counter()
+        deadline = started + Config.SEARCH_DEADLINE
+        # La région de repli (None) utilise le client par défaut: ne pas l'interroger deux fois
+        regions = [(region, client) for region, client in self.clients.clients()
+                   if region or client is self.ytmusic]
+        # Les régions déjà en cache répondent sans appel réseau
+        slots = [
+            {'region': region, 'answer': self._cached_region_answer(region, query, limit), 'future': None}
+            for region, _ in regions
+        ]
+        winner = None
+        if mode == 'race':
+            winner = next((slot['answer'] for slot in slots if slot['answer']), None)
+        if winner is None:
+            for slot, (region, client) in zip(slots, regions):
+                if slot['answer'] is None:
+                    slot['future'] = self._search_executor.submit(self._fetch_region, region, client, query, limit)
+        
+        by_future = {slot['future']: slot for slot in slots if slot['future']}
+        pending = set(by_future)
+        while pending and winner is None:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                answer = future.result()
+                by_future[future]['answer'] = answer
+                if mode == 'race' and answer['results'] and winner is None:
+                    winner = answer
+        
+        # Les régions encore en cours continuent en arrière-plan; leur résultat est ignoré
+        late_status = 'pending' if winner is not None else 'timeout'
+        reports = []
+        for slot in slots:
+            if slot['answer']:
+                reports.append(slot['answer']['report'])
+            else:
+                status = late_status if slot['future'] else 'skipped'
+                reports.append({'region': slot['region'], 'status': status, 'elapsed_ms': None, 'total_results': 0})
+        
+        if mode == 'race':
+            if winner is None:
+                return self._no_region_available(query, mode, reports)
+            results = winner['results']
+            region_used = winner['report']['region']
+        else:
+            # Ordre de préférence des régions conservé pour la fusion
+            answered = [slot['answer'] for slot in slots if slot['answer']]
+            region_results = [answer['results'] for answer in answered if answer['results']]
+            if not region_results:
+                return self._no_region_available(query, mode, reports)
+            results = merge_region_results(region_results, limit)
+            region_used = next(answer['report']['region'] for answer in answered if answer['results'])
+        
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+        logger.info(f"Recherche {mode} réussie en {elapsed_ms} ms: {len(results)} résultats")
+        return {
+            'results': results,
+            'total_results': len(results),
+            'region_used': region_used,
+            'query': query,
+            'mode': mode,
+            'elapsed_ms': elapsed_ms,
+            'regions': reports
+        }
+    
+    def _no_region_available(self, query: str, mode: str, reports: List[Dict]) -> Dict:
+        """Si aucune région ne fonctionne"""
+        logger.error(f"Aucune région disponible pour la recherche: {query}")
+        return {
+            'results': [],
+            'total_results': 0,
+            'region_used': None,
+            'query': query,
+            'mode': mode,
+            'regions': reports,
+            'error': 'Aucune région disponible'
+        }
+    
+    def get_stats(self) -> Dict:
+        """Statistiques du service de musique"""
+        return {
+            'region_clients': self.clients.get_stats(),
+            'search_cache': search_cache.get_stats(),
+            'metadata_cache': metadata_cache.get_stats(),
+            'charts': self.charts.get_stats(),
+            'compression': response_compressor.get_stats()
+        }
+    
+    def search_max_age(self, result: Dict) -> int:
+        """Cache-Control max-age d'une recherche: durée du cache de recherche si elle a abouti"""
+        return search_cache.ttl if result['results'] else 0
+    
+    def max_age(self, kind: str, entry: Dict) -> int:
+        """Cache-Control max-age d'une entrée: sa fraîcheur restante dans le cache de métadonnées"""
+        if entry['body'] is None:
+            return 0
+        return remaining_max_age(metadata_cache.ttls[kind], entry['timestamp'])
+    
     def get_song_info(self, video_id: str) -> Optional[Dict]:
         """Obtenir les informations d'une chanson"""
+        return self.get_song_entry(video_id)['value'] or None
+    
+    def get_song_entry(self, video_id: str) -> Dict:
+        """Informations d'une chanson avec leur corps JSON et ETag (value, body, etag, timestamp)"""
         try:
-            song_info = self.ytmusic.get_song(video_id)
-            if song_info:
+            entry = metadata_cache.get_entry('song', video_id, lambda: self.ytmusic.get_song(video_id))
+            if entry['value']:
                 logger.info(f"Infos récupérées pour: {video_id}")
-                return song_info
             else:
                 logger.warning(f"Aucune info trouvée pour: {video_id}")
-                return None
+            return entry
         except Exception as e:
             logger.error(f"Erreur lors de la récupération des infos pour {video_id}: {e}")
             raise
     
     def get_playlist(self, playlist_id: str) -> Optional[Dict]:
         """Obtenir une playlist"""
+        return self.get_playlist_entry(playlist_id)['value'] or None
+    
+    def get_playlist_entry(self, playlist_id: str) -> Dict:
+        """Playlist avec son corps JSON et ETag (value, body, etag, timestamp)"""
         try:
-            playlist = self.ytmusic.get_playlist(playlist_id)
-            if playlist:
+            entry = metadata_cache.get_entry('playlist', playlist_id, lambda: self.ytmusic.get_playlist(playlist_id))
+            if entry['value']:
                 logger.info(f"Playlist récupérée: {playlist_id}")
-                return playlist
             else:
                 logger.warning(f"Playlist non trouvée: {playlist_id}")
-                return None
+            return entry
         except Exception as e:
             logger.error(f"Erreur lors de la récupération de la playlist {playlist_id}: {e}")
             raise
     
-    def get_charts(self) -> Optional[Dict]:
+    def get_charts_snapshot(self, country: str) -> Optional[Dict]:
+        """Charts pré-sérialisés d'un pays planifié (body, fetched_at, age), ou None"""
+        return self.charts.get(country)
+    
+    def get_charts(self, country: str = 'ZZ') -> Optional[Dict]:
         """Obtenir les charts"""
+        return self.get_charts_entry(country)['value'] or None
+    
+    def get_charts_entry(self, country: str = 'ZZ') -> Dict:
+        """Charts avec leur corps JSON et ETag (value, body, etag, timestamp)"""
         try:
-            charts = self.ytmusic.get_charts()
-            if charts:
+            entry = metadata_cache.get_entry('charts', country, lambda: self.ytmusic.get_charts(country))
+            if entry['value']:
                 logger.info("Charts récupérés avec succès")
-                return charts
             else:
                 logger.warning("Aucun chart disponible")
-                return None
+            return entry
         except Exception as e:
             logger.error(f"Erreur lors de la récupération des charts: {e}")
             raise
\ No newline at end of file
@@ -7,6 +7,7 @@ import yt_dlp
 import logging
 import os
 from typing import Optional, Dict
+from negative_cache import negative_cache, classify_errors
 
 class AudioExtractor:
     def __init__(self):
@@ -38,10 +39,21 @@ class AudioExtractor:
             }
         }
     
-    def extract_audio_url(self, video_id: str) -> Optional[Dict]:
+    def extract_audio_url(self, video_id: str, bypass_negative_cache: bool = False) -> Optional[Dict]:
         """Extrait l'URL audio avec plusieurs stratégies de fallback"""
         
+        # Échec récent mémorisé: ne pas relancer toute la cascade
+        failure = negative_cache.check(video_id, bypass_negative_cache)
+        if failure:
+            return {
+                'success': False,
+                'error': failure['error'] or 'Extraction récemment échouée',
+                'error_class': failure['error_class'],
+                'negative_cached': True
+            }
+        
         youtube_url = f"https://www.youtube.com/watch?v={video_id}"
+        errors = []
         
         # Stratégies à essayer dans l'ordre
         strategies = [
@@ -98,17 +110,21 @@ class AudioExtractor:
                             
             except Exception as e:
                 logging.warning(f"❌ Échec {strategy_name}: {e}")
+                errors.append(str(e))
                 continue
         
-        # Toutes les stratégies ont échoué
+        # Toutes les stratégies ont échoué: mémoriser l'échec
+        error_class = classify_errors(errors)
+        negative_cache.record(video_id, error_class, errors[-1] if errors else '')
         return {
             'success': False,
-            'error': 'Toutes les stratégies d\'extraction ont échoué'
+            'error': 'Toutes les stratégies d\'extraction ont échoué',
+            'error_class': error_class
         }
 
 # Instance globale
 audio_extractor = AudioExtractor()
 
-def extract_audio_url(video_id: str) -> Optional[Dict]:
+def extract_audio_url(video_id: str, bypass_negative_cache: bool = False) -> Optional[Dict]:
     """Fonction helper pour extraire l'URL audio"""
-    return audio_extractor.extract_audio_url(video_id)
\ No newline at end of file
+    return audio_extractor.extract_audio_url(video_id, bypass_negative_cache)
\ No newline at end of file
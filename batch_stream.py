@@ -0,0 +1,91 @@
+"""
+Résolution groupée d'URLs de streaming, renvoyée au fil de l'eau en NDJSON
+
+Les hits de cache partent immédiatement; les défauts sont résolus en parallèle
+avec un budget de workers borné par lot, via la même fonction que
+/stream/{video_id} (single-flight + cache partagés). Chaque ligne est un objet
+JSON autonome; la dernière résume le lot.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+# Nombre de résolutions simultanées par lot et taille maximale d'un lot
+STREAM_BATCH_CONCURRENCY = int(os.getenv("STREAM_BATCH_CONCURRENCY", 4))
+STREAM_BATCH_MAX_IDS = int(os.getenv("STREAM_BATCH_MAX_IDS", 100))
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def _line(payload: Dict) -> bytes:
+    return (json.dumps(payload, separators=(',', ':'), ensure_ascii=False) + '\n').encode('utf-8')
+
+
+def _error_fields(error: Exception) -> Dict:
+    """Statut et message d'une erreur (HTTPException, ExtractionUnavailable ou exception quelconque)"""
+    status = getattr(error, 'status_code', 500)
+    detail = getattr(error, 'detail', None) or str(error)
+    fields = {'status': status, 'error': detail}
+    error_class = (getattr(error, 'headers', None) or {}).get('X-Error-Class')
+    if error_class:
+        fields['error_class'] = error_class
+    return fields
+
+
+async def stream_batch(video_ids: List[str],
+                       lookup: Callable[[str], Optional[Dict]],
+                       resolve: Callable[[str], Awaitable[Dict]],
+                       concurrency: int = STREAM_BATCH_CONCURRENCY) -> AsyncIterator[bytes]:
+    """Génère une ligne NDJSON par video_id, dans l'ordre où les résultats sont prêts
+
+    - lookup(video_id): réponse depuis le cache, ou None
+    - resolve(video_id): réponse après extraction; lève une HTTPException en cas d'échec
+    """
+    started = time.perf_counter()
+    counts = {'cached': 0, 'resolved': 0, 'failed': 0}
+
+    # 1. Hits de cache: envoyés tout de suite
+    misses = []
+    for index, video_id in enumerate(video_ids):
+        response = lookup(video_id)
+        if response is None:
+            misses.append((index, video_id))
+            continue
+        counts['cached'] += 1
+        yield _line({'index': index, 'video_id': video_id, 'status': 200, **response})
+
+    # 2. Défauts: résolus en parallèle, au plus `concurrency` à la fois
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def resolve_one(index: int, video_id: str) -> Dict:
+        async with semaphore:
+            try:
+                response = await resolve(video_id)
+                counts['resolved'] += 1
+                return {'index': index, 'video_id': video_id, 'status': 200, **response}
+            except Exception as e:
+                counts['failed'] += 1
+                if getattr(e, 'status_code', 500) >= 500:
+                    logging.warning(f"Lot: échec de résolution pour {video_id}: {str(e)[:100]}")
+                return {'index': index, 'video_id': video_id, **_error_fields(e)}
+
+    pending = {asyncio.ensure_future(resolve_one(index, video_id)) for index, video_id in misses}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield _line(task.result())
+    finally:
+        # Client déconnecté: les extractions partagées continuent et rempliront le cache
+        for task in pending:
+            task.cancel()
+
+    yield _line({
+        'done': True,
+        'total': len(video_ids),
+        **counts,
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
+    })
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: coût CPU d'une réponse servie depuis le cache (playlist, charts, /stream)
+
+- avant: la valeur en cache est réencodée à chaque requête (jsonable_encoder +
+  json.dumps comme JSONResponse de FastAPI, ou json.dumps seul sans FastAPI)
+- après: l'entrée du cache porte son corps déjà sérialisé (orjson s'il est
+  installé), la requête renvoie ces octets tels quels
+
+Les débits sont exprimés en requêtes par seconde de temps CPU d'un seul
+thread, donc par cœur. Les payloads sont synthétiques, calqués sur la forme
+des réponses ytmusicapi; --playlist et --charts acceptent un vrai payload
+sauvegardé en JSON.
+
+Usage: python bench_json_responses.py [--iterations 500] [--tracks 500]
+                                      [--playlist playlist.json] [--charts charts.json]
+"""
+import argparse
+import json
+import time
+from http_caching import JSON_ENCODER
+from metadata_cache import MetadataCache
+from cache_manager import AudioCacheManager, expiry_info
+
+try:
+    from fastapi.encoders import jsonable_encoder
+except ImportError:
+    jsonable_encoder = None
+
+
+def fake_track(index):
+    return {
+        'videoId': f"vid{index:08d}",
+        'title': f"Titre {index} — édition spéciale",
+        'artists': [{'name': f"Artiste {index % 97}", 'id': f"UC{index:022d}"}],
+        'album': {'name': f"Album {index % 31}", 'id': f"MPREb_{index:011d}"},
+        'likeStatus': 'INDIFFERENT',
+        'inLibrary': False,
+        'thumbnails': [
+            {'url': f"https://lh3.googleusercontent.com/{index}=w{size}-h{size}", 'width': size, 'height': size}
+            for size in (60, 120, 226, 544)
+        ],
+        'isAvailable': True,
+        'isExplicit': index % 7 == 0,
+        'videoType': 'MUSIC_VIDEO_TYPE_ATV',
+        'duration': f"{3 + index % 4}:{index % 60:02d}",
+        'duration_seconds': 180 + index % 240,
+        'setVideoId': f"{index:016X}"
+    }
+
+
+def fake_playlist(tracks):
+    return {
+        'id': 'PLfakeplaylist',
+        'privacy': 'PUBLIC',
+        'title': 'Playlist de test',
+        'description': 'Payload synthétique pour le benchmark',
+        'author': {'name': 'bench', 'id': 'UCbench'},
+        'trackCount': tracks,
+        'duration_seconds': tracks * 200,
+        'tracks': [fake_track(i) for i in range(tracks)]
+    }
+
+
+def fake_charts():
+    return {
+        'countries': {'selected': {'text': 'Global'}, 'options': ['ZZ', 'US', 'FR', 'GB']},
+        'videos': [{'title': 'Daily Top Music Videos', 'playlistId': 'PLtop', 'thumbnails': []}],
+        'artists': [
+            {'title': f"Artiste {i}", 'browseId': f"UC{i:022d}", 'subscribers': f"{i}M",
+             'thumbnails': [{'url': f"https://lh3.googleusercontent.com/a{i}", 'width': 226, 'height': 226}],
+             'rank': str(i + 1), 'trend': 'up'}
+            for i in range(40)
+        ],
+        'genres': [{'title': f"Genre {i}", 'playlistId': f"PLgenre{i}"} for i in range(20)],
+        'trending': {'playlist': 'PLtrending', 'items': [fake_track(i) for i in range(100)]}
+    }
+
+
+def encode_per_request(value):
+    """Ce que faisait un hit de cache: réencoder la valeur comme JSONResponse"""
+    if jsonable_encoder is not None:
+        value = jsonable_encoder(value)
+    return json.dumps(value, ensure_ascii=False, allow_nan=False, indent=None, separators=(',', ':')).encode('utf-8')
+
+
+def measure(label, func, iterations):
+    func()
+    started = time.process_time()
+    for _ in range(iterations):
+        func()
+    cpu = time.process_time() - started
+    rate = iterations / cpu if cpu > 0 else float('inf')
+    print(f"{label:<36} {rate:12,.0f} req/s/cœur   {cpu / iterations * 1e6:10.1f} µs/req")
+    return rate
+
+
+def load_payload(path, default):
+    if not path:
+        return default()
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--tracks', type=int, default=500, help="titres de la playlist synthétique")
+    parser.add_argument('--playlist', metavar='FICHIER', help="payload get_playlist réel (JSON)")
+    parser.add_argument('--charts', metavar='FICHIER', help="payload get_charts réel (JSON)")
+    args = parser.parse_args()
+
+    print(f"Encodeur: {JSON_ENCODER}; avant = {'jsonable_encoder + ' if jsonable_encoder else ''}json.dumps\n")
+    cache = MetadataCache(max_entries=10)
+    payloads = {
+        'playlist': load_payload(args.playlist, lambda: fake_playlist(args.tracks)),
+        'charts': load_payload(args.charts, fake_charts)
+    }
+
+    for kind, payload in payloads.items():
+        cache.get_entry(kind, 'bench', lambda: payload)
+        size = len(cache.get_entry(kind, 'bench', lambda: payload)['body'])
+        print(f"{kind} ({size / 1024:.0f} Kio):")
+        before = measure("  avant (réencodage par requête)",
+                         lambda: encode_per_request(cache.get(kind, 'bench', lambda: payload)), args.iterations)
+        after = measure("  après (octets en cache)",
+                        lambda: cache.get_entry(kind, 'bench', lambda: payload)['body'], args.iterations)
+        print(f"  gain: x{after / before:.1f}\n")
+
+    audio_cache = AudioCacheManager(max_entries=10, namespace='bench')
+    audio_cache.set('bench', 'https://rr1---sn.googlevideo.com/videoplayback?expire=9999999999&id=x',
+                    title='Titre de test')
+    fields = lambda entry: {'audio_url': entry['url'], 'title': entry['title'], 'cached': True}
+    print("/stream (hit de cache):")
+
+    def stream_before():
+        entry = audio_cache.get_entry('bench')
+        return encode_per_request({**fields(entry), **expiry_info(entry)})
+
+    before = measure("  avant (dict + réencodage)", stream_before, args.iterations * 10)
+    after = measure("  après (corps pré-sérialisé)",
+                    lambda: audio_cache.get_response_body('bench', fields), args.iterations * 10)
+    print(f"  gain: x{after / before:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Benchmark: réutilisation des connexions HTTP par les clients YTMusic de MusicService
+
+- avant: un YTMusic neuf par région essayée, donc une session HTTP neuve et
+  une nouvelle connexion par recherche
+- après: clients du YTMusicClientPool créés une fois, session HTTP partagée
+  (connexions keep-alive réutilisées)
+
+Par défaut, de vraies requêtes HTTP sont envoyées à un serveur local
+(keep-alive, HTTP/1.1): session neuve par requête contre session partagée de
+create_http_session(). Cela mesure l'ouverture de connexion TCP et la
+création de session, sans réseau ni TLS: le gain réel vers YouTube Music
+est plus grand (poignée de main TLS, latence). Avec --live, de vraies
+recherches sont chronométrées: elles incluent TLS et la récupération du
+visitor id que les clients neufs refont à chaque recherche.
+
+Usage: python bench_music_clients.py [--iterations 500] [--live "daft punk"]
+"""
+import argparse
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+from ytmusicapi import YTMusic
+from app.config import Config
+from app.infrastructure.youtube_music_repository import YTMusicClientPool, create_http_session
+
+RESPONSE_BODY = b'{"contents":{}}'
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    """Réponse JSON minimale; la connexion reste ouverte (HTTP/1.1)"""
+    protocol_version = 'HTTP/1.1'
+    # En-têtes et corps écrits séparément: sans TCP_NODELAY, l'ACK retardé du
+    # client ajoute ~40 ms à chaque réponse sur une connexion réutilisée
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(RESPONSE_BODY)))
+        self.end_headers()
+        self.wfile.write(RESPONSE_BODY)
+
+    def log_message(self, *args):
+        pass
+
+
+class ConnectionCounter(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.connections = 0
+
+    def process_request(self, request, client_address):
+        self.connections += 1
+        super().process_request(request, client_address)
+
+
+def measure(label, func, iterations):
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    print(f"{label:<32} médiane {statistics.median(timings):8.3f} ms   "
+          f"p95 {sorted(timings)[int(len(timings) * 0.95) - 1]:8.3f} ms")
+    return statistics.median(timings)
+
+
+def fresh_session_request(url):
+    """Ancien comportement: session neuve (donc connexion neuve) pour chaque appel"""
+    with requests.Session() as session:
+        session.post(url, json={'query': 'bench'}, timeout=5).content
+
+
+def bench_local(iterations):
+    server = ConnectionCounter(('127.0.0.1', 0), KeepAliveHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/youtubei/v1/search"
+    pooled = create_http_session(Config.YTMUSIC_HTTP_POOL_SIZE, Config.YTMUSIC_HTTP_TIMEOUT)
+
+    try:
+        print(f"Requêtes HTTP vers un serveur local ({iterations} itérations, sans TLS):")
+        server.connections = 0
+        before = measure("avant (session neuve)", lambda: fresh_session_request(url), iterations)
+        fresh_connections = server.connections
+        server.connections = 0
+        after = measure("après (session partagée)",
+                        lambda: pooled.post(url, json={'query': 'bench'}).content, iterations)
+        print(f"Connexions ouvertes: {fresh_connections} avant, {server.connections} après")
+        print(f"Gain par requête: {before - after:.3f} ms (hors TLS et latence réseau)\n")
+    finally:
+        pooled.close()
+        server.shutdown()
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--live', metavar='QUERY', help="chronométrer de vraies recherches (réseau)")
+    args = parser.parse_args()
+
+    bench_local(args.iterations)
+
+    if args.live:
+        regions = Config.BYPASS_REGIONS
+        pool = YTMusicClientPool(regions, pool_size=Config.YTMUSIC_HTTP_POOL_SIZE,
+                                 timeout=Config.YTMUSIC_HTTP_TIMEOUT)
+        iterations = min(args.iterations, 10)
+        print(f"Recherches réelles '{args.live}' ({iterations} itérations, première région):")
+        region = regions[0]
+        measure(
+            "avant (client neuf)",
+            lambda: YTMusic(language=region['language'], location=region['location'])
+            .search(args.live, filter="songs", limit=20),
+            iterations
+        )
+        measure("après (pool)", lambda: pool.clients()[0][1].search(args.live, filter="songs", limit=20), iterations)
+
+
+if __name__ == "__main__":
+    main()
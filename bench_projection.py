@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Mesure: taille et temps de sérialisation des réponses /search et /playlist
+selon la projection (profil full, profil compact, fields=)
+
+Les mesures portent sur un jeu fixe de payloads ytmusicapi enregistrés sur
+disque, pour que deux exécutions soient comparables:
+
+1. capture (réseau, une fois): python bench_projection.py --capture \\
+       --query "daft punk" --query "stromae" --playlist PLxxxxxxxx
+   écrit search-*.json et playlist-*.json dans --payloads
+2. mesure: python bench_projection.py [--payloads bench_payloads]
+
+Aucun payload capturé n'est livré avec le dépôt: les chiffres de réduction
+ne valent que pour des payloads capturés. --synthetic tourne sur des payloads
+générés (forme ytmusicapi, contenu inventé); ses résultats donnent un ordre
+de grandeur pour comparer deux versions du code, pas une mesure de la
+réduction en production.
+
+Usage: python bench_projection.py [--payloads DIR] [--iterations 200] [--fields videoId,title]
+"""
+import argparse
+import glob
+import gzip
+import json
+import os
+import re
+import statistics
+import time
+from http_caching import JSON_ENCODER, serialize_json
+from projection import parse_fields, project_items, project_playlist
+
+
+def capture(directory, queries, playlist_ids, limit):
+    from ytmusicapi import YTMusic
+    ytmusic = YTMusic()
+    os.makedirs(directory, exist_ok=True)
+    for query in queries:
+        results = ytmusic.search(query, filter="songs", limit=limit)
+        save(directory, f"search-{slug(query)}.json", results)
+    for playlist_id in playlist_ids:
+        playlist = ytmusic.get_playlist(playlist_id, limit=None)
+        save(directory, f"playlist-{slug(playlist_id)}.json", playlist)
+
+
+def slug(text):
+    return re.sub(r'[^a-z0-9]+', '-', text.lower()).strip('-')[:60]
+
+
+def save(directory, name, payload):
+    path = os.path.join(directory, name)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False)
+    print(f"💾 {path}")
+
+
+def load_payloads(directory):
+    payloads = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.json'))):
+        kind = 'playlist' if os.path.basename(path).startswith('playlist-') else 'search'
+        with open(path, encoding='utf-8') as f:
+            payloads.append((kind, os.path.basename(path), json.load(f)))
+    return payloads
+
+
+def synthetic_payloads():
+    from bench_json_responses import fake_playlist, fake_track
+    return [
+        ('search', 'synthetic-search', [fake_track(i) for i in range(20)]),
+        ('playlist', 'synthetic-playlist', fake_playlist(500))
+    ]
+
+
+def render(kind, payload, profile, fields):
+    if kind == 'playlist':
+        return project_playlist(payload, profile, fields)
+    return {'results': project_items(payload, profile, fields)}
+
+
+def serialization_us(value, iterations):
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        serialize_json(value)
+        timings.append((time.perf_counter() - started) * 1e6)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--payloads', default='bench_payloads', help="dossier des payloads enregistrés")
+    parser.add_argument('--capture', action='store_true', help="enregistrer des payloads réels (réseau)")
+    parser.add_argument('--query', action='append', default=[], help="recherche à capturer (répétable)")
+    parser.add_argument('--playlist', action='append', default=[], help="playlist à capturer (répétable)")
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--synthetic', action='store_true', help="payloads synthétiques si rien n'est capturé")
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--fields', default='videoId,title,artists.name,duration_seconds')
+    args = parser.parse_args()
+
+    if args.capture:
+        capture(args.payloads, args.query, args.playlist, args.limit)
+        return
+
+    payloads = synthetic_payloads() if args.synthetic else load_payloads(args.payloads)
+    if not payloads:
+        parser.error(f"aucun payload dans {args.payloads}: lancer d'abord --capture (ou --synthetic)")
+
+    variants = [
+        ('full', 'full', None),
+        ('compact', 'compact', None),
+        (f"fields={args.fields}", 'full', parse_fields(args.fields))
+    ]
+    if args.synthetic:
+        print("⚠️ Payloads synthétiques: ordre de grandeur seulement, pas une mesure sur des réponses réelles")
+    print(f"Encodeur: {JSON_ENCODER}; médiane sur {args.iterations} sérialisations\n")
+    totals = {label: [0, 0, 0.0] for label, _, _ in variants}
+    for kind, name, payload in payloads:
+        print(f"{name} ({kind}):")
+        for label, profile, fields in variants:
+            value = render(kind, payload, profile, fields)
+            body = serialize_json(value)
+            gzipped = len(gzip.compress(body, mtime=0))
+            elapsed = serialization_us(value, args.iterations)
+            totals[label][0] += len(body)
+            totals[label][1] += gzipped
+            totals[label][2] += elapsed
+            print(f"  {label:<48} {len(body):>9,} o  gzip {gzipped:>8,} o  {elapsed:9.1f} µs")
+        print()
+
+    full_bytes, full_gzip, full_us = totals['full']
+    print("Total (par rapport à full):")
+    for label, (size, gzipped, elapsed) in totals.items():
+        print(f"  {label:<48} {size / full_bytes:6.1%} octets   {gzipped / full_gzip:6.1%} gzip   "
+              f"{elapsed / full_us:6.1%} temps")
+
+
+if __name__ == "__main__":
+    main()
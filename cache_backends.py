@@ -0,0 +1,516 @@
+"""
+Backends de stockage pour AudioCacheManager
+
+- memory: cache en mémoire du processus (LRU + TTL), le plus rapide
+- sqlite: fichier SQLite en mode WAL partagé par les workers d'une même machine
+- redis: serveur parlant le protocole Redis (RESP), partagé entre machines
+
+Le backend est choisi par la variable d'environnement CACHE_BACKEND.
+Chaque backend stocke des entrées déjà construites (dict avec `refresh_after`).
+"""
+import heapq
+import json
+import logging
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_SQLITE_PATH = os.getenv("CACHE_SQLITE_PATH", "stream_cache.db")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+CACHE_KEY_PREFIX = os.getenv("CACHE_KEY_PREFIX", "doz")
+
+
+def _estimate_size(key: str, entry: Dict) -> int:
+    """Taille mémoire approximative d'une entrée (clé + champs à plat)"""
+    size = sys.getsizeof(key) + sys.getsizeof(entry)
+    for field, value in entry.items():
+        size += sys.getsizeof(field) + sys.getsizeof(value)
+    return size
+
+
+class _Slot:
+    """Entrée du cache avec sa taille estimée et son numéro de version"""
+
+    __slots__ = ('entry', 'size', 'seq')
+
+    def __init__(self, entry: Dict, size: int, seq: int):
+        self.entry = entry
+        self.size = size
+        self.seq = seq
+
+
+class MemoryBackend:
+    """Cache en mémoire borné (LRU + TTL)
+
+    - `max_entries` et `max_bytes` bornent le cache; l'entrée la moins
+      récemment utilisée est évincée en O(1) (OrderedDict)
+    - les expirations sont suivies dans un tas trié par `refresh_after`,
+      purgé à chaque accès sans parcourir tout le cache
+    """
+
+    name = 'memory'
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.cache: "OrderedDict[str, _Slot]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._expiry_heap: List[Tuple[float, int, str]] = []
+        self._seq = 0
+        self._resident_bytes = 0
+        self._evictions = {'capacity': 0, 'memory': 0, 'expired': 0}
+
+    def _remove(self, key: str) -> Optional[_Slot]:
+        slot = self.cache.pop(key, None)
+        if slot is not None:
+            self._resident_bytes -= slot.size
+        return slot
+
+    def _purge_expired(self, now: float) -> int:
+        """Retire les entrées expirées en tête du tas (suppression paresseuse)"""
+        purged = 0
+        heap = self._expiry_heap
+        while heap and heap[0][0] <= now:
+            _, seq, key = heapq.heappop(heap)
+            slot = self.cache.get(key)
+            # Ignorer les positions obsolètes (entrée remplacée ou déjà évincée)
+            if slot is not None and slot.seq == seq:
+                self._remove(key)
+                purged += 1
+        if purged:
+            self._evictions['expired'] += purged
+        # Reconstruire le tas quand les positions obsolètes dominent
+        if len(heap) > 2 * len(self.cache) + 64:
+            self._expiry_heap = [(slot.entry['refresh_after'], slot.seq, key) for key, slot in self.cache.items()]
+            heapq.heapify(self._expiry_heap)
+        return purged
+
+    def _evict_over_limits(self) -> None:
+        while self.cache and len(self.cache) > self.max_entries:
+            self._remove(next(iter(self.cache)))
+            self._evictions['capacity'] += 1
+        while self.cache and self._resident_bytes > self.max_bytes:
+            self._remove(next(iter(self.cache)))
+            self._evictions['memory'] += 1
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            self._purge_expired(time.time())
+            slot = self.cache.get(key)
+            if slot is None:
+                return None
+            self.cache.move_to_end(key)
+            return slot.entry
+
+    def put(self, key: str, entry: Dict) -> None:
+        with self._lock:
+            self._seq += 1
+            slot = _Slot(entry, _estimate_size(key, entry), self._seq)
+            self._remove(key)
+            self.cache[key] = slot
+            self._resident_bytes += slot.size
+            heapq.heappush(self._expiry_heap, (entry['refresh_after'], slot.seq, key))
+            self._purge_expired(time.time())
+            self._evict_over_limits()
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            return self._remove(key) is not None
+
+    def clear(self) -> int:
+        with self._lock:
+            count = len(self.cache)
+            self.cache.clear()
+            self._expiry_heap = []
+            self._resident_bytes = 0
+            return count
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            return self._purge_expired(time.time())
+
+    def items(self) -> List[Tuple[str, Dict]]:
+        """Copie des entrées valides, de la moins à la plus récemment utilisée"""
+        with self._lock:
+            self._purge_expired(time.time())
+            return [(key, slot.entry) for key, slot in self.cache.items()]
+
+    def __len__(self) -> int:
+        return len(self.cache)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                'backend': self.name,
+                'total_entries': len(self.cache),
+                'resident_bytes': self._resident_bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'evictions': dict(self._evictions)
+            }
+
+
+class SQLiteBackend:
+    """Cache partagé entre workers d'une même machine (SQLite en mode WAL)
+
+    Une connexion par thread; les lecteurs ne bloquent pas l'écrivain grâce au WAL.
+    `max_entries` et `max_bytes` (taille des entrées sérialisées, 0 = sans
+    borne) sont appliqués par namespace à chaque écriture qui les dépasse, en
+    évinçant les entrées les moins récemment lues. Les entrées expirées sont
+    purgées toutes les PRUNE_EVERY écritures (get() les ignore déjà).
+    """
+
+    name = 'sqlite'
+    PRUNE_EVERY = 64
+    # Paramètres par requête DELETE ... IN (...)
+    DELETE_BATCH = 500
+
+    def __init__(self, path: str, namespace: str, max_entries: int, max_bytes: int = 0):
+        self.path = path
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._evictions = {'capacity': 0, 'memory': 0, 'expired': 0}
+
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_entries ("
+            " namespace TEXT NOT NULL, key TEXT NOT NULL, entry TEXT NOT NULL,"
+            " refresh_after REAL NOT NULL, last_used REAL NOT NULL,"
+            " size INTEGER NOT NULL DEFAULT 0,"
+            " PRIMARY KEY (namespace, key))"
+        )
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(cache_entries)")}
+        if 'size' not in columns:
+            # Fichier créé par une version sans la colonne size
+            conn.execute("ALTER TABLE cache_entries ADD COLUMN size INTEGER NOT NULL DEFAULT 0")
+            conn.execute("UPDATE cache_entries SET size = LENGTH(CAST(entry AS BLOB))")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_expiry ON cache_entries (namespace, refresh_after)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_lru ON cache_entries (namespace, last_used)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Dict]:
+        now = time.time()
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT entry FROM cache_entries WHERE namespace = ? AND key = ? AND refresh_after > ?",
+            (self.namespace, key, now)
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute(
+            "UPDATE cache_entries SET last_used = ? WHERE namespace = ? AND key = ?",
+            (now, self.namespace, key)
+        )
+        return json.loads(row[0])
+
+    def put(self, key: str, entry: Dict) -> None:
+        conn = self._conn()
+        payload = json.dumps(entry, separators=(',', ':'))
+        conn.execute(
+            "INSERT OR REPLACE INTO cache_entries (namespace, key, entry, refresh_after, last_used, size)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (self.namespace, key, payload, entry['refresh_after'], time.time(), len(payload.encode('utf-8')))
+        )
+        with self._lock:
+            self._writes += 1
+            purge = self._writes % self.PRUNE_EVERY == 0
+        if purge:
+            self.purge_expired()
+        self._enforce_bounds(conn)
+
+    def _enforce_bounds(self, conn: sqlite3.Connection) -> None:
+        """Évince les entrées les moins récemment lues au-delà de max_entries / max_bytes"""
+        count, stored = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries WHERE namespace = ?",
+            (self.namespace,)
+        ).fetchone()
+        excess_entries = count - self.max_entries
+        excess_bytes = stored - self.max_bytes if self.max_bytes else 0
+        if excess_entries <= 0 and excess_bytes <= 0:
+            return
+
+        if excess_bytes <= 0:
+            # Une seule requête dans le cas courant (borne en nombre d'entrées)
+            evicted = conn.execute(
+                "DELETE FROM cache_entries WHERE namespace = ? AND key IN ("
+                " SELECT key FROM cache_entries WHERE namespace = ? ORDER BY last_used LIMIT ?)",
+                (self.namespace, self.namespace, excess_entries)
+            ).rowcount
+            with self._lock:
+                self._evictions['capacity'] += evicted
+            return
+
+        victims = []
+        freed = 0
+        for victim, size in conn.execute(
+            "SELECT key, size FROM cache_entries WHERE namespace = ? ORDER BY last_used", (self.namespace,)
+        ):
+            if len(victims) >= excess_entries and freed >= excess_bytes:
+                break
+            victims.append(victim)
+            freed += size
+        evicted = 0
+        for start in range(0, len(victims), self.DELETE_BATCH):
+            batch = victims[start:start + self.DELETE_BATCH]
+            evicted += conn.execute(
+                f"DELETE FROM cache_entries WHERE namespace = ? AND key IN ({','.join('?' * len(batch))})",
+                (self.namespace, *batch)
+            ).rowcount
+        by_capacity = min(evicted, max(0, excess_entries))
+        with self._lock:
+            self._evictions['capacity'] += by_capacity
+            self._evictions['memory'] += evicted - by_capacity
+
+    def delete(self, key: str) -> bool:
+        cursor = self._conn().execute(
+            "DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (self.namespace, key)
+        )
+        return cursor.rowcount > 0
+
+    def clear(self) -> int:
+        cursor = self._conn().execute("DELETE FROM cache_entries WHERE namespace = ?", (self.namespace,))
+        return cursor.rowcount
+
+    def purge_expired(self) -> int:
+        cursor = self._conn().execute(
+            "DELETE FROM cache_entries WHERE namespace = ? AND refresh_after <= ?",
+            (self.namespace, time.time())
+        )
+        with self._lock:
+            self._evictions['expired'] += cursor.rowcount
+        return cursor.rowcount
+
+    def items(self) -> List[Tuple[str, Dict]]:
+        rows = self._conn().execute(
+            "SELECT key, entry FROM cache_entries WHERE namespace = ? AND refresh_after > ? ORDER BY last_used",
+            (self.namespace, time.time())
+        ).fetchall()
+        return [(key, json.loads(entry)) for key, entry in rows]
+
+    def __len__(self) -> int:
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM cache_entries WHERE namespace = ?", (self.namespace,)
+        ).fetchone()[0]
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            evictions = dict(self._evictions)
+        return {
+            'backend': self.name,
+            'path': self.path,
+            'total_entries': len(self),
+            'stored_bytes': self._conn().execute(
+                "SELECT COALESCE(SUM(size), 0) FROM cache_entries WHERE namespace = ?", (self.namespace,)
+            ).fetchone()[0],
+            'file_bytes': os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes,
+            'evictions': evictions
+        }
+
+
+class RespError(Exception):
+    """Erreur renvoyée par le serveur Redis"""
+
+
+class RespClient:
+    """Client minimal du protocole Redis (RESP2), sans dépendance externe"""
+
+    def __init__(self, url: str = REDIS_URL, timeout: float = 2.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._sock = None
+        self._reader = None
+
+    def _connect(self) -> None:
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._reader = self._sock.makefile('rb')
+        if self.password:
+            self._call('AUTH', self.password)
+        if self.db:
+            self._call('SELECT', self.db)
+
+    def _close(self) -> None:
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = None
+        self._reader = None
+
+    @staticmethod
+    def _encode(args) -> bytes:
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode('utf-8')
+            parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        return b''.join(parts)
+
+    def _read_reply(self):
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError("Connexion Redis fermée")
+        prefix, payload = line[:1], line[1:-2]
+        if prefix == b'+':
+            return payload.decode('utf-8')
+        if prefix == b'-':
+            raise RespError(payload.decode('utf-8'))
+        if prefix == b':':
+            return int(payload)
+        if prefix == b'$':
+            length = int(payload)
+            if length < 0:
+                return None
+            data = self._reader.read(length + 2)
+            return data[:-2]
+        if prefix == b'*':
+            length = int(payload)
+            if length < 0:
+                return None
+            return [self._read_reply() for _ in range(length)]
+        raise RespError(f"Réponse RESP inattendue: {line[:20]!r}")
+
+    def _call(self, *args):
+        self._sock.sendall(self._encode(args))
+        return self._read_reply()
+
+    def execute(self, *args):
+        """Envoie une commande; reconnecte une fois si la connexion est tombée"""
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    return self._call(*args)
+                except (OSError, ConnectionError):
+                    self._close()
+                    if attempt:
+                        raise
+
+
+class RedisBackend:
+    """Cache partagé via un serveur Redis (ou compatible RESP)
+
+    Les expirations sont portées par Redis (SET ... PX); l'éviction LRU dépend
+    de la politique `maxmemory-policy` du serveur (allkeys-lru recommandé).
+    """
+
+    name = 'redis'
+    SCAN_COUNT = 500
+
+    def __init__(self, url: str, namespace: str, prefix: str = CACHE_KEY_PREFIX):
+        self.url = url
+        self.namespace = namespace
+        self.key_prefix = f"{prefix}:{namespace}:"
+        self.client = RespClient(url)
+
+    def _key(self, key: str) -> str:
+        return self.key_prefix + key
+
+    def _scan_keys(self) -> List[bytes]:
+        keys = []
+        cursor = b'0'
+        while True:
+            cursor, batch = self.client.execute('SCAN', cursor, 'MATCH', self.key_prefix + '*', 'COUNT', self.SCAN_COUNT)
+            keys.extend(batch)
+            if cursor in (b'0', 0, '0'):
+                return keys
+
+    def get(self, key: str) -> Optional[Dict]:
+        raw = self.client.execute('GET', self._key(key))
+        if raw is None:
+            return None
+        entry = json.loads(raw)
+        if entry['refresh_after'] <= time.time():
+            return None
+        return entry
+
+    def put(self, key: str, entry: Dict) -> None:
+        ttl_ms = int((entry['refresh_after'] - time.time()) * 1000)
+        if ttl_ms <= 0:
+            return
+        self.client.execute('SET', self._key(key), json.dumps(entry, separators=(',', ':')), 'PX', ttl_ms)
+
+    def delete(self, key: str) -> bool:
+        return self.client.execute('DEL', self._key(key)) > 0
+
+    def clear(self) -> int:
+        keys = self._scan_keys()
+        deleted = 0
+        for start in range(0, len(keys), self.SCAN_COUNT):
+            deleted += self.client.execute('DEL', *keys[start:start + self.SCAN_COUNT])
+        return deleted
+
+    def purge_expired(self) -> int:
+        # Redis expire les clés lui-même
+        return 0
+
+    def items(self) -> List[Tuple[str, Dict]]:
+        keys = self._scan_keys()
+        items = []
+        for start in range(0, len(keys), self.SCAN_COUNT):
+            batch = keys[start:start + self.SCAN_COUNT]
+            for raw_key, raw in zip(batch, self.client.execute('MGET', *batch)):
+                if raw is not None:
+                    items.append((raw_key.decode('utf-8')[len(self.key_prefix):], json.loads(raw)))
+        return items
+
+    def __len__(self) -> int:
+        return len(self._scan_keys())
+
+    def get_stats(self) -> Dict:
+        parsed = urlparse(self.url)
+        return {
+            'backend': self.name,
+            'server': f"{parsed.hostname}:{parsed.port or 6379}",
+            'key_prefix': self.key_prefix,
+            'total_entries': len(self)
+        }
+
+
+def create_backend(namespace: str, max_entries: int, max_bytes: int, kind: Optional[str] = None):
+    """Construit le backend configuré (CACHE_BACKEND: memory | sqlite | redis)
+
+    Un backend mal configuré (fichier SQLite inaccessible, REDIS_URL invalide)
+    ne bloque pas le démarrage: le cache passe en mémoire.
+    """
+    kind = (kind or CACHE_BACKEND).lower()
+    try:
+        if kind == 'sqlite':
+            logging.info(f"Cache {namespace}: backend SQLite ({CACHE_SQLITE_PATH})")
+            return SQLiteBackend(CACHE_SQLITE_PATH, namespace, max_entries, max_bytes)
+        if kind == 'redis':
+            logging.info(f"Cache {namespace}: backend Redis ({urlparse(REDIS_URL).hostname})")
+            return RedisBackend(REDIS_URL, namespace)
+    except Exception as e:
+        logging.error(f"❌ Backend de cache {kind} inutilisable pour {namespace} ({e}), utilisation de la mémoire")
+        return MemoryBackend(max_entries, max_bytes)
+    if kind != 'memory':
+        logging.warning(f"Backend de cache inconnu '{kind}', utilisation de la mémoire")
+    return MemoryBackend(max_entries, max_bytes)
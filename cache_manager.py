@@ -1,61 +1,451 @@
 import os
 import time
 import hashlib
-from typing import Optional, Dict
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Optional, Dict, Tuple
+from urllib.parse import urlparse, parse_qs
 import logging
+from cache_backends import create_backend
+from refresh_ahead import RefreshAhead
+from prefetch import StreamPrefetcher
+from http_caching import serialize_json
+from snapshot_files import list_snapshots, read_snapshot, snapshot_path, write_snapshot
+
+# Marge de sécurité (secondes) retirée à l'expiration réelle d'une URL signée
+STREAM_URL_SAFETY_MARGIN = int(os.getenv("STREAM_URL_SAFETY_MARGIN", 600))
+
+# Bornes par défaut du cache des URLs de streaming
+STREAM_CACHE_MAX_ENTRIES = int(os.getenv("STREAM_CACHE_MAX_ENTRIES", 5000))
+STREAM_CACHE_MAX_BYTES = int(os.getenv("STREAM_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+
+# Sauvegarde du cache mémoire sur disque (0 = seulement à l'arrêt)
+CACHE_SNAPSHOT_DIR = os.getenv("CACHE_SNAPSHOT_DIR", "cache_snapshots")
+CACHE_SNAPSHOT_INTERVAL = int(os.getenv("CACHE_SNAPSHOT_INTERVAL", 300))
+# Snapshots plus vieux ignorés et supprimés au démarrage (secondes)
+CACHE_SNAPSHOT_MAX_AGE = int(os.getenv("CACHE_SNAPSHOT_MAX_AGE", 24 * 3600))
+# Snapshots d'autres processus gardés pour un même cache, les plus récents
+CACHE_SNAPSHOT_KEEP = int(os.getenv("CACHE_SNAPSHOT_KEEP", 8))
+
+
+def parse_url_expiry(audio_url: str) -> Optional[float]:
+    """Extrait le timestamp d'expiration d'une URL googlevideo (paramètre `expire`)"""
+    try:
+        parsed = urlparse(audio_url)
+        values = parse_qs(parsed.query).get('expire')
+        if not values:
+            # Certaines URLs portent les paramètres dans le chemin: /videoplayback/expire/<ts>/...
+            parts = parsed.path.split('/')
+            if 'expire' in parts:
+                index = parts.index('expire')
+                values = parts[index + 1:index + 2]
+        if values:
+            return float(values[0])
+    except (ValueError, TypeError):
+        pass
+    return None
+
+
+def compute_expiry(audio_url: str, default_ttl: int, safety_margin: int = STREAM_URL_SAFETY_MARGIN,
+                   now: Optional[float] = None) -> Tuple[float, float]:
+    """Retourne (expires_at, refresh_after) pour une URL audio
+
+    - expires_at: expiration réelle de l'URL si elle est signée, sinon now + default_ttl
+    - refresh_after: date après laquelle l'entrée n'est plus servie depuis le cache
+
+    Une URL signée déjà expirée donne (expire, expire): rien à mettre en cache.
+    """
+    now = time.time() if now is None else now
+    expire = parse_url_expiry(audio_url)
+    if expire is None:
+        expires_at = now + default_ttl
+        return expires_at, expires_at
+    if expire <= now:
+        return expire, expire
+    return expire, max(now, expire - safety_margin)
+
+
+_INTERNAL_FIELDS = ('url', 'timestamp', 'expires_at', 'refresh_after')
+
+
+def build_stream_entry(audio_url: str, default_ttl: int, safety_margin: int = STREAM_URL_SAFETY_MARGIN,
+                       **fields) -> Dict:
+    """Construit une entrée de cache pour une URL audio avec son expiration"""
+    now = time.time()
+    expires_at, refresh_after = compute_expiry(audio_url, default_ttl, safety_margin, now)
+    return {
+        **fields,
+        'url': audio_url,
+        'timestamp': now,
+        'expires_at': expires_at,
+        'refresh_after': refresh_after
+    }
+
+
+def entry_metadata(entry: Dict) -> Dict:
+    """Champs métier d'une entrée, sans les champs internes du cache"""
+    return {key: value for key, value in entry.items() if key not in _INTERNAL_FIELDS}
+
+
+def expiry_info(entry: Dict, now: Optional[float] = None) -> Dict:
+    """Champs d'expiration à renvoyer aux clients"""
+    now = time.time() if now is None else now
+    return {
+        'expires_at': entry['expires_at'],
+        'refresh_after': entry['refresh_after'],
+        'expires_in': max(0.0, entry['refresh_after'] - now)
+    }
+
 
 class AudioCacheManager:
-    """Gestionnaire de cache pour les URLs audio"""
-    
-    def __init__(self, cache_duration: int = 3600):  # 1 heure par défaut
-        self.cache: Dict[str, Dict] = {}
+    """Cache des URLs audio (LRU + TTL) au-dessus d'un backend interchangeable
+
+    Le backend (mémoire, SQLite ou Redis) est choisi par CACHE_BACKEND; voir
+    cache_backends. Une panne du backend est traitée comme un défaut de cache.
+    """
+
+    def __init__(self, cache_duration: int = 3600, safety_margin: int = STREAM_URL_SAFETY_MARGIN,
+                 refresher: Optional[RefreshAhead] = None,
+                 loader: Optional[Callable[[str], Optional[Dict]]] = None,
+                 max_entries: int = STREAM_CACHE_MAX_ENTRIES,
+                 max_bytes: int = STREAM_CACHE_MAX_BYTES,
+                 namespace: str = 'stream',
+                 backend=None,
+                 prefetcher: Optional[StreamPrefetcher] = None):
+        # Durée utilisée quand l'URL ne porte pas sa propre expiration
         self.cache_duration = cache_duration
-        
-    def _is_expired(self, timestamp: float) -> bool:
-        """Vérifie si un élément du cache a expiré"""
-        return time.time() - timestamp > self.cache_duration
-    
+        self.safety_margin = safety_margin
+        # Refresh-ahead: loader(video_id) renvoie {'audio_url': ..., **métadonnées} ou None
+        self.refresher = refresher
+        self.loader = loader
+        # Préchargement des premiers titres des playlists
+        self.prefetcher = prefetcher
+        self.backend = backend if backend is not None else create_backend(namespace, max_entries, max_bytes)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # Réponses JSON déjà sérialisées, par video_id: (url, refresh_after, corps sans expires_in)
+        self._bodies: "OrderedDict[str, Tuple[str, float, bytes]]" = OrderedDict()
+        self._body_reuses = 0
+        self._body_builds = 0
+        self._hits = 0
+        self._misses = 0
+        self._backend_errors = 0
+
+    def _backend_failed(self, operation: str, error: Exception) -> None:
+        with self._lock:
+            self._backend_errors += 1
+        logging.warning(f"⚠️ Cache {self.backend.name} indisponible ({operation}): {str(error)[:100]}")
+
+    def get_entry(self, video_id: str) -> Optional[Dict]:
+        """Récupère l'entrée complète (URL, métadonnées, expiration) du cache"""
+        try:
+            cache_entry = self.backend.get(video_id)
+        except Exception as e:
+            self._backend_failed('get', e)
+            cache_entry = None
+
+        with self._lock:
+            if cache_entry is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+
+        logging.info(f"Cache hit pour {video_id}")
+        if self.prefetcher:
+            self.prefetcher.mark_used(video_id)
+        if self.refresher and self.loader:
+            self.refresher.maybe_refresh(video_id, cache_entry, self._refresh)
+        return cache_entry
+
+    def get_response_body(self, video_id: str, fields: Callable[[Dict], Dict]) -> Optional[bytes]:
+        """Corps JSON de la réponse servie depuis le cache, ou None
+
+        La réponse vaut {**fields(entry), **expiry_info(entry)}. Seul expires_in
+        dépend de l'heure: le reste est sérialisé une fois par entrée, puis réutilisé.
+        """
+        cache_entry = self.get_entry(video_id)
+        if cache_entry is None:
+            return None
+
+        with self._lock:
+            memo = self._bodies.get(video_id)
+            if memo and memo[0] == cache_entry['url'] and memo[1] == cache_entry['refresh_after']:
+                self._bodies.move_to_end(video_id)
+                self._body_reuses += 1
+                prefix = memo[2]
+            else:
+                prefix = None
+
+        if prefix is None:
+            prefix = serialize_json({
+                **fields(cache_entry),
+                'expires_at': cache_entry['expires_at'],
+                'refresh_after': cache_entry['refresh_after']
+            })[:-1]
+            with self._lock:
+                self._bodies[video_id] = (cache_entry['url'], cache_entry['refresh_after'], prefix)
+                self._bodies.move_to_end(video_id)
+                while len(self._bodies) > self.max_entries:
+                    self._bodies.popitem(last=False)
+                self._body_builds += 1
+
+        expires_in = max(0.0, cache_entry['refresh_after'] - time.time())
+        return prefix + b',"expires_in":' + serialize_json(expires_in) + b'}'
+
     def get(self, video_id: str) -> Optional[str]:
         """Récupère une URL audio du cache"""
-        if video_id in self.cache:
-            cache_entry = self.cache[video_id]
-            if not self._is_expired(cache_entry['timestamp']):
-                logging.info(f"Cache hit pour {video_id}")
-                return cache_entry['url']
-            else:
-                # Supprimer l'entrée expirée
-                del self.cache[video_id]
-                logging.info(f"Cache expiré pour {video_id}")
-        
-        return None
-    
-    def set(self, video_id: str, audio_url: str) -> None:
-        """Ajoute une URL audio au cache"""
-        self.cache[video_id] = {
-            'url': audio_url,
-            'timestamp': time.time()
-        }
+        cache_entry = self.get_entry(video_id)
+        return cache_entry['url'] if cache_entry else None
+
+    def contains(self, video_id: str) -> bool:
+        """L'entrée est-elle en cache ? (sans compter de hit ni de miss)"""
+        try:
+            return self.backend.get(video_id) is not None
+        except Exception as e:
+            self._backend_failed('get', e)
+            return False
+
+    def set(self, video_id: str, audio_url: str, **metadata) -> Dict:
+        """Ajoute une URL audio au cache, avec l'expiration déduite de l'URL
+
+        Une URL déjà expirée (ou dans sa marge de sécurité) n'est pas stockée;
+        l'entrée est retournée quand même, avec expires_in à 0.
+        """
+        cache_entry = build_stream_entry(audio_url, self.cache_duration, self.safety_margin, **metadata)
+        if cache_entry['refresh_after'] <= cache_entry['timestamp']:
+            logging.warning(f"⚠️ URL déjà expirée pour {video_id}, non mise en cache")
+            return cache_entry
+        self.put_entry(video_id, cache_entry)
         logging.info(f"Cache mis à jour pour {video_id}")
-    
+        return cache_entry
+
+    def put_entry(self, video_id: str, cache_entry: Dict) -> None:
+        """Insère une entrée déjà construite (avec timestamp et expiration)"""
+        try:
+            self.backend.put(video_id, cache_entry)
+        except Exception as e:
+            self._backend_failed('put', e)
+
+    def delete(self, video_id: str) -> bool:
+        """Supprime une entrée du cache"""
+        try:
+            return self.backend.delete(video_id)
+        except Exception as e:
+            self._backend_failed('delete', e)
+            return False
+
+    def clear(self) -> int:
+        """Vide le cache et retourne le nombre d'entrées supprimées"""
+        try:
+            return self.backend.clear()
+        except Exception as e:
+            self._backend_failed('clear', e)
+            return 0
+
+    def items(self) -> List[Tuple[str, Dict]]:
+        """Copie des entrées valides, de la moins à la plus récemment utilisée"""
+        try:
+            return self.backend.items()
+        except Exception as e:
+            self._backend_failed('items', e)
+            return []
+
+    def __len__(self) -> int:
+        try:
+            return len(self.backend)
+        except Exception as e:
+            self._backend_failed('len', e)
+            return 0
+
+    def load(self, video_id: str) -> bool:
+        """Extrait l'URL via le loader et la met en cache; retourne True en cas de succès"""
+        result = self.loader(video_id)
+        if not result or not result.get('audio_url'):
+            return False
+        metadata = {key: value for key, value in result.items() if key != 'audio_url'}
+        cache_entry = self.set(video_id, result['audio_url'], **metadata)
+        return cache_entry['refresh_after'] > cache_entry['timestamp']
+
+    def _refresh(self, video_id: str) -> None:
+        """Ré-extrait une entrée en arrière-plan et remplace l'ancienne"""
+        self.load(video_id)
+
+    def prefetch(self, video_ids: List[str], count: Optional[int] = None,
+                 load: Optional[Callable[[str], bool]] = None) -> int:
+        """Précharge en arrière-plan les `count` premiers video_id absents du cache
+
+        `load` remplace le loader par défaut (par ex. pour passer par un single-flight).
+        """
+        if not self.prefetcher or not (load or self.loader):
+            return 0
+        return self.prefetcher.prefetch(video_ids, self.contains, load or self.load, count)
+
+    @property
+    def is_persistent(self) -> bool:
+        """Le backend survit-il au redémarrage du processus (SQLite, Redis) ?"""
+        return self.backend.name != 'memory'
+
+    def snapshot(self, path: str) -> int:
+        """Écrit les entrées valides dans un fichier JSON compressé (écriture atomique)"""
+        now = time.time()
+        entries = [[key, entry] for key, entry in self.items() if entry['refresh_after'] > now]
+        write_snapshot(path, now, entries)
+        return len(entries)
+
+    def restore(self, path: str) -> Tuple[int, int]:
+        """Recharge un snapshot; retourne (entrées restaurées, entrées expirées ignorées)"""
+        data = read_snapshot(path)
+        now = time.time()
+        restored = skipped = 0
+        for key, entry in data['entries']:
+            if entry['refresh_after'] <= now:
+                skipped += 1
+                continue
+            self.put_entry(key, entry)
+            restored += 1
+        return restored, skipped
+
     def clear_expired(self) -> None:
         """Nettoie les entrées expirées du cache"""
-        expired_keys = [
-            key for key, value in self.cache.items()
-            if self._is_expired(value['timestamp'])
-        ]
-        
-        for key in expired_keys:
-            del self.cache[key]
-        
-        if expired_keys:
-            logging.info(f"Nettoyage du cache: {len(expired_keys)} entrées supprimées")
-    
+        try:
+            purged = self.backend.purge_expired()
+        except Exception as e:
+            self._backend_failed('purge', e)
+            return
+
+        if purged:
+            logging.info(f"Nettoyage du cache: {purged} entrées supprimées")
+
     def get_cache_stats(self) -> Dict:
         """Retourne les statistiques du cache"""
-        return {
-            'total_entries': len(self.cache),
-            'cache_duration': self.cache_duration
-        }
+        try:
+            backend_stats = self.backend.get_stats()
+        except Exception as e:
+            self._backend_failed('stats', e)
+            backend_stats = {'backend': self.backend.name, 'error': str(e)[:100]}
+
+        with self._lock:
+            return {
+                **backend_stats,
+                'hits': self._hits,
+                'misses': self._misses,
+                'backend_errors': self._backend_errors,
+                'serialized_bodies': {
+                    'entries': len(self._bodies),
+                    'reused': self._body_reuses,
+                    'built': self._body_builds
+                },
+                'cache_duration': self.cache_duration,
+                'safety_margin': self.safety_margin,
+                'refresh_ahead': self.refresher.get_stats() if self.refresher else None,
+                'prefetch': self.prefetcher.get_stats() if self.prefetcher else None
+            }
+
+class CacheSnapshotter:
+    """Sauvegarde périodique et à l'arrêt d'un cache en mémoire
+
+    `manager` expose snapshot(path), restore(path) -> (restaurées, ignorées)
+    et is_persistent: AudioCacheManager, MetadataCache.
+
+    Chaque processus écrit son propre fichier `{name}.{pid}.json.gz`: des
+    workers ou des applications qui partagent CACHE_SNAPSHOT_DIR ne
+    s'écrasent pas. `name` doit donc identifier l'application et le cache
+    (ex. 'streaming_main.stream'). start() recharge les snapshots récents de
+    ce cache, du plus ancien au plus récent, supprime ceux qui ont dépassé
+    max_age et ne garde que les `keep` plus récents des autres processus,
+    puis lance la sauvegarde périodique; stop() l'arrête et écrit un dernier
+    snapshot. Sans effet pour les backends déjà persistants (SQLite, Redis).
+    """
+
+    def __init__(self, manager, name: str,
+                 directory: str = CACHE_SNAPSHOT_DIR, interval: int = CACHE_SNAPSHOT_INTERVAL,
+                 max_age: int = CACHE_SNAPSHOT_MAX_AGE, keep: int = CACHE_SNAPSHOT_KEEP):
+        self.manager = manager
+        self.name = name
+        self.directory = directory
+        self.interval = interval
+        self.max_age = max_age
+        self.keep = keep
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def path(self) -> str:
+        """Fichier de ce processus (le pid est relu: un worker forké n'écrit pas dans celui du parent)"""
+        return snapshot_path(self.directory, self.name, os.getpid())
+
+    def start(self) -> None:
+        if self.manager.is_persistent or self._thread is not None:
+            return
+        self._load()
+        if self.interval > 0:
+            self._thread = threading.Thread(target=self._run, name="cache-snapshot", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        if self.manager.is_persistent:
+            return
+        self._stop_event.set()
+        self.save()
+
+    def save(self) -> None:
+        path = self.path
+        try:
+            started = time.perf_counter()
+            count = self.manager.snapshot(path)
+            logging.info(f"💾 Snapshot du cache {self.name}: {count} entrées en {(time.perf_counter() - started) * 1000:.1f} ms")
+        except Exception as e:
+            logging.warning(f"❌ Échec snapshot du cache ({path}): {e}")
+
+    def _load(self) -> None:
+        paths = list_snapshots(self.directory, self.name)
+        if not paths:
+            logging.info(f"Aucun snapshot de cache à restaurer ({self.name} dans {self.directory})")
+            return
+
+        now = time.time()
+        own_path = self.path
+        recent = []
+        for path in paths:
+            try:
+                too_old = now - os.path.getmtime(path) > self.max_age
+            except OSError:
+                continue
+            if too_old:
+                self._remove(path)
+            else:
+                recent.append(path)
+        # Les plus anciens d'abord: une clé présente dans plusieurs snapshots garde la valeur la plus récente
+        others = [path for path in recent if path != own_path]
+        for path in others[:-self.keep] if self.keep > 0 else others:
+            self._remove(path)
+            recent.remove(path)
+
+        started = time.perf_counter()
+        restored = skipped = 0
+        for path in recent:
+            try:
+                path_restored, path_skipped = self.manager.restore(path)
+            except Exception as e:
+                logging.warning(f"❌ Snapshot de cache illisible ({path}): {e}")
+                continue
+            restored += path_restored
+            skipped += path_skipped
+        logging.info(
+            f"♻️ Cache {self.name} restauré depuis {len(recent)} snapshot(s): {restored} entrées, "
+            f"{skipped} expirées ignorées, en {(time.perf_counter() - started) * 1000:.1f} ms"
+        )
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            self.save()
 
 # Instance globale du gestionnaire de cache
-audio_cache = AudioCacheManager()
\ No newline at end of file
+audio_cache = AudioCacheManager()
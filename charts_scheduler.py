@@ -0,0 +1,135 @@
+"""
+Charts YouTube Music rafraîchis en arrière-plan et servis depuis la mémoire
+
+Les charts changent lentement: un thread les recharge pour chaque pays
+configuré toutes les `interval` secondes et garde la réponse JSON déjà
+sérialisée. Un échec côté YouTube Music conserve le snapshot précédent.
+"""
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+from http_caching import make_etag, remaining_max_age, serialize_json
+
+# Pays rafraîchis en arrière-plan (ZZ = monde) et intervalle de rafraîchissement
+CHARTS_COUNTRIES = [c.strip().upper() for c in os.getenv("CHARTS_COUNTRIES", "ZZ,US,FR,GB").split(',') if c.strip()]
+CHARTS_REFRESH_INTERVAL = int(os.getenv("CHARTS_REFRESH_INTERVAL", 1800))
+
+
+def normalize_country(country: Optional[str]) -> Optional[str]:
+    """Code pays ISO 3166-1 alpha-2 en majuscules (ZZ par défaut), ou None s'il est invalide"""
+    country = (country or 'ZZ').strip().upper()
+    return country if len(country) == 2 and country.isalpha() else None
+
+
+def serialize_charts(charts: Any) -> bytes:
+    return serialize_json(charts)
+
+
+def snapshot_headers(snapshot: Dict) -> Dict[str, str]:
+    """En-têtes indiquant l'âge des données servies"""
+    return {
+        'Age': str(int(snapshot['age'])),
+        'X-Charts-Country': snapshot['country'],
+        'X-Charts-Fetched-At': str(int(snapshot['fetched_at']))
+    }
+
+
+class ChartsScheduler:
+    """Snapshots des charts par pays, rechargés périodiquement par un thread
+
+    fetch(country) appelle YouTube Music (bloquant) et retourne les charts.
+    """
+
+    def __init__(self, fetch: Callable[[str], Any], countries: List[str] = CHARTS_COUNTRIES,
+                 interval: int = CHARTS_REFRESH_INTERVAL):
+        self.fetch = fetch
+        self.countries = countries
+        self.interval = interval
+        self._snapshots: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._refreshes = 0
+        self._failures = 0
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="charts-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            for country in self.countries:
+                if self._stop_event.is_set():
+                    return
+                self.refresh(country)
+            self._stop_event.wait(self.interval)
+
+    def refresh(self, country: str) -> bool:
+        """Recharge les charts d'un pays; en cas d'échec le snapshot précédent reste servi"""
+        started = time.perf_counter()
+        try:
+            charts = self.fetch(country)
+            if not charts:
+                raise ValueError("réponse vide")
+            body = serialize_charts(charts)
+            etag = make_etag(body)
+        except Exception as e:
+            with self._lock:
+                self._failures += 1
+                previous = self._snapshots.get(country)
+                if previous:
+                    previous['last_error'] = str(e)[:200]
+                    previous['last_error_at'] = time.time()
+            logging.warning(f"❌ Échec rafraîchissement charts {country}, snapshot précédent conservé: {str(e)[:100]}")
+            return False
+
+        with self._lock:
+            self._refreshes += 1
+            self._snapshots[country] = {
+                'country': country,
+                'body': body,
+                'etag': etag,
+                'fetched_at': time.time(),
+                'last_error': None,
+                'last_error_at': None
+            }
+        logging.info(f"📊 Charts {country} rafraîchis en {(time.perf_counter() - started) * 1000:.0f} ms ({len(body)} octets)")
+        return True
+
+    def get(self, country: str) -> Optional[Dict]:
+        """Snapshot d'un pays (body JSON sérialisé, fetched_at, age), ou None"""
+        with self._lock:
+            snapshot = self._snapshots.get(country)
+            if snapshot is None:
+                return None
+            return {**snapshot, 'age': time.time() - snapshot['fetched_at']}
+
+    def max_age(self, snapshot: Dict) -> int:
+        """Cache-Control max-age d'un snapshot: temps restant avant le prochain rafraîchissement"""
+        return remaining_max_age(self.interval, snapshot['fetched_at'])
+
+    def get_stats(self) -> Dict:
+        """Retourne les statistiques du planificateur de charts"""
+        now = time.time()
+        with self._lock:
+            return {
+                'countries': self.countries,
+                'interval_seconds': self.interval,
+                'refreshes': self._refreshes,
+                'failures': self._failures,
+                'snapshots': {
+                    country: {
+                        'age_seconds': round(now - snapshot['fetched_at'], 1),
+                        'size_bytes': len(snapshot['body']),
+                        'last_error': snapshot['last_error']
+                    }
+                    for country, snapshot in self._snapshots.items()
+                }
+            }
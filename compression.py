@@ -0,0 +1,318 @@
+"""
+Compression des réponses (brotli, gzip) négociée sur Accept-Encoding
+
+- en dessous de COMPRESSION_MIN_SIZE octets la réponse part telle quelle
+- brotli est préféré quand le module `brotli` est installé, sinon gzip
+- une réponse qui porte un ETag (corps venant d'un cache: métadonnées,
+  charts, recherche) est compressée une fois par encodage puis resservie
+  depuis un stock borné en octets; son ETag devient faible (W/), comme le
+  fait nginx, pour rester valide quel que soit l'encodage négocié
+
+CompressionMiddleware branche la compression sur une app ASGI (FastAPI);
+l'app Flask appelle compress_flask_response() dans un after_request. Les
+réponses conditionnelles passent par conditional_compressed_json(): un 304
+porte le même ETag (faible ou fort) que le 200 que ce client aurait reçu.
+"""
+import gzip
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from http_caching import conditional_json
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", 1024))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", 6))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", 5))
+# Corps compressés gardés pour les réponses à ETag
+COMPRESSION_CACHE_MAX_BYTES = int(os.getenv("COMPRESSION_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+COMPRESSIBLE_TYPES = ('application/json', 'text/', 'application/javascript', 'application/xml')
+
+
+def is_compressible(content_type: Optional[str]) -> bool:
+    return bool(content_type) and content_type.lower().startswith(COMPRESSIBLE_TYPES)
+
+
+def parse_accept_encoding(accept_encoding: Optional[str]) -> Dict[str, float]:
+    """'gzip, br;q=0.8, *;q=0' -> {'gzip': 1.0, 'br': 0.8, '*': 0.0}"""
+    weights = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        weights[name] = quality
+    return weights
+
+
+def weak_etag(etag: str) -> str:
+    return etag if etag.startswith('W/') else 'W/' + etag
+
+
+class ResponseCompressor:
+    """Négociation, compression et stock des corps compressés, avec métriques"""
+
+    def __init__(self, min_size: int = COMPRESSION_MIN_SIZE, gzip_level: int = GZIP_LEVEL,
+                 brotli_quality: int = BROTLI_QUALITY, cache_max_bytes: int = COMPRESSION_CACHE_MAX_BYTES):
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.cache_max_bytes = cache_max_bytes
+        # Encodages proposés, par ordre de préférence du serveur
+        self.encodings = ['br', 'gzip'] if brotli else ['gzip']
+        self._store: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+        self._store_bytes = 0
+        self._lock = threading.Lock()
+        self._metrics = {
+            encoding: {'responses': 0, 'bytes_in': 0, 'bytes_out': 0, 'cpu_seconds': 0.0}
+            for encoding in self.encodings
+        }
+        self._store_hits = 0
+        self._below_threshold = 0
+        self._not_smaller = 0
+
+    def negotiate(self, accept_encoding: Optional[str]) -> Optional[str]:
+        """Meilleur encodage accepté par le client, ou None (identité)"""
+        weights = parse_accept_encoding(accept_encoding)
+        best, best_quality = None, 0.0
+        for encoding in self.encodings:
+            quality = weights.get(encoding, weights.get('*', 0.0))
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    def compress(self, body: bytes, encoding: str) -> bytes:
+        """Compresse un corps en mesurant le temps CPU du thread appelant"""
+        started = time.thread_time()
+        if encoding == 'br':
+            compressed = brotli.compress(body, quality=self.brotli_quality)
+        else:
+            compressed = gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+        cpu = time.thread_time() - started
+        with self._lock:
+            metrics = self._metrics[encoding]
+            metrics['responses'] += 1
+            metrics['bytes_in'] += len(body)
+            metrics['bytes_out'] += len(compressed)
+            metrics['cpu_seconds'] += cpu
+        return compressed
+
+    def _stored(self, key: Tuple[str, str]) -> Optional[bytes]:
+        with self._lock:
+            compressed = self._store.get(key)
+            if compressed is not None:
+                self._store.move_to_end(key)
+                self._store_hits += 1
+            return compressed
+
+    def _remember(self, key: Tuple[str, str], compressed: bytes) -> None:
+        if len(compressed) > self.cache_max_bytes:
+            return
+        with self._lock:
+            previous = self._store.pop(key, None)
+            if previous is not None:
+                self._store_bytes -= len(previous)
+            self._store[key] = compressed
+            self._store_bytes += len(compressed)
+            while self._store_bytes > self.cache_max_bytes:
+                _, evicted = self._store.popitem(last=False)
+                self._store_bytes -= len(evicted)
+
+    def encode(self, accept_encoding: Optional[str], body: bytes,
+               etag: Optional[str] = None) -> Tuple[bytes, Optional[str], Dict[str, str]]:
+        """(corps, etag, en-têtes à ajouter) de la réponse à envoyer
+
+        Avec un ETag fort, le corps compressé est repris du stock s'il y est déjà
+        (un ETag faible ne désigne pas des octets exacts: pas de stock).
+        """
+        if len(body) < self.min_size:
+            with self._lock:
+                self._below_threshold += 1
+            return body, etag, {}
+
+        headers = {'Vary': 'Accept-Encoding'}
+        encoding = self.negotiate(accept_encoding)
+        if encoding is None:
+            return body, etag, headers
+
+        key = (etag, encoding) if etag and not etag.startswith('W/') else None
+        compressed = self._stored(key) if key else None
+        if compressed is None:
+            compressed = self.compress(body, encoding)
+            if key:
+                self._remember(key, compressed)
+        if len(compressed) >= len(body):
+            with self._lock:
+                self._not_smaller += 1
+            return body, etag, headers
+
+        headers['Content-Encoding'] = encoding
+        return compressed, weak_etag(etag) if etag else None, headers
+
+    def get_stats(self) -> Dict:
+        """Retourne les statistiques de compression"""
+        with self._lock:
+            by_encoding = {}
+            for encoding, metrics in self._metrics.items():
+                responses = metrics['responses']
+                by_encoding[encoding] = {
+                    'compressions': responses,
+                    'bytes_in': metrics['bytes_in'],
+                    'bytes_out': metrics['bytes_out'],
+                    'ratio': round(metrics['bytes_in'] / metrics['bytes_out'], 2) if metrics['bytes_out'] else None,
+                    'cpu_ms_total': round(metrics['cpu_seconds'] * 1000, 1),
+                    'cpu_ms_avg': round(metrics['cpu_seconds'] * 1000 / responses, 3) if responses else None
+                }
+            return {
+                'encodings': list(self.encodings),
+                'min_size': self.min_size,
+                'gzip_level': self.gzip_level,
+                'brotli_quality': self.brotli_quality if brotli else None,
+                'by_encoding': by_encoding,
+                'precompressed': {
+                    'entries': len(self._store),
+                    'bytes': self._store_bytes,
+                    'max_bytes': self.cache_max_bytes,
+                    'hits': self._store_hits
+                },
+                'below_threshold': self._below_threshold,
+                'not_smaller': self._not_smaller
+            }
+
+
+class CompressionMiddleware:
+    """Middleware ASGI: compresse les réponses JSON/texte d'un seul bloc
+
+    Les réponses en flux (StreamingResponse, NDJSON) et celles qui ont déjà
+    un Content-Encoding passent sans modification.
+    """
+
+    def __init__(self, app, compressor: Optional[ResponseCompressor] = None):
+        self.app = app
+        self.compressor = compressor or response_compressor
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = None
+        for name, value in scope.get('headers', []):
+            if name == b'accept-encoding':
+                accept_encoding = value.decode('latin-1')
+        if not accept_encoding:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message['type'] == 'http.response.start':
+                start = message
+                return
+            if message['type'] != 'http.response.body' or start is None:
+                await send(message)
+                return
+
+            headers = _header_dict(start['headers'])
+            if (message.get('more_body') or 'content-encoding' in headers
+                    or not is_compressible(headers.get('content-type'))):
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+
+            body, etag, added = self.compressor.encode(accept_encoding, message.get('body', b''), headers.get('etag'))
+            await send({**start, 'headers': _rewrite_headers(start['headers'], body, etag, added)})
+            await send({'type': 'http.response.body', 'body': body})
+
+        await self.app(scope, receive, send_compressed)
+
+
+def _header_dict(raw_headers: List[Tuple[bytes, bytes]]) -> Dict[str, str]:
+    return {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in raw_headers}
+
+
+def _rewrite_headers(raw_headers: List[Tuple[bytes, bytes]], body: bytes, etag: Optional[str],
+                     added: Dict[str, str]) -> List[Tuple[bytes, bytes]]:
+    """En-têtes ASGI avec Content-Length, ETag, Vary et Content-Encoding mis à jour"""
+    vary = added.pop('Vary', None)
+    rewritten = []
+    for name, value in raw_headers:
+        lowered = name.lower()
+        if lowered in (b'content-length', b'etag'):
+            continue
+        if lowered == b'vary' and vary:
+            value = value + b', ' + vary.encode('latin-1')
+            vary = None
+        rewritten.append((name, value))
+    rewritten.append((b'content-length', str(len(body)).encode('latin-1')))
+    if etag:
+        rewritten.append((b'etag', etag.encode('latin-1')))
+    if vary:
+        rewritten.append((b'vary', vary.encode('latin-1')))
+    for name, value in added.items():
+        rewritten.append((name.lower().encode('latin-1'), value.encode('latin-1')))
+    return rewritten
+
+
+def compress_flask_response(response, accept_encoding: Optional[str],
+                            compressor: Optional[ResponseCompressor] = None):
+    """after_request Flask: compresse la réponse si elle s'y prête (même règles que le middleware)"""
+    compressor = compressor or response_compressor
+    if (not accept_encoding or response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers or not is_compressible(response.content_type)):
+        return response
+
+    body, etag, added = compressor.encode(accept_encoding, response.get_data(), response.headers.get('ETag'))
+    vary = added.pop('Vary', None)
+    if vary:
+        response.vary.add(vary)
+    if 'Content-Encoding' in added:
+        response.set_data(body)
+        response.headers['Content-Encoding'] = added['Content-Encoding']
+        if etag:
+            response.headers['ETag'] = etag
+    return response
+
+
+def conditional_compressed_json(if_none_match: Optional[str], accept_encoding: Optional[str], body: bytes,
+                                etag: Optional[str], max_age: int, headers: Optional[Dict[str, str]] = None,
+                                compressor: Optional[ResponseCompressor] = None) -> Tuple[int, bytes, Dict[str, str]]:
+    """conditional_json() dont le 304 reprend l'ETag de la représentation négociée
+
+    Le 200 compressé part avec un ETag faible (W/): le 304 qui le revalide
+    doit renvoyer ce même validateur, et varier sur Accept-Encoding comme lui.
+    Le corps compressé est repris du stock (ETag fort), sans recompression.
+    """
+    status, sent, response_headers = conditional_json(if_none_match, body, etag, max_age, headers)
+    if status == 304:
+        compressor = compressor or response_compressor
+        _, representation_etag, added = compressor.encode(accept_encoding, body, response_headers['ETag'])
+        response_headers['ETag'] = representation_etag
+        if 'Vary' in added:
+            response_headers['Vary'] = added['Vary']
+    return status, sent, response_headers
+
+
+# Instance globale partagée par les apps
+response_compressor = ResponseCompressor()
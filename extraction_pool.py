@@ -0,0 +1,139 @@
+"""
+Pool borné pour exécuter les extractions yt-dlp hors de la boucle asyncio
+"""
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+
+class ExtractionUnavailable(Exception):
+    """Le pool `pool` n'a pas pu rendre de résultat (saturé ou trop lent)
+
+    `status_code` et `detail` décrivent la réponse HTTP, comme une
+    HTTPException: une réponse /stream et une ligne de lot disent la même chose.
+    """
+    status_code = 503
+
+    def __init__(self, message: str, pool: str = "extraction"):
+        super().__init__(message)
+        self.pool = pool
+
+    @property
+    def detail(self) -> str:
+        return f"{self.pool.capitalize()} service busy, retry later"
+
+
+class ExtractionOverloaded(ExtractionUnavailable):
+    """Toutes les places du pool (workers + file d'attente) sont occupées"""
+
+
+class ExtractionTimeout(ExtractionUnavailable):
+    """L'extraction a dépassé le délai autorisé"""
+    status_code = 504
+
+    @property
+    def detail(self) -> str:
+        return f"{self.pool.capitalize()} timed out"
+
+
+def install_exception_handlers(app) -> None:
+    """Réponses HTTP des erreurs de pool pour une application FastAPI
+
+    ExtractionOverloaded -> 503, ExtractionTimeout -> 504, quel que soit le
+    handler qui les laisse remonter. Un handler qui convertit les autres
+    erreurs en 500/404 doit donc laisser passer ExtractionUnavailable.
+    """
+    from fastapi.responses import JSONResponse
+
+    @app.exception_handler(ExtractionUnavailable)
+    async def extraction_unavailable(request, exc: ExtractionUnavailable):
+        return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail})
+
+
+class ExtractionPool:
+    """Exécute les fonctions bloquantes d'extraction dans un pool de threads borné
+
+    - `max_workers` extractions tournent en parallèle
+    - `max_queue` extractions supplémentaires peuvent attendre un worker
+    - au-delà, `run()` lève immédiatement ExtractionOverloaded
+    - chaque appel est limité à `timeout` secondes côté appelant
+    """
+
+    def __init__(self, max_workers: int = 4, max_queue: int = 16, timeout: float = 45.0,
+                 name: str = "extraction"):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.name = name
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._completed = 0
+        self._rejected = 0
+        self._timeouts = 0
+
+    def _release(self, _future) -> None:
+        with self._lock:
+            self._pending -= 1
+            self._completed += 1
+        self._slots.release()
+
+    async def run(self, func: Callable, *args, timeout: Optional[float] = None):
+        """Exécute func(*args) dans le pool et attend son résultat
+
+        `timeout` remplace le délai par défaut du pool pour cet appel.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise ExtractionOverloaded(f"Pool {self.name} saturé", self.name)
+
+        with self._lock:
+            self._pending += 1
+        try:
+            future = self._executor.submit(func, *args)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            self._slots.release()
+            raise
+        # La place n'est libérée qu'à la fin réelle du thread, même après un timeout
+        future.add_done_callback(self._release)
+
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self._timeouts += 1
+            logging.warning(f"⏱️ Appel {self.name} trop long (> {timeout}s), abandon côté requête")
+            raise ExtractionTimeout(f"{self.name.capitalize()} timeout after {timeout}s", self.name)
+
+    def get_stats(self) -> Dict:
+        """Retourne les statistiques du pool"""
+        with self._lock:
+            return {
+                'name': self.name,
+                'max_workers': self.max_workers,
+                'max_queue': self.max_queue,
+                'timeout_seconds': self.timeout,
+                'pending': self._pending,
+                'completed': self._completed,
+                'rejected': self._rejected,
+                'timeouts': self._timeouts
+            }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Instance globale, dimensionnée par variables d'environnement
+extraction_pool = ExtractionPool(
+    max_workers=int(os.getenv("EXTRACTION_WORKERS", 4)),
+    max_queue=int(os.getenv("EXTRACTION_QUEUE_SIZE", 16)),
+    timeout=float(os.getenv("EXTRACTION_TIMEOUT", 45))
+)
@@ -0,0 +1,74 @@
+"""
+Validateurs HTTP (ETag fort, If-None-Match) et Cache-Control pour les réponses JSON
+
+Fonctions indépendantes du framework: les apps FastAPI et Flask construisent
+leur propre objet Response à partir de conditional_json().
+"""
+import hashlib
+import json
+import time
+from typing import Any, Dict, Optional, Tuple
+
+try:
+    # Encodeur natif, plusieurs fois plus rapide que json sur les gros payloads ytmusicapi
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_ENCODER = 'orjson' if orjson else 'json'
+
+
+def serialize_json(payload: Any) -> bytes:
+    """Sérialisation JSON compacte (UTF-8), identique pour le calcul de l'ETag et la réponse"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(payload)
+        except TypeError:
+            # Clés non textuelles, entiers hors 64 bits...: le module json sait les encoder
+            pass
+    return json.dumps(payload, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def make_etag(body: bytes, weak: bool = False) -> str:
+    """ETag dérivé du contenu de la réponse: fort par défaut, faible (W/) pour un contenu équivalent"""
+    tag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+    return 'W/' + tag if weak else tag
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match correspond-il à l'ETag ? (comparaison faible, RFC 9110 §13.1.2)"""
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    opaque = etag[2:] if etag.startswith('W/') else etag
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def remaining_max_age(ttl: float, stored_at: float, now: Optional[float] = None) -> int:
+    """max-age restant d'une entrée de cache serveur (0 si elle est déjà périmée)"""
+    now = time.time() if now is None else now
+    return max(0, int(ttl - (now - stored_at)))
+
+
+def cache_headers(etag: Optional[str], max_age: int) -> Dict[str, str]:
+    headers = {'Cache-Control': f"public, max-age={max_age}"}
+    if etag:
+        headers['ETag'] = etag
+    return headers
+
+
+def conditional_json(if_none_match: Optional[str], body: bytes, etag: Optional[str],
+                     max_age: int, headers: Optional[Dict[str, str]] = None) -> Tuple[int, bytes, Dict[str, str]]:
+    """(statut, corps, en-têtes) d'une réponse JSON: 304 sans corps si le client a déjà cette version"""
+    etag = etag or make_etag(body)
+    response_headers = {**(headers or {}), **cache_headers(etag, max_age)}
+    if etag_matches(if_none_match, etag):
+        return 304, b'', response_headers
+    return 200, body, response_headers
@@ -0,0 +1,289 @@
+"""
+Cache stale-while-revalidate des métadonnées YouTube Music (chanson, playlist, charts)
+
+- entrée fraîche (âge < TTL du type): servie directement
+- entrée périmée mais plus jeune que l'âge maximal du type: servie
+  immédiatement, et un seul rafraîchissement part en arrière-plan
+- entrée absente ou trop vieille: chargée en ligne, une seule fois par clé
+  même si plusieurs requêtes arrivent en même temps
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from http_caching import make_etag, serialize_json
+from snapshot_files import read_snapshot, write_snapshot
+from single_flight import AsyncSingleFlight, SingleFlight
+
+# Durée de fraîcheur par type (secondes)
+METADATA_TTLS = {
+    'song': int(os.getenv("METADATA_TTL_SONG", 6 * 3600)),
+    'playlist': int(os.getenv("METADATA_TTL_PLAYLIST", 600)),
+    'charts': int(os.getenv("METADATA_TTL_CHARTS", 3600)),
+}
+# Âge maximal d'une donnée servie, rafraîchissement en cours ou non (secondes)
+METADATA_MAX_AGES = {
+    'song': int(os.getenv("METADATA_MAX_AGE_SONG", 24 * 3600)),
+    'playlist': int(os.getenv("METADATA_MAX_AGE_PLAYLIST", 3600)),
+    'charts': int(os.getenv("METADATA_MAX_AGE_CHARTS", 6 * 3600)),
+}
+METADATA_CACHE_MAX_ENTRIES = int(os.getenv("METADATA_CACHE_MAX_ENTRIES", 5000))
+
+FRESH, STALE, MISS = 'fresh', 'stale', 'miss'
+
+
+def json_entry(value: Any) -> Dict:
+    """Entrée de cache: valeur, corps JSON et ETag (None pour une valeur vide)"""
+    body = serialize_json(value) if value else None
+    return {
+        'value': value,
+        'body': body,
+        'etag': make_etag(body) if body is not None else None,
+        'timestamp': time.time()
+    }
+
+
+def entry_view(entry: Dict, key: Any, transform: Callable[[Any], Any], memoize: bool = True) -> Dict:
+    """Variante d'une entrée (ex. projection), sérialisée une fois puis gardée avec l'entrée
+
+    La vue hérite du timestamp de l'entrée: même fraîcheur, même Cache-Control.
+    Seules les variantes en nombre fini (profils nommés) doivent être gardées:
+    avec memoize=False (fields= choisis par le client), la vue est calculée
+    pour la requête et jamais stockée.
+    """
+    views = entry.setdefault('views', {})
+    view = views.get(key)
+    if view is None:
+        view = {**json_entry(transform(entry['value'])), 'timestamp': entry['timestamp']}
+        if memoize:
+            view = views.setdefault(key, view)
+    return view
+
+
+class MetadataCache:
+    """Cache LRU borné, avec TTL et âge maximal par type de ressource
+
+    get() sert le code synchrone (Flask), aget() les handlers asyncio (FastAPI).
+    Les variantes get_entry()/aget_entry() retournent l'entrée complète: valeur,
+    corps JSON et ETag calculés une seule fois, à l'enregistrement.
+    Les résultats vides (None, {}) et les erreurs ne sont jamais mis en cache;
+    un rafraîchissement en échec laisse l'ancienne valeur en place.
+    """
+
+    def __init__(self, ttls: Optional[Dict[str, int]] = None, max_ages: Optional[Dict[str, int]] = None,
+                 max_entries: int = METADATA_CACHE_MAX_ENTRIES, refresh_workers: int = 2):
+        self.ttls = ttls or METADATA_TTLS
+        self.max_ages = max_ages or METADATA_MAX_AGES
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._refresh_tasks = set()
+        self._executor = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix="metadata-refresh")
+        self._flight = SingleFlight()
+        self._async_flight = AsyncSingleFlight()
+        self._counts = {FRESH: 0, STALE: 0, MISS: 0}
+        self._too_old = 0
+        self._refreshes = 0
+        self._refresh_failures = 0
+        self._evictions = 0
+
+    def _lookup(self, kind: str, key: str) -> Tuple[str, Optional[Dict]]:
+        """(état, entrée): fresh, stale ou miss"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get((kind, key))
+            if entry is None:
+                state = MISS
+            else:
+                age = now - entry['timestamp']
+                if age < self.ttls[kind]:
+                    state = FRESH
+                elif age < self._max_age(kind):
+                    state = STALE
+                else:
+                    # Trop vieille pour être servie, même en attendant un rafraîchissement
+                    del self._entries[(kind, key)]
+                    self._too_old += 1
+                    state, entry = MISS, None
+            if entry is not None:
+                self._entries.move_to_end((kind, key))
+            self._counts[state] += 1
+            return state, entry
+
+    def _store(self, kind: str, key: str, value: Any) -> Dict:
+        """Enregistre la valeur avec son corps JSON et son ETag; les valeurs vides ne sont pas gardées"""
+        entry = json_entry(value)
+        if not value:
+            return entry
+        with self._lock:
+            self._entries[(kind, key)] = entry
+            self._entries.move_to_end((kind, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+        return entry
+
+    def _claim_refresh(self, kind: str, key: str) -> bool:
+        """Un seul rafraîchissement en arrière-plan par clé"""
+        with self._lock:
+            if (kind, key) in self._refreshing:
+                return False
+            self._refreshing.add((kind, key))
+            self._refreshes += 1
+            return True
+
+    def _refresh_done(self, kind: str, key: str, error: Optional[Exception]) -> None:
+        with self._lock:
+            self._refreshing.discard((kind, key))
+            if error is not None:
+                self._refresh_failures += 1
+        if error is not None:
+            logging.warning(f"❌ Échec rafraîchissement {kind} {key}, ancienne valeur conservée: {str(error)[:100]}")
+
+    # --- Code synchrone (Flask) ---
+
+    def get(self, kind: str, key: str, load: Callable[[], Any]) -> Any:
+        """Valeur en cache (éventuellement périmée) ou load() en ligne"""
+        return self.get_entry(kind, key, load)['value']
+
+    def get_entry(self, kind: str, key: str, load: Callable[[], Any]) -> Dict:
+        """Comme get(), mais retourne l'entrée (value, body, etag, timestamp)"""
+        state, entry = self._lookup(kind, key)
+        if state == STALE and self._claim_refresh(kind, key):
+            self._executor.submit(self._refresh, kind, key, load)
+        if state != MISS:
+            return entry
+        return self._flight.do(f"{kind}:{key}", self._load, kind, key, load)
+
+    def _load(self, kind: str, key: str, load: Callable[[], Any]) -> Dict:
+        return self._store(kind, key, load())
+
+    def _refresh(self, kind: str, key: str, load: Callable[[], Any]) -> None:
+        error = None
+        try:
+            self._store(kind, key, load())
+        except Exception as e:
+            error = e
+        finally:
+            self._refresh_done(kind, key, error)
+
+    # --- Handlers asyncio (FastAPI) ---
+
+    async def aget(self, kind: str, key: str, load: Callable[[], Awaitable[Any]]) -> Any:
+        """Comme get(), avec un chargeur asynchrone"""
+        return (await self.aget_entry(kind, key, load))['value']
+
+    async def aget_entry(self, kind: str, key: str, load: Callable[[], Awaitable[Any]]) -> Dict:
+        """Comme get_entry(), avec un chargeur asynchrone"""
+        state, entry = self._lookup(kind, key)
+        if state == STALE and self._claim_refresh(kind, key):
+            task = asyncio.ensure_future(self._arefresh(kind, key, load))
+            self._refresh_tasks.add(task)
+            task.add_done_callback(self._refresh_tasks.discard)
+        if state != MISS:
+            return entry
+
+        async def load_and_store():
+            return self._store(kind, key, await load())
+
+        return await self._async_flight.do(f"{kind}:{key}", load_and_store)
+
+    async def _arefresh(self, kind: str, key: str, load: Callable[[], Awaitable[Any]]) -> None:
+        error = None
+        try:
+            self._store(kind, key, await load())
+        except Exception as e:
+            error = e
+        finally:
+            self._refresh_done(kind, key, error)
+
+    # --- Snapshot sur disque (CacheSnapshotter) ---
+
+    is_persistent = False
+
+    def _max_age(self, kind: str) -> int:
+        return max(self.max_ages[kind], self.ttls[kind])
+
+    def snapshot(self, path: str) -> int:
+        """Écrit les valeurs encore servables avec leur date de chargement
+
+        Seules les valeurs sont écrites: corps JSON, ETag et vues sont
+        recalculés au chargement.
+        """
+        now = time.time()
+        with self._lock:
+            entries = [
+                [kind, key, entry['timestamp'], entry['value']]
+                for (kind, key), entry in self._entries.items()
+                if now - entry['timestamp'] < self._max_age(kind)
+            ]
+        write_snapshot(path, now, entries)
+        return len(entries)
+
+    def restore(self, path: str) -> Tuple[int, int]:
+        """Recharge un snapshot; retourne (entrées restaurées, entrées trop vieilles ignorées)
+
+        Une entrée restaurée garde sa date de chargement d'origine: périmée,
+        elle est servie puis rafraîchie comme avant le redémarrage.
+        """
+        data = read_snapshot(path)
+        now = time.time()
+        restored = skipped = 0
+        for kind, key, timestamp, value in data['entries']:
+            if kind not in self.ttls or now - timestamp >= self._max_age(kind):
+                skipped += 1
+                continue
+            entry = {**json_entry(value), 'timestamp': timestamp}
+            with self._lock:
+                current = self._entries.get((kind, key))
+                if current is not None and current['timestamp'] >= timestamp:
+                    skipped += 1
+                    continue
+                self._entries[(kind, key)] = entry
+                self._entries.move_to_end((kind, key))
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self._evictions += 1
+            restored += 1
+        return restored, skipped
+
+    def clear(self) -> int:
+        with self._lock:
+            count = len(self._entries)
+            self._entries.clear()
+            return count
+
+    def get_stats(self) -> Dict:
+        """Retourne les statistiques du cache de métadonnées"""
+        with self._lock:
+            by_kind = {}
+            for kind, _ in self._entries:
+                by_kind[kind] = by_kind.get(kind, 0) + 1
+            stats = {
+                'total_entries': len(self._entries),
+                'entries_by_type': by_kind,
+                'max_entries': self.max_entries,
+                'ttls': dict(self.ttls),
+                'max_ages': dict(self.max_ages),
+                'hits_fresh': self._counts[FRESH],
+                'hits_stale': self._counts[STALE],
+                'misses': self._counts[MISS],
+                'expired_beyond_max_age': self._too_old,
+                'background_refreshes': self._refreshes,
+                'refresh_failures': self._refresh_failures,
+                'refreshing': len(self._refreshing),
+                'evictions': self._evictions
+            }
+        flight = self._flight.get_stats()
+        async_flight = self._async_flight.get_stats()
+        stats['coalesced_loads'] = flight['coalesced_waiters'] + async_flight['coalesced_waiters']
+        return stats
+
+
+# Instance globale partagée
+metadata_cache = MetadataCache()
@@ -0,0 +1,129 @@
+"""
+Appels ytmusicapi (recherche, chanson, charts, playlist) hors de la boucle asyncio
+
+Les méthodes de YTMusic sont synchrones: appelées directement depuis un handler
+`async def`, elles bloquent la boucle d'événements pendant tout l'aller-retour
+vers YouTube Music. MetadataClient les exécute dans un pool de threads borné,
+distinct de celui des extractions yt-dlp, avec un délai par appel.
+"""
+import os
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, Optional
+from extraction_pool import ExtractionPool
+from http_caching import remaining_max_age
+from search_cache import SearchCache, search_cache
+from metadata_cache import MetadataCache, metadata_cache, json_entry
+
+# Délais par défaut (secondes) par type d'appel
+METADATA_TIMEOUTS = {
+    'search': float(os.getenv("METADATA_TIMEOUT_SEARCH", 10)),
+    'song': float(os.getenv("METADATA_TIMEOUT_SONG", 10)),
+    'charts': float(os.getenv("METADATA_TIMEOUT_CHARTS", 15)),
+    'playlist': float(os.getenv("METADATA_TIMEOUT_PLAYLIST", 20)),
+}
+
+# Pool partagé par les appels de métadonnées, dimensionné par variables d'environnement
+metadata_pool = ExtractionPool(
+    max_workers=int(os.getenv("METADATA_WORKERS", 8)),
+    max_queue=int(os.getenv("METADATA_QUEUE_SIZE", 32)),
+    timeout=max(METADATA_TIMEOUTS.values()),
+    name="metadata"
+)
+
+
+class MetadataClient:
+    """Enveloppe asynchrone d'un client YTMusic
+
+    Lève ExtractionOverloaded quand le pool est saturé et ExtractionTimeout
+    quand un appel dépasse son délai (le thread termine l'appel en arrière-plan).
+    """
+
+    def __init__(self, ytmusic, pool: ExtractionPool = metadata_pool,
+                 timeouts: Optional[Dict[str, float]] = None,
+                 search_cache: Optional[SearchCache] = search_cache, region=None,
+                 metadata_cache: Optional[MetadataCache] = metadata_cache):
+        self.ytmusic = ytmusic
+        self.pool = pool
+        self.timeouts = timeouts or METADATA_TIMEOUTS
+        # Résultats de recherche mis en cache par (requête normalisée, filtre, région)
+        self.search_cache = search_cache
+        self.region = region
+        # Chansons, playlists et charts servis en stale-while-revalidate
+        self.metadata_cache = metadata_cache
+
+    async def search(self, query: str, filter: Optional[str] = None, limit: int = 20):
+        return (await self.search_response(query, filter, limit))['value']
+
+    async def search_response(self, query: str, filter: Optional[str] = None, limit: int = 20) -> Dict:
+        """Réponse {"results": [...]}: value, body JSON et etag, depuis le cache de recherche si possible"""
+        if self.search_cache:
+            response = self.search_cache.get_response(query, filter, limit, self.region)
+            if response is not None:
+                return response
+
+        results = await self.pool.run(
+            partial(self.ytmusic.search, query, filter=filter, limit=limit),
+            timeout=self.timeouts['search']
+        )
+        # ytmusicapi peut renvoyer plus que `limit`: même corps (et même ETag) qu'un hit de cache
+        results = results[:limit] if results else results
+        if self.search_cache and results:
+            self.search_cache.set(query, filter, limit, results, self.region)
+        response = json_entry({'results': results})
+        response['value'] = results
+        return response
+
+    def search_max_age(self, response: Dict) -> int:
+        """Cache-Control max-age d'une recherche: sa fraîcheur restante dans le cache de recherche"""
+        if not self.search_cache:
+            return 0
+        return remaining_max_age(self.search_cache.ttl, response['timestamp'])
+
+    async def _cached(self, kind: str, key: str, load: Callable[[], Awaitable[Any]]) -> Dict:
+        """Entrée (value, body, etag, timestamp), depuis le cache de métadonnées si possible"""
+        if self.metadata_cache is None:
+            return json_entry(await load())
+        return await self.metadata_cache.aget_entry(kind, key, load)
+
+    async def get_song_entry(self, video_id: str) -> Dict:
+        return await self._cached('song', video_id, lambda: self.pool.run(
+            self.ytmusic.get_song, video_id,
+            timeout=self.timeouts['song']
+        ))
+
+    async def get_charts_entry(self, country: str = 'ZZ') -> Dict:
+        return await self._cached('charts', country, lambda: self.pool.run(
+            self.ytmusic.get_charts, country,
+            timeout=self.timeouts['charts']
+        ))
+
+    async def get_playlist_entry(self, playlist_id: str, limit: Optional[int] = 100) -> Dict:
+        return await self._cached('playlist', f"{playlist_id}:{limit}", lambda: self.pool.run(
+            self.ytmusic.get_playlist, playlist_id, limit,
+            timeout=self.timeouts['playlist']
+        ))
+
+    async def get_song(self, video_id: str):
+        return (await self.get_song_entry(video_id))['value']
+
+    async def get_charts(self, country: str = 'ZZ'):
+        return (await self.get_charts_entry(country))['value']
+
+    async def get_playlist(self, playlist_id: str, limit: Optional[int] = 100):
+        return (await self.get_playlist_entry(playlist_id, limit))['value']
+
+    def max_age(self, kind: str, entry: Dict) -> int:
+        """Cache-Control max-age d'une entrée: sa fraîcheur restante dans le cache serveur"""
+        if self.metadata_cache is None or entry['body'] is None:
+            return 0
+        return remaining_max_age(self.metadata_cache.ttls[kind], entry['timestamp'])
+
+    def get_stats(self) -> Dict:
+        """Retourne les statistiques du pool de métadonnées"""
+        return {**self.pool.get_stats(), 'timeouts_by_call': dict(self.timeouts)}
+
+    def get_search_cache_stats(self) -> Optional[Dict]:
+        return self.search_cache.get_stats() if self.search_cache else None
+
+    def get_metadata_cache_stats(self) -> Optional[Dict]:
+        return self.metadata_cache.get_stats() if self.metadata_cache else None
@@ -0,0 +1,130 @@
+"""
+Cache négatif des extractions échouées
+
+Quand toutes les stratégies d'extraction échouent pour une vidéo, l'échec est
+mémorisé quelques minutes avec sa classe d'erreur (indisponible, privée,
+restreinte par âge...). Les requêtes suivantes échouent immédiatement au lieu
+de relancer toute la cascade yt-dlp.
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+# Durée de mémorisation par classe d'erreur (secondes)
+NEGATIVE_CACHE_TTLS = {
+    'unavailable': int(os.getenv("NEGATIVE_TTL_UNAVAILABLE", 1800)),
+    'private': int(os.getenv("NEGATIVE_TTL_PRIVATE", 1800)),
+    'age_restricted': int(os.getenv("NEGATIVE_TTL_AGE_RESTRICTED", 3600)),
+    'geo_blocked': int(os.getenv("NEGATIVE_TTL_GEO_BLOCKED", 600)),
+    'unknown': int(os.getenv("NEGATIVE_TTL_UNKNOWN", 30)),
+}
+NEGATIVE_CACHE_MAX_ENTRIES = int(os.getenv("NEGATIVE_CACHE_MAX_ENTRIES", 10000))
+
+# Motifs des messages yt-dlp, du plus au moins spécifique
+_ERROR_PATTERNS = [
+    ('private', ('private video',)),
+    ('age_restricted', ('confirm your age', 'age-restricted', 'inappropriate for some users')),
+    ('geo_blocked', ('not available in your country', 'blocked it in your country', 'geo restrict')),
+    ('unavailable', ('video unavailable', 'has been removed', 'account associated with this video has been terminated',
+                     'this video does not exist', 'no longer available')),
+]
+
+
+def classify_error(message: str) -> str:
+    """Classe d'erreur d'un message d'échec yt-dlp"""
+    lowered = (message or '').lower()
+    for error_class, patterns in _ERROR_PATTERNS:
+        if any(pattern in lowered for pattern in patterns):
+            return error_class
+    return 'unknown'
+
+
+def classify_errors(messages: Iterable[str]) -> str:
+    """Classe la plus spécifique parmi les erreurs de toutes les tentatives"""
+    classes = {classify_error(message) for message in messages}
+    for error_class, _ in _ERROR_PATTERNS:
+        if error_class in classes:
+            return error_class
+    return 'unknown'
+
+
+class NegativeCache:
+    """Cache borné des échecs d'extraction, indexé par video_id"""
+
+    def __init__(self, ttls: Optional[Dict[str, int]] = None, max_entries: int = NEGATIVE_CACHE_MAX_ENTRIES):
+        self.ttls = ttls or NEGATIVE_CACHE_TTLS
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._recorded = {error_class: 0 for error_class in self.ttls}
+        self._evictions = 0
+
+    def get(self, video_id: str) -> Optional[Dict]:
+        """Échec mémorisé et encore valide pour cette vidéo, sinon None"""
+        with self._lock:
+            entry = self._entries.get(video_id)
+            if entry is None:
+                return None
+            if time.time() >= entry['expires_at']:
+                del self._entries[video_id]
+                return None
+            self._hits += 1
+            return entry
+
+    def check(self, video_id: str, bypass: bool = False) -> Optional[Dict]:
+        """Comme get(), mais `bypass` oublie l'échec pour forcer une nouvelle tentative"""
+        if bypass:
+            self.delete(video_id)
+            return None
+        return self.get(video_id)
+
+    def record(self, video_id: str, error_class: str, error: str = '') -> Optional[Dict]:
+        """Mémorise un échec; ignoré si la classe a une durée nulle"""
+        ttl = self.ttls.get(error_class, self.ttls.get('unknown', 0))
+        if ttl <= 0:
+            return None
+        entry = {
+            'error_class': error_class,
+            'error': error[:200],
+            'expires_at': time.time() + ttl
+        }
+        with self._lock:
+            self._entries.pop(video_id, None)
+            self._entries[video_id] = entry
+            self._recorded[error_class] = self._recorded.get(error_class, 0) + 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+        logging.info(f"🚫 Échec mémorisé pour {video_id} ({error_class}, {ttl}s)")
+        return entry
+
+    def delete(self, video_id: str) -> None:
+        """Oublie l'échec d'une vidéo (après une extraction réussie)"""
+        with self._lock:
+            self._entries.pop(video_id, None)
+
+    def clear(self) -> int:
+        with self._lock:
+            count = len(self._entries)
+            self._entries.clear()
+            return count
+
+    def get_stats(self) -> Dict:
+        """Retourne les statistiques du cache négatif"""
+        with self._lock:
+            return {
+                'total_entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttls': dict(self.ttls),
+                'hits': self._hits,
+                'recorded': dict(self._recorded),
+                'evictions': self._evictions
+            }
+
+
+# Instance globale partagée par les extracteurs
+negative_cache = NegativeCache()
@@ -0,0 +1,196 @@
+"""
+Préchargement des URLs de streaming des premiers titres d'une playlist
+
+Un client qui ouvre une playlist lance presque toujours les premiers titres
+tout de suite. Leurs URLs sont résolues en arrière-plan, à basse priorité, pour
+que les premiers /stream soient des hits de cache.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+
+def playlist_video_ids(playlist: Optional[Dict]) -> List[str]:
+    """video_id des titres d'une playlist ytmusicapi, dans l'ordre"""
+    if not playlist:
+        return []
+    return [track['videoId'] for track in playlist.get('tracks') or [] if track.get('videoId')]
+
+
+class LoopLoader:
+    """load(video_id) synchrone pour le prefetcher, qui exécute une coroutine de l'app
+
+    La coroutine tourne sur la boucle asyncio de l'app (enregistrée par bind()
+    au démarrage): un préchargement passe ainsi par le même single-flight que
+    /stream, et une requête arrivée pendant l'extraction l'attend au lieu d'en
+    lancer une seconde. Avant bind(), ou boucle fermée, rien n'est chargé.
+    """
+
+    def __init__(self, resolve: Callable[[str], Awaitable[bool]]):
+        self.resolve = resolve
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def bind(self) -> None:
+        """À appeler depuis la boucle de l'app (événement startup)"""
+        self._loop = asyncio.get_running_loop()
+
+    def __call__(self, video_id: str) -> bool:
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return False
+        return asyncio.run_coroutine_threadsafe(self.resolve(video_id), loop).result()
+
+
+class StreamPrefetcher:
+    """Résout en arrière-plan les URLs de quelques titres avant qu'ils soient demandés
+
+    Les préchargements tournent dans un pool dédié (`max_workers`, `max_queue`),
+    distinct du pool d'extraction interactif: ils ne lui prennent jamais de place
+    et sont abandonnés quand le pool est saturé. Les entrées préchargées sont
+    suivies (bornées à `max_tracked`) pour mesurer la part réellement servie.
+    """
+
+    def __init__(self, default_count: int = 5, max_workers: int = 1,
+                 max_queue: int = 50, max_tracked: int = 5000, wait_timeout: float = 10):
+        self.default_count = default_count
+        self.wait_timeout = wait_timeout
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.max_tracked = max_tracked
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        self._lock = threading.Lock()
+        self._in_flight: Dict[str, Future] = {}
+        # Entrées préchargées pas encore servies: video_id -> date du préchargement
+        self._prefetched: "OrderedDict[str, float]" = OrderedDict()
+        self._requested = 0
+        self._already_cached = 0
+        self._scheduled = 0
+        self._dropped = 0
+        self._stored = 0
+        self._failed = 0
+        self._used = 0
+        self._wait_timeouts = 0
+
+    def prefetch(self, video_ids: Iterable[str], is_cached: Callable[[str], bool],
+                 load: Callable[[str], bool], count: Optional[int] = None) -> int:
+        """Planifie load(video_id) pour les `count` premiers titres absents du cache
+
+        load(video_id) résout l'URL, la met en cache et retourne True en cas de succès.
+        Retourne le nombre de préchargements planifiés.
+        """
+        count = self.default_count if count is None else count
+        scheduled = 0
+        for video_id in list(dict.fromkeys(video_ids))[:max(0, count)]:
+            with self._lock:
+                self._requested += 1
+            if is_cached(video_id):
+                with self._lock:
+                    self._already_cached += 1
+                continue
+            if self._submit(video_id, is_cached, load):
+                scheduled += 1
+
+        if scheduled:
+            logging.info(f"⏩ Préchargement de {scheduled} titre(s) planifié")
+        return scheduled
+
+    def _submit(self, key: str, is_cached: Callable[[str], bool], load: Callable[[str], bool]) -> bool:
+        with self._lock:
+            if key in self._in_flight:
+                return False
+            if len(self._in_flight) >= self.max_workers + self.max_queue:
+                self._dropped += 1
+                return False
+            self._in_flight[key] = self._executor.submit(self._run, key, is_cached, load)
+            self._scheduled += 1
+        return True
+
+    def _run(self, key: str, is_cached: Callable[[str], bool], load: Callable[[str], bool]) -> None:
+        # Mis en cache pendant l'attente dans la file (par un /stream, par exemple)
+        if is_cached(key):
+            with self._lock:
+                self._already_cached += 1
+                self._in_flight.pop(key, None)
+            return
+        try:
+            stored = load(key)
+        except Exception as e:
+            logging.warning(f"❌ Échec préchargement pour {key}: {str(e)[:100]}")
+            stored = False
+
+        with self._lock:
+            if stored:
+                self._stored += 1
+                self._prefetched.pop(key, None)
+                self._prefetched[key] = time.time()
+                if len(self._prefetched) > self.max_tracked:
+                    self._prefetched.popitem(last=False)
+            else:
+                self._failed += 1
+            self._in_flight.pop(key, None)
+
+    def pending(self, key: str) -> Optional[Future]:
+        """Préchargement en cours pour cette clé, s'il y en a un"""
+        with self._lock:
+            return self._in_flight.get(key)
+
+    async def wait(self, key: str) -> bool:
+        """Attend (sans bloquer la boucle) le préchargement déjà lancé pour cette clé
+
+        Seul un préchargement en cours d'exécution est attendu, au plus
+        `wait_timeout` secondes: une requête interactive ne passe jamais derrière
+        la file des préchargements. Retourne True si le préchargement s'est
+        terminé à temps: l'appelant relit alors le cache au lieu d'extraire.
+        """
+        future = self.pending(key)
+        if future is None or not future.running():
+            return False
+        try:
+            # shield: le délai dépassé n'annule pas le préchargement
+            await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), self.wait_timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self._wait_timeouts += 1
+            return False
+        return True
+
+    def mark_used(self, key: str) -> None:
+        """À appeler sur chaque hit de cache: compte la première utilisation d'une entrée préchargée"""
+        if not self._prefetched:
+            return
+        with self._lock:
+            if self._prefetched.pop(key, None) is not None:
+                self._used += 1
+
+    def get_stats(self) -> Dict:
+        """Retourne les statistiques de préchargement"""
+        with self._lock:
+            return {
+                'default_count': self.default_count,
+                'max_workers': self.max_workers,
+                'in_flight': len(self._in_flight),
+                'requested': self._requested,
+                'already_cached': self._already_cached,
+                'scheduled': self._scheduled,
+                'dropped': self._dropped,
+                'stored': self._stored,
+                'failed': self._failed,
+                'used': self._used,
+                'wait_timeouts': self._wait_timeouts,
+                'awaiting_use': len(self._prefetched),
+                'used_fraction': round(self._used / self._stored, 3) if self._stored else None
+            }
+
+
+# Instance globale, réglée par variables d'environnement
+stream_prefetcher = StreamPrefetcher(
+    default_count=int(os.getenv("PLAYLIST_PREFETCH_TRACKS", 5)),
+    max_workers=int(os.getenv("PREFETCH_WORKERS", 1)),
+    max_queue=int(os.getenv("PREFETCH_QUEUE", 50)),
+    wait_timeout=float(os.getenv("PREFETCH_WAIT_TIMEOUT", 10))
+)
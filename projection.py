@@ -0,0 +1,117 @@
+"""
+Projection des résultats ytmusicapi (recherche, titres de playlist)
+
+- profil compact: identifiant, titre, artistes, durée et une seule miniature
+- fields=: liste de champs à garder, chemins pointés acceptés
+  (ex. "videoId,title,artists.name"); appliqué après le profil
+
+Les listes sont projetées élément par élément. Sur une playlist, seuls les
+titres (tracks) sont projetés; l'en-tête est réduit par le profil compact.
+"""
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+PROFILES = ('full', 'compact')
+# Largeur minimale de la miniature gardée par le profil compact
+COMPACT_THUMBNAIL_WIDTH = int(os.getenv("COMPACT_THUMBNAIL_WIDTH", 120))
+MAX_FIELDS = 50
+
+_FIELD_PATH = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)*$')
+
+
+def parse_fields(fields: Optional[str]) -> Optional[Tuple[str, ...]]:
+    """'title, videoId,artists.name' -> ('artists.name', 'title', 'videoId'); lève ValueError si invalide"""
+    if fields is None or not fields.strip():
+        return None
+    paths = sorted({path.strip() for path in fields.split(',') if path.strip()})
+    if len(paths) > MAX_FIELDS:
+        raise ValueError(f"Too many fields (max {MAX_FIELDS})")
+    for path in paths:
+        if not _FIELD_PATH.match(path):
+            raise ValueError(f"Invalid field: {path}")
+    return tuple(paths)
+
+
+def parse_profile(profile: Optional[str]) -> str:
+    profile = (profile or 'full').lower()
+    if profile not in PROFILES:
+        raise ValueError(f"Profile must be one of: {', '.join(PROFILES)}")
+    return profile
+
+
+def field_tree(paths: Tuple[str, ...]) -> Dict:
+    """('artists.name', 'title') -> {'artists': {'name': None}, 'title': None}; None = champ entier"""
+    tree: Dict[str, Any] = {}
+    for path in paths:
+        node = tree
+        parts = path.split('.')
+        for part in parts[:-1]:
+            if part in node and node[part] is None:
+                break
+            node = node.setdefault(part, {})
+        else:
+            node[parts[-1]] = None
+    return tree
+
+
+def project(value: Any, tree: Optional[Dict]) -> Any:
+    """Garde seulement les champs de `tree` (récursivement, listes comprises)"""
+    if tree is None:
+        return value
+    if isinstance(value, list):
+        return [project(item, tree) for item in value]
+    if isinstance(value, dict):
+        return {key: project(value[key], sub) for key, sub in tree.items() if key in value}
+    return value
+
+
+def pick_thumbnail(thumbnails: Optional[List[Dict]]) -> Optional[str]:
+    """URL de la plus petite miniature d'au moins COMPACT_THUMBNAIL_WIDTH px (sinon la plus grande)"""
+    if not thumbnails:
+        return None
+    by_width = sorted(thumbnails, key=lambda thumbnail: thumbnail.get('width') or 0)
+    for thumbnail in by_width:
+        if (thumbnail.get('width') or 0) >= COMPACT_THUMBNAIL_WIDTH:
+            return thumbnail.get('url')
+    return by_width[-1].get('url')
+
+
+def compact_item(item: Dict) -> Dict:
+    """Résultat ou titre de playlist réduit au profil compact"""
+    compact = {'videoId': item.get('videoId')}
+    if not compact['videoId'] and item.get('browseId'):
+        compact = {'browseId': item['browseId']}
+    compact['title'] = item.get('title')
+    compact['artists'] = [
+        {'name': artist.get('name'), 'id': artist.get('id')}
+        for artist in item.get('artists') or []
+    ]
+    compact['duration'] = item.get('duration')
+    compact['duration_seconds'] = item.get('duration_seconds')
+    compact['thumbnail'] = pick_thumbnail(item.get('thumbnails'))
+    return compact
+
+
+def project_items(items: List[Dict], profile: str = 'full', fields: Optional[Tuple[str, ...]] = None) -> List[Dict]:
+    if profile == 'compact':
+        items = [compact_item(item) for item in items]
+    return project(items, field_tree(fields)) if fields else items
+
+
+def project_playlist(playlist: Dict, profile: str = 'full', fields: Optional[Tuple[str, ...]] = None) -> Dict:
+    tracks = project_items(playlist.get('tracks') or [], profile, fields)
+    if profile == 'compact':
+        return {
+            'id': playlist.get('id'),
+            'title': playlist.get('title'),
+            'trackCount': playlist.get('trackCount'),
+            'duration_seconds': playlist.get('duration_seconds'),
+            'thumbnail': pick_thumbnail(playlist.get('thumbnails')),
+            'tracks': tracks
+        }
+    return {**playlist, 'tracks': tracks}
+
+
+def is_projected(profile: str, fields: Optional[Tuple[str, ...]]) -> bool:
+    return profile != 'full' or bool(fields)
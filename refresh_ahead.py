@@ -0,0 +1,118 @@
+"""
+Rafraîchissement anticipé (refresh-ahead) des entrées populaires du cache de streaming
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+
+class RefreshAhead:
+    """Ré-extrait en arrière-plan les entrées proches de leur expiration
+
+    Une entrée est rafraîchie lorsqu'elle est servie après `refresh_fraction`
+    de sa durée de vie et qu'elle avait déjà été demandée moins de
+    `access_window` secondes auparavant. Les rafraîchissements tournent dans un
+    pool dédié (`max_workers`, `max_queue`) qui ne prend jamais de place aux
+    extractions interactives.
+
+    Les dates de dernier accès sont gardées ici (bornées à `max_tracked` clés)
+    plutôt que dans l'entrée, pour fonctionner avec tous les backends de cache.
+    """
+
+    def __init__(self, refresh_fraction: float = 0.75, access_window: int = 600,
+                 max_workers: int = 2, max_queue: int = 32, max_tracked: int = 10000):
+        self.refresh_fraction = refresh_fraction
+        self.access_window = access_window
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.max_tracked = max_tracked
+        self._last_access: "OrderedDict[str, float]" = OrderedDict()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="refresh-ahead")
+        self._lock = threading.Lock()
+        self._in_flight = set()
+        self._scheduled = 0
+        self._refreshed = 0
+        self._failed = 0
+        self._dropped = 0
+
+    def should_refresh(self, entry: Dict, now: float, last_access: float) -> bool:
+        """L'entrée a-t-elle dépassé sa fraction de vie et été demandée récemment ?"""
+        lifetime = entry['refresh_after'] - entry['timestamp']
+        if lifetime <= 0 or now - entry['timestamp'] < self.refresh_fraction * lifetime:
+            return False
+        return now - last_access <= self.access_window
+
+    def _touch(self, key: str, now: float) -> Optional[float]:
+        """Enregistre l'accès et retourne le précédent"""
+        with self._lock:
+            previous = self._last_access.pop(key, None)
+            self._last_access[key] = now
+            if len(self._last_access) > self.max_tracked:
+                self._last_access.popitem(last=False)
+            return previous
+
+    def maybe_refresh(self, key: str, entry: Dict, refresh: Callable[[str], None]) -> bool:
+        """À appeler à chaque hit: planifie refresh(key) si l'entrée est chaude et vieillissante"""
+        now = time.time()
+        previous = self._touch(key, now)
+        # La création de l'entrée compte comme un accès
+        last_access = entry['timestamp'] if previous is None else max(previous, entry['timestamp'])
+        if not self.should_refresh(entry, now, last_access):
+            return False
+        return self.submit(key, refresh)
+
+    def submit(self, key: str, refresh: Callable[[str], None]) -> bool:
+        """Planifie refresh(key) dans le pool dédié, sauf s'il est déjà en cours ou saturé"""
+        with self._lock:
+            if key in self._in_flight:
+                return False
+            if len(self._in_flight) >= self.max_workers + self.max_queue:
+                self._dropped += 1
+                return False
+            self._in_flight.add(key)
+            self._scheduled += 1
+
+        self._executor.submit(self._run, key, refresh)
+        return True
+
+    def _run(self, key: str, refresh: Callable[[str], None]) -> None:
+        try:
+            logging.info(f"🔄 Refresh-ahead pour {key}")
+            refresh(key)
+            with self._lock:
+                self._refreshed += 1
+        except Exception as e:
+            logging.warning(f"❌ Échec refresh-ahead pour {key}: {str(e)[:100]}")
+            with self._lock:
+                self._failed += 1
+        finally:
+            with self._lock:
+                self._in_flight.discard(key)
+
+    def get_stats(self) -> Dict:
+        """Retourne les statistiques du rafraîchissement anticipé"""
+        with self._lock:
+            return {
+                'refresh_fraction': self.refresh_fraction,
+                'access_window_seconds': self.access_window,
+                'max_workers': self.max_workers,
+                'in_flight': len(self._in_flight),
+                'tracked_keys': len(self._last_access),
+                'scheduled': self._scheduled,
+                'refreshed': self._refreshed,
+                'failed': self._failed,
+                'dropped': self._dropped
+            }
+
+
+# Instance globale, réglée par variables d'environnement
+stream_refresher = RefreshAhead(
+    refresh_fraction=float(os.getenv("REFRESH_AHEAD_FRACTION", 0.75)),
+    access_window=int(os.getenv("REFRESH_AHEAD_WINDOW", 600)),
+    max_workers=int(os.getenv("REFRESH_AHEAD_WORKERS", 2)),
+    max_queue=int(os.getenv("REFRESH_AHEAD_QUEUE", 32))
+)
@@ -0,0 +1,137 @@
+"""
+Cache des résultats de recherche YouTube Music
+
+Clé: requête normalisée (Unicode NFKC, casse, espaces), filtre et région. La
+limite demandée est gardée dans l'entrée: une recherche avec une limite plus
+petite est servie en tronquant un résultat plus large déjà en cache.
+"""
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from http_caching import make_etag, serialize_json
+
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", 600))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", 2000))
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_query(query: str) -> str:
+    """'  Daft   PUNK ' et 'daft punk' (ou leurs variantes Unicode) donnent la même clé"""
+    return _WHITESPACE.sub(' ', unicodedata.normalize('NFKC', query)).strip().casefold()
+
+
+def region_key(region) -> str:
+    """Région sous forme de chaîne: dict {'language', 'location'}, chaîne ou None"""
+    if not region:
+        return 'default'
+    if isinstance(region, dict):
+        return f"{region.get('language', '')}-{region.get('location', '')}"
+    return str(region)
+
+
+class SearchCache:
+    """Cache LRU + TTL des résultats de recherche, borné à `max_entries`"""
+
+    def __init__(self, ttl: int = SEARCH_CACHE_TTL, max_entries: int = SEARCH_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str, str], Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._hits_from_larger = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @staticmethod
+    def make_key(query: str, filter: Optional[str], region=None) -> Tuple[str, str, str]:
+        return normalize_query(query), filter or 'all', region_key(region)
+
+    def get(self, query: str, filter: Optional[str], limit: int, region=None) -> Optional[List]:
+        """Résultats en cache couvrant `limit`, sinon None"""
+        entry = self._find(self.make_key(query, filter, region), limit)
+        return entry['results'][:limit] if entry else None
+
+    def get_response(self, query: str, filter: Optional[str], limit: int, region=None) -> Optional[Dict]:
+        """Réponse {"results": [...]} en cache pour `limit`: value, body JSON, etag, timestamp
+
+        Le corps et l'ETag de la réponse complète (tous les résultats gardés)
+        sont calculés une fois puis réutilisés. Une limite plus petite, choisie
+        par le client, est tronquée et sérialisée pour la requête seulement:
+        une entrée ne garde jamais un corps par limite demandée.
+        """
+        entry = self._find(self.make_key(query, filter, region), limit)
+        if entry is None:
+            return None
+        results = entry['results'][:limit]
+        if len(results) < len(entry['results']):
+            return self._response(results, entry['timestamp'])
+        view = entry.get('view')
+        if view is None:
+            view = entry.setdefault('view', self._response(results, entry['timestamp']))
+        return view
+
+    @staticmethod
+    def _response(results: List, timestamp: float) -> Dict:
+        body = serialize_json({'results': results})
+        return {'value': results, 'body': body, 'etag': make_etag(body), 'timestamp': timestamp}
+
+    def _find(self, key: Tuple[str, str, str], limit: int) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry['timestamp'] >= self.ttl:
+                del self._entries[key]
+                entry = None
+            # Une réponse plus courte que sa limite est complète: elle couvre toutes les limites
+            if entry is None or (entry['limit'] < limit and len(entry['results']) >= entry['limit']):
+                self._misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._hits += 1
+            if entry['limit'] > limit:
+                self._hits_from_larger += 1
+            return entry
+
+    def set(self, query: str, filter: Optional[str], limit: int, results: List, region=None) -> None:
+        """Mémorise un résultat, sauf s'il est moins large qu'une entrée encore valide"""
+        key = self.make_key(query, filter, region)
+        now = time.time()
+        with self._lock:
+            current = self._entries.get(key)
+            if current is not None and current['limit'] > limit and now - current['timestamp'] < self.ttl:
+                return
+            self._entries[key] = {'results': list(results), 'limit': limit, 'timestamp': now}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def clear(self) -> int:
+        with self._lock:
+            count = len(self._entries)
+            self._entries.clear()
+            return count
+
+    def get_stats(self) -> Dict:
+        """Retourne les statistiques du cache de recherche"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'total_entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self._hits,
+                'hits_from_larger_limit': self._hits_from_larger,
+                'misses': self._misses,
+                'hit_rate': round(self._hits / lookups, 3) if lookups else None,
+                'evictions': self._evictions
+            }
+
+
+# Instance globale partagée par les handlers de recherche
+search_cache = SearchCache()
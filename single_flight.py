@@ -0,0 +1,109 @@
+"""
+Regroupement des appels concurrents par clé (single-flight)
+
+Quand plusieurs requêtes demandent la même clé pendant qu'un calcul est en cours,
+une seule exécution a lieu et toutes les requêtes reçoivent son résultat.
+"""
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict
+
+
+class _Call:
+    """Un calcul en cours et le nombre de requêtes qui l'attendent"""
+
+    __slots__ = ('future', 'waiters')
+
+    def __init__(self, future):
+        self.future = future
+        self.waiters = 0
+
+
+class _FlightStats:
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    def _finish(self, key: str, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        if call.waiters:
+            logging.info(f"Single-flight {key}: {call.waiters} requête(s) regroupée(s)")
+
+    def get_stats(self) -> Dict:
+        """Retourne les statistiques de regroupement"""
+        return {
+            'executions': self.executions,
+            'coalesced_waiters': self.coalesced,
+            'in_flight': len(self._calls),
+            'in_flight_waiters': {key: call.waiters for key, call in list(self._calls.items())}
+        }
+
+
+class SingleFlight(_FlightStats):
+    """Single-flight pour du code synchrone multi-thread (Flask)"""
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+
+    def do(self, key: str, func: Callable[..., Any], *args) -> Any:
+        """Exécute func(*args) une seule fois par clé en cours; les autres appelants attendent"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                leader = False
+            else:
+                call = _Call(Future())
+                self._calls[key] = call
+                self.executions += 1
+                leader = True
+
+        if not leader:
+            return call.future.result()
+
+        try:
+            result = func(*args)
+        except BaseException as e:
+            call.future.set_exception(e)
+            raise
+        else:
+            call.future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._finish(key, call)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return super().get_stats()
+
+
+class AsyncSingleFlight(_FlightStats):
+    """Single-flight pour les handlers asyncio (FastAPI)"""
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """Attend le calcul en cours pour la clé, ou le lance via factory()"""
+        call = self._calls.get(key)
+        if call is not None:
+            call.waiters += 1
+            self.coalesced += 1
+        else:
+            call = _Call(asyncio.ensure_future(factory()))
+            self._calls[key] = call
+            self.executions += 1
+            call.future.add_done_callback(lambda task: self._done(key, call, task))
+
+        # shield: l'annulation d'un client ne doit pas annuler le calcul partagé
+        return await asyncio.shield(call.future)
+
+    def _done(self, key: str, call: _Call, task: asyncio.Future) -> None:
+        if not task.cancelled():
+            # Marquer l'exception comme lue si tous les clients sont partis
+            task.exception()
+        self._finish(key, call)
@@ -0,0 +1,61 @@
+"""
+Fichiers de snapshot des caches mémoire (JSON compressé)
+
+Un fichier par cache et par processus: `{nom}.{pid}.json.gz`. Plusieurs
+workers (ou plusieurs applications) partageant le même dossier n'écrasent
+donc jamais le snapshot d'un autre; au démarrage, un processus relit les
+snapshots récents de son propre cache, quel que soit le pid qui les a écrits.
+"""
+import gzip
+import json
+import os
+import re
+from typing import Any, Dict, List
+
+SNAPSHOT_FORMAT_VERSION = 1
+
+
+def snapshot_path(directory: str, name: str, pid: int) -> str:
+    return os.path.join(directory, f"{name}.{pid}.json.gz")
+
+
+def list_snapshots(directory: str, name: str) -> List[str]:
+    """Snapshots existants du cache `name`, du plus ancien au plus récent"""
+    pattern = re.compile(rf"{re.escape(name)}\.\d+\.json\.gz$")
+    try:
+        filenames = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    paths = [os.path.join(directory, filename) for filename in filenames if pattern.match(filename)]
+    mtimes = {}
+    for path in paths:
+        try:
+            mtimes[path] = os.path.getmtime(path)
+        except OSError:
+            continue
+    return sorted(mtimes, key=mtimes.get)
+
+
+def write_snapshot(path: str, saved_at: float, entries: List) -> None:
+    """Écriture atomique: un lecteur ne voit jamais de fichier à moitié écrit"""
+    payload = json.dumps(
+        {'version': SNAPSHOT_FORMAT_VERSION, 'saved_at': saved_at, 'entries': entries},
+        separators=(',', ':')
+    ).encode('utf-8')
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with gzip.open(tmp_path, 'wb', compresslevel=6) as snapshot_file:
+        snapshot_file.write(payload)
+    os.replace(tmp_path, path)
+
+
+def read_snapshot(path: str) -> Dict[str, Any]:
+    """Contenu d'un snapshot; ValueError si son format n'est pas supporté"""
+    with gzip.open(path, 'rb') as snapshot_file:
+        data = json.loads(snapshot_file.read())
+    if data.get('version') != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError(f"unsupported snapshot version {data.get('version')}")
+    return data
@@ -1,5 +1,6 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 from ytmusicapi import YTMusic
 from pydantic import BaseModel
 from typing import List, Optional
@@ -8,8 +9,22 @@ import time
 import yt_dlp
 import random
 import asyncio
+from extraction_pool import extraction_pool, ExtractionUnavailable, install_exception_handlers
+from metadata_client import MetadataClient
+from compression import CompressionMiddleware, conditional_compressed_json, response_compressor
+from metadata_cache import entry_view
+from projection import is_projected, parse_fields, parse_profile, project_items, project_playlist
+from charts_scheduler import ChartsScheduler, normalize_country, snapshot_headers
+from single_flight import AsyncSingleFlight
+from cache_manager import AudioCacheManager, CacheSnapshotter, expiry_info
+from refresh_ahead import stream_refresher
+from prefetch import LoopLoader, stream_prefetcher, playlist_video_ids
+from batch_stream import stream_batch, STREAM_BATCH_MAX_IDS, NDJSON_MEDIA_TYPE
+from negative_cache import negative_cache, classify_errors
 
 app = FastAPI(title="Music Streaming API - Improved", version="2.1.0")
+# Pools saturés -> 503, appels trop longs -> 504
+install_exception_handlers(app)
 
 app.add_middleware(
     CORSMiddleware,
@@ -18,10 +33,15 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# gzip/brotli négociés sur Accept-Encoding; corps en cache compressés une seule fois
+app.add_middleware(CompressionMiddleware)
 
 ytmusic = YTMusic()
-audio_cache = {}
-CACHE_DURATION = 300  # 5 minutes au lieu de 30
+# Appels ytmusicapi exécutés dans un pool borné, hors de la boucle d'événements
+metadata = MetadataClient(ytmusic)
+# Charts des pays CHARTS_COUNTRIES, rechargés en arrière-plan et servis depuis la mémoire
+charts_scheduler = ChartsScheduler(ytmusic.get_charts)
+CACHE_DURATION = 300  # 5 minutes, si l'URL ne porte pas sa propre expiration
 
 # User agents rotatifs pour éviter la détection
 USER_AGENTS = [
@@ -39,16 +59,39 @@ class SearchRequest(BaseModel):
 
 class PlaylistRequest(BaseModel):
     playlist_id: str
+    # Précharger les URLs des premiers titres (PLAYLIST_PREFETCH_TRACKS par défaut)
+    prefetch: Optional[bool] = False
+    prefetch_count: Optional[int] = None
 
-def is_cache_valid(timestamp):
-    return time.time() - timestamp < CACHE_DURATION
+class BatchStreamRequest(BaseModel):
+    video_ids: List[str]
+    retry: Optional[bool] = False
 
 def get_random_user_agent():
     return random.choice(USER_AGENTS)
 
-def extract_audio_improved(video_id: str):
+def youtube_direct_fallback(video_id: str, error_class: str):
+    """Réponse de repli quand l'extraction est impossible: URL YouTube directe"""
+    return {
+        'success': True,
+        'audio_url': f"https://www.youtube.com/watch?v={video_id}",
+        'title': 'Titre non disponible',
+        'duration': 0,
+        'quality': 'youtube_direct',
+        'format': 'youtube_fallback',
+        'strategy': 'youtube_direct',
+        'error_class': error_class,
+        'note': 'URL YouTube directe - extraction impossible'
+    }
+
+def extract_audio_improved(video_id: str, bypass_negative_cache: bool = False):
     """Version améliorée avec multiples stratégies anti-détection"""
     
+    # Échec récent mémorisé: ne pas relancer toutes les stratégies (ni leurs délais)
+    failure = negative_cache.check(video_id, bypass_negative_cache)
+    if failure:
+        return youtube_direct_fallback(video_id, failure['error_class'])
+    
     strategies = [
         # Stratégie 1: Configuration légère
         {
@@ -114,6 +157,7 @@ def extract_audio_improved(video_id: str):
     ]
     
     youtube_url = f"https://www.youtube.com/watch?v={video_id}"
+    errors = []
     
     for strategy in strategies:
         try:
@@ -168,20 +212,92 @@ def extract_audio_improved(video_id: str):
                         
         except Exception as e:
             logging.warning(f"❌ Échec stratégie {strategy['name']}: {str(e)[:100]}")
+            errors.append(str(e))
             continue
     
-    # Toutes les stratégies ont échoué - retourner une URL YouTube directe
+    # Toutes les stratégies ont échoué - mémoriser l'échec et retourner une URL YouTube directe
     logging.info("Toutes les extractions ont échoué, retour URL YouTube directe")
-    return {
-        'success': True,
-        'audio_url': youtube_url,
-        'title': 'Titre non disponible',
-        'duration': 0,
-        'quality': 'youtube_direct',
-        'format': 'youtube_fallback',
-        'strategy': 'youtube_direct',
-        'note': 'URL YouTube directe - extraction impossible'
-    }
+    error_class = classify_errors(errors)
+    negative_cache.record(video_id, error_class, errors[-1] if errors else '')
+    return youtube_direct_fallback(video_id, error_class)
+
+stream_flight = AsyncSingleFlight()
+
+async def resolve_stream(video_id: str, bypass_negative_cache: bool = False, run=extraction_pool.run):
+    """Extraction partagée: les requêtes concurrentes pour un même video_id attendent la même extraction
+
+    `run(func, *args)` exécute l'extraction bloquante (pool interactif par défaut).
+    """
+    async def extract_and_cache():
+        # Extraire l'URL audio hors de la boucle d'événements
+        result = await run(extract_audio_improved, video_id, bypass_negative_cache)
+        if result['success'] and result.get('strategy') != 'youtube_direct':
+            # Mettre en cache jusqu'à l'expiration de l'URL signée
+            cache_entry = audio_cache.set(video_id, result['audio_url'], title=result['title'])
+            result.update(expiry_info(cache_entry))
+        elif result['success']:
+            # Repli sur l'URL YouTube directe: jamais mis en cache, pour que
+            # ?retry=true et la fin de l'échec mémorisé relancent une extraction
+            now = time.time()
+            result.update(expiry_info({'expires_at': now, 'refresh_after': now}, now))
+        return result
+
+    return await stream_flight.do(video_id, extract_and_cache)
+
+async def prefetch_stream(video_id: str) -> bool:
+    """Préchargement de playlist, partagé avec les /stream concurrents (stream_flight)
+
+    L'extraction tourne hors du pool interactif; le nombre de préchargements
+    simultanés reste borné par les workers du prefetcher.
+    """
+    result = await resolve_stream(video_id, run=asyncio.to_thread)
+    return result['success'] and result.get('strategy') != 'youtube_direct'
+
+stream_prefetch_loader = LoopLoader(prefetch_stream)
+
+def refresh_stream(video_id: str) -> Optional[dict]:
+    """Ré-extraction en arrière-plan d'une entrée populaire (refresh-ahead)"""
+    result = extract_audio_improved(video_id)
+    # Ne jamais remplacer une URL encore valide par un échec
+    if result['success'] and result.get('strategy') != 'youtube_direct':
+        return {'audio_url': result['audio_url'], 'title': result['title']}
+    return None
+
+# Cache borné (LRU + TTL) des URLs audio, rafraîchi en arrière-plan pour les vidéos populaires
+audio_cache = AudioCacheManager(
+    cache_duration=CACHE_DURATION,
+    refresher=stream_refresher,
+    loader=refresh_stream,
+    prefetcher=stream_prefetcher
+)
+
+# Sauvegarde du cache sur disque pour survivre aux redémarrages
+# (un fichier par application et par processus, voir CacheSnapshotter)
+cache_snapshotter = CacheSnapshotter(audio_cache, 'streaming_improved.stream')
+metadata_snapshotter = CacheSnapshotter(metadata.metadata_cache, 'streaming_improved.metadata')
+
+@app.on_event("startup")
+async def restore_cache():
+    cache_snapshotter.start()
+    metadata_snapshotter.start()
+
+@app.on_event("startup")
+async def bind_prefetch_loader():
+    # Les préchargements exécutent prefetch_stream sur cette boucle
+    stream_prefetch_loader.bind()
+
+@app.on_event("shutdown")
+async def save_cache():
+    cache_snapshotter.stop()
+    metadata_snapshotter.stop()
+
+@app.on_event("startup")
+async def start_charts_scheduler():
+    charts_scheduler.start()
+
+@app.on_event("shutdown")
+async def stop_charts_scheduler():
+    charts_scheduler.stop()
 
 @app.get("/")
 async def root():
@@ -189,45 +305,88 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "timestamp": time.time()}
+    return {
+        "status": "healthy",
+        "timestamp": time.time(),
+        "extraction_pool": extraction_pool.get_stats(),
+        "metadata_pool": metadata.get_stats(),
+        "search_cache": metadata.get_search_cache_stats(),
+        "metadata_cache": metadata.get_metadata_cache_stats(),
+        "compression": response_compressor.get_stats(),
+        "charts": charts_scheduler.get_stats()
+    }
+
+def conditional_response(http_request: Request, body: bytes, etag: str, max_age: int, headers=None) -> Response:
+    """Réponse JSON avec ETag et Cache-Control, ou 304 si If-None-Match correspond"""
+    status, body, headers = conditional_compressed_json(http_request.headers.get('if-none-match'),
+                                                        http_request.headers.get('accept-encoding'),
+                                                        body, etag, max_age, headers)
+    return Response(content=body, status_code=status, media_type="application/json", headers=headers)
+
+def projection_params(profile: Optional[str], fields: Optional[str]) -> tuple:
+    """(profil, champs) validés depuis ?profile=full|compact&fields=a,b.c"""
+    try:
+        return parse_profile(profile), parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/search")
-async def search_music(request: SearchRequest):
+async def search_music(request: SearchRequest, http_request: Request,
+                       profile: Optional[str] = None, fields: Optional[str] = None):
+    profile, fields = projection_params(profile, fields)
     try:
-        results = ytmusic.search(request.query, filter=request.filter, limit=request.limit)
-        return {"results": results}
+        # Corps et ETag mémorisés avec l'entrée du cache de recherche (projection comprise)
+        response = await metadata.search_response(request.query, filter=request.filter, limit=request.limit)
+        if is_projected(profile, fields):
+            response = entry_view(response, (profile, fields),
+                                  lambda results: {"results": project_items(results, profile, fields)},
+                                  memoize=not fields)
+        return conditional_response(http_request, response['body'], response['etag'], metadata.search_max_age(response))
+    except ExtractionUnavailable:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/stream/{video_id}")
-async def stream_audio(video_id: str):
+def stream_response_fields(cache_entry: dict) -> dict:
+    """Champs d'une réponse /stream servie depuis le cache, hors expiration"""
+    return {
+        "audio_url": cache_entry['url'],
+        "title": cache_entry['title'],
+        "cached": True
+    }
+
+def cached_stream_response(video_id: str) -> Optional[dict]:
+    """Réponse /stream servie depuis le cache, ou None"""
+    # Vérifier le cache (les entrées expirées sont purgées par le cache)
+    cache_entry = audio_cache.get_entry(video_id)
+    if cache_entry:
+        return {**stream_response_fields(cache_entry), **expiry_info(cache_entry)}
+    return None
+
+def cached_stream_body(video_id: str) -> Optional[Response]:
+    """Réponse /stream servie depuis le cache en octets déjà sérialisés, ou None"""
+    body = audio_cache.get_response_body(video_id, stream_response_fields)
+    return Response(content=body, media_type="application/json") if body else None
+
+async def extract_stream_response(video_id: str, retry: bool = False) -> dict:
+    """Réponse /stream après extraction; lève une HTTPException en cas d'échec"""
+    # Un préchargement de playlist tourne déjà pour cette vidéo: l'attendre (brièvement) plutôt que d'extraire deux fois
+    if await stream_prefetcher.wait(video_id):
+        cached = cached_stream_response(video_id)
+        if cached:
+            return cached
+    
     try:
-        # Vérifier le cache (mais avec une durée plus courte)
-        if video_id in audio_cache:
-            cache_entry = audio_cache[video_id]
-            if is_cache_valid(cache_entry['timestamp']):
-                return {
-                    "audio_url": cache_entry['url'],
-                    "title": cache_entry['title'],
-                    "cached": True,
-                    "expires_in": CACHE_DURATION - (time.time() - cache_entry['timestamp'])
-                }
-            else:
-                # Cache expiré, le supprimer
-                del audio_cache[video_id]
-        
-        # Extraire l'URL audio
-        result = extract_audio_improved(video_id)
+        # Extraire l'URL audio (une seule extraction par video_id en cours);
+        # retry=true ignore un échec récent mémorisé dans le cache négatif
+        result = await resolve_stream(video_id, retry)
         
         if not result['success']:
-            raise HTTPException(status_code=404, detail=result.get('error', 'Extraction failed'))
-        
-        # Mettre en cache avec timestamp actuel
-        audio_cache[video_id] = {
-            'url': result['audio_url'],
-            'title': result['title'],
-            'timestamp': time.time()
-        }
+            raise HTTPException(
+                status_code=404,
+                detail=result.get('error', 'Extraction failed'),
+                headers={"X-Error-Class": result.get('error_class', 'unknown')}
+            )
         
         return {
             "audio_url": result['audio_url'],
@@ -238,48 +397,106 @@ async def stream_audio(video_id: str):
             "duration": result.get('duration', 0),
             "strategy": result.get('strategy', 'unknown'),
             "note": result.get('note', ''),
-            "cache_duration": CACHE_DURATION
+            "cache_duration": result['refresh_after'] - time.time(),
+            "expires_at": result['expires_at'],
+            "refresh_after": result['refresh_after']
         }
             
+    except (HTTPException, ExtractionUnavailable):
+        raise
     except Exception as e:
         logging.error(f"Streaming error for {video_id}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/stream/{video_id}")
+async def stream_audio(video_id: str, retry: bool = False):
+    return cached_stream_body(video_id) or await extract_stream_response(video_id, retry)
+
+@app.post("/stream/batch")
+async def stream_audio_batch(request: BatchStreamRequest):
+    """Résout une file de video_id et renvoie chaque résultat en NDJSON dès qu'il est prêt"""
+    if len(request.video_ids) > STREAM_BATCH_MAX_IDS:
+        raise HTTPException(status_code=413, detail=f"Too many video_ids (max {STREAM_BATCH_MAX_IDS})")
+    return StreamingResponse(
+        stream_batch(
+            request.video_ids,
+            cached_stream_response,
+            lambda video_id: extract_stream_response(video_id, request.retry)
+        ),
+        media_type=NDJSON_MEDIA_TYPE
+    )
+
 @app.get("/song/{video_id}")
-async def get_song_info(video_id: str):
+async def get_song_info(video_id: str, http_request: Request):
     try:
-        song_info = ytmusic.get_song(video_id)
-        return song_info
+        entry = await metadata.get_song_entry(video_id)
+        if entry['body'] is None:
+            return entry['value']
+        return conditional_response(http_request, entry['body'], entry['etag'], metadata.max_age('song', entry))
+    except ExtractionUnavailable:
+        raise
     except Exception as e:
         raise HTTPException(status_code=404, detail="Song not found")
 
 @app.get("/charts")
-async def get_charts():
+async def get_charts(http_request: Request, country: Optional[str] = None):
+    country_code = normalize_country(country)
+    if country_code is None:
+        raise HTTPException(status_code=400, detail="Invalid country code")
+    
+    # Réponse déjà sérialisée, rafraîchie en arrière-plan (en-tête Age = âge des données)
+    snapshot = charts_scheduler.get(country_code)
+    if snapshot:
+        return conditional_response(http_request, snapshot['body'], snapshot['etag'],
+                                    charts_scheduler.max_age(snapshot), snapshot_headers(snapshot))
+    
     try:
-        # Récupérer les charts populaires
-        charts = ytmusic.get_charts()
-        return charts
+        # Pays non planifié ou premier chargement pas encore terminé
+        entry = await metadata.get_charts_entry(country_code)
+        if entry['body'] is None:
+            return entry['value']
+        return conditional_response(http_request, entry['body'], entry['etag'], metadata.max_age('charts', entry))
+    except ExtractionUnavailable:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/playlist")
-async def get_playlist(request: PlaylistRequest):
+async def get_playlist(request: PlaylistRequest, http_request: Request,
+                       profile: Optional[str] = None, fields: Optional[str] = None):
+    profile, fields = projection_params(profile, fields)
     try:
-        playlist = ytmusic.get_playlist(request.playlist_id)
-        return playlist
+        entry = await metadata.get_playlist_entry(request.playlist_id)
+    except ExtractionUnavailable:
+        raise
     except Exception as e:
         raise HTTPException(status_code=404, detail="Playlist not found")
+    
+    if request.prefetch:
+        # Résolution en arrière-plan: les premiers /stream seront des hits de cache
+        audio_cache.prefetch(playlist_video_ids(entry['value']), request.prefetch_count, load=stream_prefetch_loader)
+    if entry['body'] is None:
+        return entry['value']
+    if is_projected(profile, fields):
+        # fields= est choisi par le client: projection calculée par requête, pas gardée avec l'entrée
+        entry = entry_view(entry, (profile, fields), lambda playlist: project_playlist(playlist, profile, fields),
+                           memoize=not fields)
+    return conditional_response(http_request, entry['body'], entry['etag'], metadata.max_age('playlist', entry))
 
 @app.get("/cache/stats")
 async def get_cache_stats():
     return {
         "total_entries": len(audio_cache),
         "cache_duration_seconds": CACHE_DURATION,
+        "single_flight": stream_flight.get_stats(),
+        "negative_cache": negative_cache.get_stats(),
+        "cache": audio_cache.get_cache_stats(),
         "entries": [
             {
                 "video_id": vid,
                 "title": data["title"],
-                "age_seconds": time.time() - data["timestamp"]
+                "age_seconds": time.time() - data["timestamp"],
+                "expires_in": max(0.0, data["refresh_after"] - time.time())
             }
             for vid, data in audio_cache.items()
         ]
@@ -287,9 +504,7 @@ async def get_cache_stats():
 
 @app.delete("/cache/clear")
 async def clear_cache():
-    global audio_cache
-    count = len(audio_cache)
-    audio_cache = {}
+    count = audio_cache.clear()
     return {"message": f"Cache vidé, {count} entrées supprimées"}
 
 if __name__ == "__main__":
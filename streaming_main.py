@@ -1,6 +1,6 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import Response, StreamingResponse
 from ytmusicapi import YTMusic
 from pydantic import BaseModel
 from typing import List, Optional
@@ -12,8 +12,22 @@ import tempfile
 import time
 import json
 from audio_extractor import extract_audio_url
+from extraction_pool import extraction_pool, ExtractionUnavailable, install_exception_handlers
+from metadata_client import MetadataClient
+from compression import CompressionMiddleware, conditional_compressed_json, response_compressor
+from metadata_cache import entry_view
+from projection import is_projected, parse_fields, parse_profile, project_items, project_playlist
+from charts_scheduler import ChartsScheduler, normalize_country, snapshot_headers
+from single_flight import AsyncSingleFlight
+from cache_manager import AudioCacheManager, CacheSnapshotter, expiry_info
+from refresh_ahead import stream_refresher
+from prefetch import LoopLoader, stream_prefetcher, playlist_video_ids
+from batch_stream import stream_batch, STREAM_BATCH_MAX_IDS, NDJSON_MEDIA_TYPE
+from negative_cache import negative_cache
 
 app = FastAPI(title="Music Streaming API - Version Complète", version="2.0.0")
+# Pools saturés -> 503, appels trop longs -> 504
+install_exception_handlers(app)
 
 # Configuration CORS pour React Native
 app.add_middleware(
@@ -23,13 +37,17 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# gzip/brotli négociés sur Accept-Encoding; corps en cache compressés une seule fois
+app.add_middleware(CompressionMiddleware)
 
 # Initialisation de YTMusic
 ytmusic = YTMusic()
+# Appels ytmusicapi exécutés dans un pool borné, hors de la boucle d'événements
+metadata = MetadataClient(ytmusic)
+# Charts des pays CHARTS_COUNTRIES, rechargés en arrière-plan et servis depuis la mémoire
+charts_scheduler = ChartsScheduler(ytmusic.get_charts)
 
-# Cache simple en mémoire pour les URLs audio
-audio_cache = {}
-CACHE_DURATION = 1800  # 30 minutes
+CACHE_DURATION = 1800  # 30 minutes, si l'URL ne porte pas sa propre expiration
 
 # Configuration yt-dlp optimisée
 ydl_opts = {
@@ -50,69 +68,174 @@ class SearchRequest(BaseModel):
 
 class PlaylistRequest(BaseModel):
     playlist_id: str
+    # Précharger les URLs des premiers titres (PLAYLIST_PREFETCH_TRACKS par défaut)
+    prefetch: Optional[bool] = False
+    prefetch_count: Optional[int] = None
 
-def is_cache_valid(timestamp):
-    return time.time() - timestamp < CACHE_DURATION
+class BatchStreamRequest(BaseModel):
+    video_ids: List[str]
+    retry: Optional[bool] = False
 
-def cleanup_cache():
-    """Nettoie les entrées expirées du cache"""
-    expired_keys = [
-        key for key, value in audio_cache.items()
-        if not is_cache_valid(value['timestamp'])
-    ]
-    for key in expired_keys:
-        del audio_cache[key]
+stream_flight = AsyncSingleFlight()
+
+async def resolve_stream(video_id: str, bypass_negative_cache: bool = False, run=extraction_pool.run):
+    """Extraction partagée: les requêtes concurrentes pour un même video_id attendent la même extraction
+
+    `run(func, *args)` exécute l'extraction bloquante (pool interactif par défaut).
+    """
+    async def extract_and_cache():
+        # Extraire l'URL audio avec notre extracteur amélioré, hors de la boucle d'événements
+        result = await run(extract_audio_url, video_id, bypass_negative_cache)
+        if result['success']:
+            # Mettre en cache l'URL
+            cache_entry = audio_cache.set(video_id, result['audio_url'], title=result['title'])
+            result.update(expiry_info(cache_entry))
+        return result
+
+    return await stream_flight.do(video_id, extract_and_cache)
+
+async def prefetch_stream(video_id: str) -> bool:
+    """Préchargement de playlist, partagé avec les /stream concurrents (stream_flight)
+
+    L'extraction tourne hors du pool interactif; le nombre de préchargements
+    simultanés reste borné par les workers du prefetcher.
+    """
+    result = await resolve_stream(video_id, run=asyncio.to_thread)
+    return result['success']
+
+stream_prefetch_loader = LoopLoader(prefetch_stream)
+
+def refresh_stream(video_id: str) -> Optional[dict]:
+    """Ré-extraction en arrière-plan d'une entrée populaire (refresh-ahead)"""
+    result = extract_audio_url(video_id)
+    # Ne jamais remplacer une URL encore valide par un échec
+    if result['success']:
+        return {'audio_url': result['audio_url'], 'title': result['title']}
+    return None
+
+# Cache borné (LRU + TTL) des URLs audio, rafraîchi en arrière-plan pour les vidéos populaires
+audio_cache = AudioCacheManager(
+    cache_duration=CACHE_DURATION,
+    refresher=stream_refresher,
+    loader=refresh_stream,
+    prefetcher=stream_prefetcher
+)
+
+# Sauvegarde du cache sur disque pour survivre aux redémarrages
+# (un fichier par application et par processus, voir CacheSnapshotter)
+cache_snapshotter = CacheSnapshotter(audio_cache, 'streaming_main.stream')
+metadata_snapshotter = CacheSnapshotter(metadata.metadata_cache, 'streaming_main.metadata')
+
+@app.on_event("startup")
+async def restore_cache():
+    cache_snapshotter.start()
+    metadata_snapshotter.start()
+
+@app.on_event("startup")
+async def bind_prefetch_loader():
+    # Les préchargements exécutent prefetch_stream sur cette boucle
+    stream_prefetch_loader.bind()
+
+@app.on_event("shutdown")
+async def save_cache():
+    cache_snapshotter.stop()
+    metadata_snapshotter.stop()
+
+@app.on_event("startup")
+async def start_charts_scheduler():
+    charts_scheduler.start()
+
+@app.on_event("shutdown")
+async def stop_charts_scheduler():
+    charts_scheduler.stop()
 
 @app.get("/")
 async def root():
     return {"message": "Music Streaming API - Version Complète avec yt-dlp"}
 
+def conditional_response(http_request: Request, body: bytes, etag: str, max_age: int, headers=None) -> Response:
+    """Réponse JSON avec ETag et Cache-Control, ou 304 si If-None-Match correspond"""
+    status, body, headers = conditional_compressed_json(http_request.headers.get('if-none-match'),
+                                                        http_request.headers.get('accept-encoding'),
+                                                        body, etag, max_age, headers)
+    return Response(content=body, status_code=status, media_type="application/json", headers=headers)
+
+def projection_params(profile: Optional[str], fields: Optional[str]) -> tuple:
+    """(profil, champs) validés depuis ?profile=full|compact&fields=a,b.c"""
+    try:
+        return parse_profile(profile), parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.post("/search")
-async def search_music(request: SearchRequest):
+async def search_music(request: SearchRequest, http_request: Request,
+                       profile: Optional[str] = None, fields: Optional[str] = None):
+    profile, fields = projection_params(profile, fields)
     try:
-        results = ytmusic.search(request.query, filter=request.filter, limit=request.limit)
-        return {"results": results}
+        # Corps et ETag mémorisés avec l'entrée du cache de recherche (projection comprise)
+        response = await metadata.search_response(request.query, filter=request.filter, limit=request.limit)
+        if is_projected(profile, fields):
+            response = entry_view(response, (profile, fields),
+                                  lambda results: {"results": project_items(results, profile, fields)},
+                                  memoize=not fields)
+        return conditional_response(http_request, response['body'], response['etag'], metadata.search_max_age(response))
+    except ExtractionUnavailable:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/song/{video_id}")
-async def get_song_info(video_id: str):
+async def get_song_info(video_id: str, http_request: Request):
     try:
-        song_info = ytmusic.get_song(video_id)
-        return song_info
+        entry = await metadata.get_song_entry(video_id)
+        if entry['body'] is None:
+            return entry['value']
+        return conditional_response(http_request, entry['body'], entry['etag'], metadata.max_age('song', entry))
+    except ExtractionUnavailable:
+        raise
     except Exception as e:
         raise HTTPException(status_code=404, detail="Song not found")
 
-@app.get("/stream/{video_id}")
-async def stream_audio(video_id: str):
-    """Extrait l'URL audio réelle avec yt-dlp"""
+def stream_response_fields(cache_entry: dict) -> dict:
+    """Champs d'une réponse /stream servie depuis le cache, hors expiration"""
+    return {
+        "audio_url": cache_entry['url'],
+        "title": cache_entry['title'],
+        "cached": True
+    }
+
+def cached_stream_response(video_id: str) -> Optional[dict]:
+    """Réponse /stream servie depuis le cache, ou None"""
+    # Vérifier le cache d'abord (les entrées expirées sont purgées par le cache)
+    cache_entry = audio_cache.get_entry(video_id)
+    if cache_entry:
+        return {**stream_response_fields(cache_entry), **expiry_info(cache_entry)}
+    return None
+
+def cached_stream_body(video_id: str) -> Optional[Response]:
+    """Réponse /stream servie depuis le cache en octets déjà sérialisés, ou None"""
+    body = audio_cache.get_response_body(video_id, stream_response_fields)
+    return Response(content=body, media_type="application/json") if body else None
+
+async def extract_stream_response(video_id: str, retry: bool = False) -> dict:
+    """Réponse /stream après extraction; lève une HTTPException en cas d'échec"""
+    # Un préchargement de playlist tourne déjà pour cette vidéo: l'attendre (brièvement) plutôt que d'extraire deux fois
+    if await stream_prefetcher.wait(video_id):
+        cached = cached_stream_response(video_id)
+        if cached:
+            return cached
+    
     try:
-        # Nettoyer le cache périodiquement
-        cleanup_cache()
-        
-        # Vérifier le cache d'abord
-        if video_id in audio_cache:
-            cache_entry = audio_cache[video_id]
-            if is_cache_valid(cache_entry['timestamp']):
-                return {
-                    "audio_url": cache_entry['url'],
-                    "title": cache_entry['title'],
-                    "cached": True,
-                    "expires_in": CACHE_DURATION - (time.time() - cache_entry['timestamp'])
-                }
-        
-        # Extraire l'URL audio avec notre extracteur amélioré
-        result = extract_audio_url(video_id)
+        # Extraire l'URL audio (une seule extraction par video_id en cours);
+        # retry=true ignore un échec récent mémorisé dans le cache négatif
+        result = await resolve_stream(video_id, retry)
         
         if not result['success']:
-            raise HTTPException(status_code=404, detail=result.get('error', 'Extraction failed'))
-        
-        # Mettre en cache l'URL
-        audio_cache[video_id] = {
-            'url': result['audio_url'],
-            'title': result['title'],
-            'timestamp': time.time()
-        }
+            raise HTTPException(
+                status_code=404,
+                detail=result.get('error', 'Extraction failed'),
+                headers={"X-Error-Class": result.get('error_class', 'unknown')}
+            )
         
         return {
             "audio_url": result['audio_url'],
@@ -121,41 +244,103 @@ async def stream_audio(video_id: str):
             "format": result.get('format', 'audio'),
             "quality": result.get('quality', 'unknown'),
             "strategy": result.get('strategy', 'unknown'),
-            "duration": result.get('duration', 0)
+            "duration": result.get('duration', 0),
+            "expires_at": result['expires_at'],
+            "refresh_after": result['refresh_after']
         }
             
+    except (HTTPException, ExtractionUnavailable):
+        raise
     except Exception as e:
         logging.error(f"Erreur streaming pour {video_id}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/stream/{video_id}")
+async def stream_audio(video_id: str, retry: bool = False):
+    """Extrait l'URL audio réelle avec yt-dlp"""
+    return cached_stream_body(video_id) or await extract_stream_response(video_id, retry)
+
+@app.post("/stream/batch")
+async def stream_audio_batch(request: BatchStreamRequest):
+    """Résout une file de video_id et renvoie chaque résultat en NDJSON dès qu'il est prêt"""
+    if len(request.video_ids) > STREAM_BATCH_MAX_IDS:
+        raise HTTPException(status_code=413, detail=f"Too many video_ids (max {STREAM_BATCH_MAX_IDS})")
+    return StreamingResponse(
+        stream_batch(
+            request.video_ids,
+            cached_stream_response,
+            lambda video_id: extract_stream_response(video_id, request.retry)
+        ),
+        media_type=NDJSON_MEDIA_TYPE
+    )
+
 @app.get("/charts")
-async def get_charts():
+async def get_charts(http_request: Request, country: Optional[str] = None):
+    country_code = normalize_country(country)
+    if country_code is None:
+        raise HTTPException(status_code=400, detail="Invalid country code")
+    
+    # Réponse déjà sérialisée, rafraîchie en arrière-plan (en-tête Age = âge des données)
+    snapshot = charts_scheduler.get(country_code)
+    if snapshot:
+        return conditional_response(http_request, snapshot['body'], snapshot['etag'],
+                                    charts_scheduler.max_age(snapshot), snapshot_headers(snapshot))
+    
     try:
-        charts = ytmusic.get_charts()
-        return charts
+        # Pays non planifié ou premier chargement pas encore terminé
+        entry = await metadata.get_charts_entry(country_code)
+        if entry['body'] is None:
+            return entry['value']
+        return conditional_response(http_request, entry['body'], entry['etag'], metadata.max_age('charts', entry))
+    except ExtractionUnavailable:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/playlist")
-async def get_playlist(request: PlaylistRequest):
+async def get_playlist(request: PlaylistRequest, http_request: Request,
+                       profile: Optional[str] = None, fields: Optional[str] = None):
+    profile, fields = projection_params(profile, fields)
     try:
-        playlist = ytmusic.get_playlist(request.playlist_id)
-        return playlist
+        entry = await metadata.get_playlist_entry(request.playlist_id)
+    except ExtractionUnavailable:
+        raise
     except Exception as e:
         raise HTTPException(status_code=404, detail="Playlist not found")
+    
+    if request.prefetch:
+        # Résolution en arrière-plan: les premiers /stream seront des hits de cache
+        audio_cache.prefetch(playlist_video_ids(entry['value']), request.prefetch_count, load=stream_prefetch_loader)
+    if entry['body'] is None:
+        return entry['value']
+    if is_projected(profile, fields):
+        # fields= est choisi par le client: projection calculée par requête, pas gardée avec l'entrée
+        entry = entry_view(entry, (profile, fields), lambda playlist: project_playlist(playlist, profile, fields),
+                           memoize=not fields)
+    return conditional_response(http_request, entry['body'], entry['etag'], metadata.max_age('playlist', entry))
 
 @app.get("/cache/stats")
 async def get_cache_stats():
     """Statistiques du cache"""
-    cleanup_cache()
+    audio_cache.clear_expired()
     return {
         "total_entries": len(audio_cache),
         "cache_duration_seconds": CACHE_DURATION,
+        "extraction_pool": extraction_pool.get_stats(),
+        "metadata_pool": metadata.get_stats(),
+        "search_cache": metadata.get_search_cache_stats(),
+        "metadata_cache": metadata.get_metadata_cache_stats(),
+        "compression": response_compressor.get_stats(),
+        "charts": charts_scheduler.get_stats(),
+        "single_flight": stream_flight.get_stats(),
+        "negative_cache": negative_cache.get_stats(),
+        "cache": audio_cache.get_cache_stats(),
         "entries": [
             {
                 "video_id": vid,
                 "title": data["title"],
-                "age_seconds": time.time() - data["timestamp"]
+                "age_seconds": time.time() - data["timestamp"],
+                "expires_in": max(0.0, data["refresh_after"] - time.time())
             }
             for vid, data in audio_cache.items()
         ]
@@ -164,9 +349,7 @@ async def get_cache_stats():
 @app.delete("/cache/clear")
 async def clear_cache():
     """Vider le cache"""
-    global audio_cache
-    count = len(audio_cache)
-    audio_cache = {}
+    count = audio_cache.clear()
     return {"message": f"Cache vidé, {count} entrées supprimées"}
 
 if __name__ == "__main__":
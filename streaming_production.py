@@ -1,13 +1,26 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 from ytmusicapi import YTMusic
 from pydantic import BaseModel
 from typing import List, Optional
 import logging
 import time
 import yt_dlp
+from extraction_pool import extraction_pool, ExtractionUnavailable, install_exception_handlers
+from metadata_client import MetadataClient
+from compression import CompressionMiddleware, conditional_compressed_json, response_compressor
+from metadata_cache import entry_view
+from projection import is_projected, parse_fields, parse_profile, project_items
+from single_flight import AsyncSingleFlight
+from cache_manager import AudioCacheManager, CacheSnapshotter, expiry_info
+from refresh_ahead import stream_refresher
+from batch_stream import stream_batch, STREAM_BATCH_MAX_IDS, NDJSON_MEDIA_TYPE
+from negative_cache import negative_cache, classify_error
 
 app = FastAPI(title="Music Streaming API - Production", version="2.0.0")
+# Pools saturés -> 503, appels trop longs -> 504
+install_exception_handlers(app)
 
 app.add_middleware(
     CORSMiddleware,
@@ -16,21 +29,35 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# gzip/brotli négociés sur Accept-Encoding; corps en cache compressés une seule fois
+app.add_middleware(CompressionMiddleware)
 
 ytmusic = YTMusic()
-audio_cache = {}
-CACHE_DURATION = 1800
+# Appels ytmusicapi exécutés dans un pool borné, hors de la boucle d'événements
+metadata = MetadataClient(ytmusic)
+CACHE_DURATION = 1800  # Si l'URL ne porte pas sa propre expiration
 
 class SearchRequest(BaseModel):
     query: str
     filter: Optional[str] = "songs"
     limit: Optional[int] = 20
 
-def is_cache_valid(timestamp):
-    return time.time() - timestamp < CACHE_DURATION
+class BatchStreamRequest(BaseModel):
+    video_ids: List[str]
+    retry: Optional[bool] = False
 
-def extract_audio_simple(video_id: str):
+def extract_audio_simple(video_id: str, bypass_negative_cache: bool = False):
     """Version simplifiée pour la production"""
+    # Échec récent mémorisé: ne pas relancer l'extraction
+    failure = negative_cache.check(video_id, bypass_negative_cache)
+    if failure:
+        return {
+            'success': False,
+            'error': failure['error'] or 'Extraction récemment échouée',
+            'error_class': failure['error_class'],
+            'negative_cached': True
+        }
+    
     try:
         # Configuration yt-dlp optimisée pour la production
         ydl_opts = {
@@ -85,48 +112,127 @@ def extract_audio_simple(video_id: str):
                     
     except Exception as e:
         logging.error(f"Extraction error: {e}")
-        return {'success': False, 'error': str(e)}
+        error_class = classify_error(str(e))
+        negative_cache.record(video_id, error_class, str(e))
+        return {'success': False, 'error': str(e), 'error_class': error_class}
     
-    return {'success': False, 'error': 'No audio format found'}
+    negative_cache.record(video_id, 'unavailable', 'No audio format found')
+    return {'success': False, 'error': 'No audio format found', 'error_class': 'unavailable'}
+
+stream_flight = AsyncSingleFlight()
+
+async def resolve_stream(video_id: str, bypass_negative_cache: bool = False):
+    """Extraction partagée: les requêtes concurrentes pour un même video_id attendent la même extraction"""
+    async def extract_and_cache():
+        # Extraire l'URL audio hors de la boucle d'événements
+        result = await extraction_pool.run(extract_audio_simple, video_id, bypass_negative_cache)
+        if result['success']:
+            # Mettre en cache
+            cache_entry = audio_cache.set(video_id, result['audio_url'], title=result['title'])
+            result.update(expiry_info(cache_entry))
+        return result
+
+    return await stream_flight.do(video_id, extract_and_cache)
+
+def refresh_stream(video_id: str) -> Optional[dict]:
+    """Ré-extraction en arrière-plan d'une entrée populaire (refresh-ahead)"""
+    result = extract_audio_simple(video_id)
+    # Ne jamais remplacer une URL encore valide par un échec
+    if result['success']:
+        return {'audio_url': result['audio_url'], 'title': result['title']}
+    return None
+
+# Cache borné (LRU + TTL) des URLs audio, rafraîchi en arrière-plan pour les vidéos populaires
+audio_cache = AudioCacheManager(
+    cache_duration=CACHE_DURATION,
+    refresher=stream_refresher,
+    loader=refresh_stream
+)
+
+# Sauvegarde du cache sur disque pour survivre aux redémarrages
+# (un fichier par application et par processus, voir CacheSnapshotter)
+cache_snapshotter = CacheSnapshotter(audio_cache, 'streaming_production.stream')
+metadata_snapshotter = CacheSnapshotter(metadata.metadata_cache, 'streaming_production.metadata')
+
+@app.on_event("startup")
+async def restore_cache():
+    cache_snapshotter.start()
+    metadata_snapshotter.start()
+
+@app.on_event("shutdown")
+async def save_cache():
+    cache_snapshotter.stop()
+    metadata_snapshotter.stop()
 
 @app.get("/")
 async def root():
     return {"message": "Music Streaming API - Production Ready"}
 
+def conditional_response(http_request: Request, body: bytes, etag: str, max_age: int, headers=None) -> Response:
+    """Réponse JSON avec ETag et Cache-Control, ou 304 si If-None-Match correspond"""
+    status, body, headers = conditional_compressed_json(http_request.headers.get('if-none-match'),
+                                                        http_request.headers.get('accept-encoding'),
+                                                        body, etag, max_age, headers)
+    return Response(content=body, status_code=status, media_type="application/json", headers=headers)
+
+def projection_params(profile: Optional[str], fields: Optional[str]) -> tuple:
+    """(profil, champs) validés depuis ?profile=full|compact&fields=a,b.c"""
+    try:
+        return parse_profile(profile), parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.post("/search")
-async def search_music(request: SearchRequest):
+async def search_music(request: SearchRequest, http_request: Request,
+                       profile: Optional[str] = None, fields: Optional[str] = None):
+    profile, fields = projection_params(profile, fields)
     try:
-        results = ytmusic.search(request.query, filter=request.filter, limit=request.limit)
-        return {"results": results}
+        # Corps et ETag mémorisés avec l'entrée du cache de recherche (projection comprise)
+        response = await metadata.search_response(request.query, filter=request.filter, limit=request.limit)
+        if is_projected(profile, fields):
+            response = entry_view(response, (profile, fields),
+                                  lambda results: {"results": project_items(results, profile, fields)},
+                                  memoize=not fields)
+        return conditional_response(http_request, response['body'], response['etag'], metadata.search_max_age(response))
+    except ExtractionUnavailable:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/stream/{video_id}")
-async def stream_audio(video_id: str):
+def stream_response_fields(cache_entry: dict) -> dict:
+    """Champs d'une réponse /stream servie depuis le cache, hors expiration"""
+    return {
+        "audio_url": cache_entry['url'],
+        "title": cache_entry['title'],
+        "cached": True
+    }
+
+def cached_stream_response(video_id: str) -> Optional[dict]:
+    """Réponse /stream servie depuis le cache, ou None"""
+    # Vérifier le cache
+    cache_entry = audio_cache.get_entry(video_id)
+    if cache_entry:
+        return {**stream_response_fields(cache_entry), **expiry_info(cache_entry)}
+    return None
+
+def cached_stream_body(video_id: str) -> Optional[Response]:
+    """Réponse /stream servie depuis le cache en octets déjà sérialisés, ou None"""
+    body = audio_cache.get_response_body(video_id, stream_response_fields)
+    return Response(content=body, media_type="application/json") if body else None
+
+async def extract_stream_response(video_id: str, retry: bool = False) -> dict:
+    """Réponse /stream après extraction; lève une HTTPException en cas d'échec"""
     try:
-        # Vérifier le cache
-        if video_id in audio_cache:
-            cache_entry = audio_cache[video_id]
-            if is_cache_valid(cache_entry['timestamp']):
-                return {
-                    "audio_url": cache_entry['url'],
-                    "title": cache_entry['title'],
-                    "cached": True,
-                    "expires_in": CACHE_DURATION - (time.time() - cache_entry['timestamp'])
-                }
-        
-        # Extraire l'URL audio
-        result = extract_audio_simple(video_id)
+        # Extraire l'URL audio (une seule extraction par video_id en cours);
+        # retry=true ignore un échec récent mémorisé dans le cache négatif
+        result = await resolve_stream(video_id, retry)
         
         if not result['success']:
-            raise HTTPException(status_code=404, detail=result.get('error', 'Extraction failed'))
-        
-        # Mettre en cache
-        audio_cache[video_id] = {
-            'url': result['audio_url'],
-            'title': result['title'],
-            'timestamp': time.time()
-        }
+            raise HTTPException(
+                status_code=404,
+                detail=result.get('error', 'Extraction failed'),
+                headers={"X-Error-Class": result.get('error_class', 'unknown')}
+            )
         
         return {
             "audio_url": result['audio_url'],
@@ -134,18 +240,44 @@ async def stream_audio(video_id: str):
             "cached": False,
             "format": result.get('format', 'audio'),
             "quality": result.get('quality', 'unknown'),
-            "duration": result.get('duration', 0)
+            "duration": result.get('duration', 0),
+            "expires_at": result['expires_at'],
+            "refresh_after": result['refresh_after']
         }
             
+    except (HTTPException, ExtractionUnavailable):
+        raise
     except Exception as e:
         logging.error(f"Streaming error for {video_id}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/stream/{video_id}")
+async def stream_audio(video_id: str, retry: bool = False):
+    return cached_stream_body(video_id) or await extract_stream_response(video_id, retry)
+
+@app.post("/stream/batch")
+async def stream_audio_batch(request: BatchStreamRequest):
+    """Résout une file de video_id et renvoie chaque résultat en NDJSON dès qu'il est prêt"""
+    if len(request.video_ids) > STREAM_BATCH_MAX_IDS:
+        raise HTTPException(status_code=413, detail=f"Too many video_ids (max {STREAM_BATCH_MAX_IDS})")
+    return StreamingResponse(
+        stream_batch(
+            request.video_ids,
+            cached_stream_response,
+            lambda video_id: extract_stream_response(video_id, request.retry)
+        ),
+        media_type=NDJSON_MEDIA_TYPE
+    )
+
 @app.get("/song/{video_id}")
-async def get_song_info(video_id: str):
+async def get_song_info(video_id: str, http_request: Request):
     try:
-        song_info = ytmusic.get_song(video_id)
-        return song_info
+        entry = await metadata.get_song_entry(video_id)
+        if entry['body'] is None:
+            return entry['value']
+        return conditional_response(http_request, entry['body'], entry['etag'], metadata.max_age('song', entry))
+    except ExtractionUnavailable:
+        raise
     except Exception as e:
         raise HTTPException(status_code=404, detail="Song not found")
 
@@ -154,16 +286,30 @@ async def get_cache_stats():
     return {
         "total_entries": len(audio_cache),
         "cache_duration_seconds": CACHE_DURATION,
+        "extraction_pool": extraction_pool.get_stats(),
+        "metadata_pool": metadata.get_stats(),
+        "search_cache": metadata.get_search_cache_stats(),
+        "metadata_cache": metadata.get_metadata_cache_stats(),
+        "compression": response_compressor.get_stats(),
+        "single_flight": stream_flight.get_stats(),
+        "negative_cache": negative_cache.get_stats(),
+        "cache": audio_cache.get_cache_stats(),
         "entries": [
             {
                 "video_id": vid,
                 "title": data["title"],
-                "age_seconds": time.time() - data["timestamp"]
+                "age_seconds": time.time() - data["timestamp"],
+                "expires_in": max(0.0, data["refresh_after"] - time.time())
             }
             for vid, data in audio_cache.items()
         ]
     }
 
+@app.delete("/cache/clear")
+async def clear_cache():
+    count = audio_cache.clear()
+    return {"message": f"Cache vidé, {count} entrées supprimées"}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,115 @@
+"""
+Serveur RESP minimal en mémoire, pour tester RedisBackend sans Redis
+
+Implémente les commandes utilisées par RespClient/RedisBackend: AUTH, SELECT,
+PING, GET, SET (avec PX), DEL, MGET, SCAN (MATCH, COUNT).
+"""
+import fnmatch
+import socketserver
+import threading
+import time
+
+
+class _Store:
+    def __init__(self, password=None):
+        self.password = password
+        self.data = {}
+        self.lock = threading.Lock()
+        self.commands = []
+
+    def _alive(self, key):
+        value = self.data.get(key)
+        if value is None:
+            return None
+        raw, expires_at = value
+        if expires_at is not None and expires_at <= time.time():
+            del self.data[key]
+            return None
+        return raw
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        store = self.server.store
+        authenticated = store.password is None
+        while True:
+            args = self._read_command()
+            if args is None:
+                return
+            name = args[0].upper().decode()
+            store.commands.append(name)
+            if name == 'AUTH':
+                authenticated = args[1].decode() == store.password
+                self._reply(b'+OK\r\n' if authenticated else b'-ERR invalid password\r\n')
+            elif not authenticated:
+                self._reply(b'-NOAUTH Authentication required.\r\n')
+            else:
+                with store.lock:
+                    self._reply(self._execute(store, name, args[1:]))
+
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        count = int(line[1:-2])
+        args = []
+        for _ in range(count):
+            length = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def _reply(self, payload):
+        self.wfile.write(payload)
+
+    @staticmethod
+    def _bulk(value):
+        if value is None:
+            return b'$-1\r\n'
+        return b'$%d\r\n%s\r\n' % (len(value), value)
+
+    def _execute(self, store, name, args):
+        if name in ('SELECT', 'PING'):
+            return b'+OK\r\n' if name == 'SELECT' else b'+PONG\r\n'
+        if name == 'GET':
+            return self._bulk(store._alive(args[0]))
+        if name == 'SET':
+            expires_at = None
+            if len(args) >= 4 and args[2].upper() == b'PX':
+                expires_at = time.time() + int(args[3]) / 1000
+            store.data[args[0]] = (args[1], expires_at)
+            return b'+OK\r\n'
+        if name == 'DEL':
+            deleted = sum(1 for key in args if store._alive(key) is not None and store.data.pop(key, None))
+            return b':%d\r\n' % deleted
+        if name == 'MGET':
+            return b'*%d\r\n' % len(args) + b''.join(self._bulk(store._alive(key)) for key in args)
+        if name == 'SCAN':
+            pattern = args[args.index(b'MATCH') + 1].decode() if b'MATCH' in args else '*'
+            keys = [key for key in list(store.data) if store._alive(key) is not None
+                    and fnmatch.fnmatchcase(key.decode(), pattern)]
+            return b'*2\r\n' + self._bulk(b'0') + b'*%d\r\n' % len(keys) + b''.join(self._bulk(key) for key in keys)
+        return b'-ERR unknown command\r\n'
+
+
+class RespServer(socketserver.ThreadingTCPServer):
+    """Serveur lancé dans un thread: `with RespServer() as server: server.url`"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, password=None):
+        super().__init__(('127.0.0.1', 0), _Handler)
+        self.store = _Store(password)
+
+    @property
+    def url(self):
+        auth = f":{self.store.password}@" if self.store.password else ''
+        return f"redis://{auth}127.0.0.1:{self.server_address[1]}/1"
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
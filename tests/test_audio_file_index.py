@@ -0,0 +1,118 @@
+"""
+Index des fichiers audio: recherche exacte, fichiers partiels, doublons
+"""
+import os
+
+import pytest
+
+pytest.importorskip("flask")
+
+from app.infrastructure.audio_file_index import AudioFileIndex, parse_filename  # noqa: E402
+
+
+def write(directory, name, size, mtime=None):
+    path = directory / name
+    path.write_bytes(b'a' * size)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+    return path
+
+
+@pytest.mark.parametrize('filename, expected', [
+    ('dQw4w9WgXcQ.m4a', {'video_id': 'dQw4w9WgXcQ', 'ext': 'm4a'}),
+    ('abc.f251.webm', {'video_id': 'abc', 'ext': 'webm'}),
+    ('abc.webm.part', None),
+    ('abc.f251.webm.ytdl', None),
+    ('.gitkeep', None),
+])
+def test_parse_filename(filename, expected):
+    assert parse_filename(filename) == expected
+
+
+def test_lookup_is_by_exact_video_id(tmp_path):
+    write(tmp_path, 'abcd.m4a', 10)
+    write(tmp_path, 'abc.webm.part', 10)
+    index = AudioFileIndex(tmp_path)
+    index.build()
+
+    assert index.get('abc') is None
+    assert index.get('abcd')['filename'] == 'abcd.m4a'
+    assert len(index) == 1
+
+
+def test_build_removes_older_duplicates(tmp_path):
+    write(tmp_path, 'abc.webm', 100, mtime=1000)
+    write(tmp_path, 'abc.m4a', 110, mtime=2000)
+    write(tmp_path, 'abcd.m4a', 100, mtime=1500)
+    index = AudioFileIndex(tmp_path, max_bytes=250)
+    index.build()
+
+    assert sorted(os.listdir(tmp_path)) == ['abc.m4a', 'abcd.m4a']
+    assert index.get('abc')['filename'] == 'abc.m4a'
+    stats = index.get_stats()
+    assert stats['total_bytes'] == 210
+    assert stats['duplicates_removed_at_build'] == 1
+    assert stats['bytes_reclaimed'] == 100
+
+
+@pytest.mark.parametrize('policy, evicted', [('lru', 'old'), ('lfu', 'new')])
+def test_enforce_quota_evicts_by_policy(tmp_path, policy, evicted):
+    write(tmp_path, 'old.m4a', 100, mtime=1000)
+    write(tmp_path, 'new.m4a', 100, mtime=2000)
+    index = AudioFileIndex(tmp_path, policy=policy)
+    index.build()
+    # old: accédé plus souvent, new: accédé plus récemment
+    index.touch('old')
+    index.touch('old')
+    index.touch('new')
+    write(tmp_path, 'keep.m4a', 100)
+    index.add(tmp_path / 'keep.m4a')
+    index.max_bytes = 250
+
+    assert index.enforce_quota(keep='keep') == 1
+    assert index.get(evicted) is None
+    assert not (tmp_path / f"{evicted}.m4a").exists()
+    assert index.get('keep') is not None
+    assert index.get_stats()['total_bytes'] == 200
+
+
+def test_failed_eviction_keeps_the_file_accounted(tmp_path, monkeypatch):
+    write(tmp_path, 'a.m4a', 100, mtime=1000)
+    write(tmp_path, 'b.m4a', 100, mtime=2000)
+    index = AudioFileIndex(tmp_path, max_bytes=150)
+    index.build()
+
+    def refuse(path):
+        raise PermissionError(path)
+
+    monkeypatch.setattr(os, 'unlink', refuse)
+    assert index.enforce_quota() == 0
+
+    stats = index.get_stats()
+    assert stats['total_bytes'] == 200
+    assert stats['eviction_failures'] == 1
+    assert index.get('a') is not None
+
+
+def test_sweep_orphans_removes_only_old_partial_files(tmp_path):
+    temp_dir = tmp_path / '.incoming'
+    temp_dir.mkdir()
+    write(temp_dir, 'abc.123-aa.webm.part', 10, mtime=1000)
+    write(tmp_path, 'old.webm.part', 10, mtime=1000)
+    write(tmp_path, 'fresh.webm.part', 10)
+    write(tmp_path, 'keep.m4a', 10, mtime=1000)
+    write(tmp_path, '.gitkeep', 0, mtime=1000)
+    index = AudioFileIndex(tmp_path)
+
+    assert index.sweep_orphans(min_age=3600) == 2
+    assert sorted(os.listdir(tmp_path)) == ['.gitkeep', '.incoming', 'fresh.webm.part', 'keep.m4a']
+    assert os.listdir(temp_dir) == []
+
+
+def test_sweep_orphans_keeps_active_downloads(tmp_path):
+    stalled = write(tmp_path, 'slow.webm.part', 10, mtime=1000)
+    write(tmp_path, 'dead.webm.part', 10, mtime=1000)
+    index = AudioFileIndex(tmp_path)
+
+    assert index.sweep_orphans(min_age=300, active={str(stalled)}) == 1
+    assert os.listdir(tmp_path) == ['slow.webm.part']
@@ -0,0 +1,123 @@
+"""
+Fichiers audio locaux: analyse du Range, fusion des plages, réponses 206/416
+"""
+import os
+
+import pytest
+
+pytest.importorskip("flask")
+from flask import Flask  # noqa: E402
+
+from app.routes.audio_file_responses import (  # noqa: E402
+    file_etag, parse_byte_ranges, satisfiable_spans, send_audio_file
+)
+
+CONTENT = bytes(range(256)) * 4
+
+
+@pytest.fixture
+def file_info(tmp_path):
+    path = tmp_path / 'abc123.m4a'
+    path.write_bytes(CONTENT)
+    stat = os.stat(path)
+    return {
+        'file_path': str(path),
+        'filename': path.name,
+        'mimetype': 'audio/mp4',
+        'size_bytes': stat.st_size,
+        'mtime': stat.st_mtime
+    }
+
+
+@pytest.fixture
+def client(file_info):
+    app = Flask(__name__)
+
+    @app.route('/audio')
+    def audio():
+        return send_audio_file(file_info)
+
+    return app.test_client()
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('bytes=0-99', [(0, 100)]),
+    ('bytes=0-99,200-,-50', [(0, 100), (200, None), (-50, None)]),
+    ('bytes=-0', [(0, 0)]),
+    ('bytes= 5-5 , 7-', [(5, 6), (7, None)]),
+])
+def test_parse_byte_ranges(header, expected):
+    assert parse_byte_ranges(header) == expected
+
+
+@pytest.mark.parametrize('header', [None, '', 'items=0-1', 'bytes=', 'bytes=-', 'bytes=9-3', 'bytes=a-1', 'bytes=0-1,x'])
+def test_parse_byte_ranges_rejects_invalid(header):
+    assert parse_byte_ranges(header) is None
+
+
+def test_satisfiable_spans_clamp_sort_and_coalesce():
+    ranges = [(500, 600), (0, 10), (5, 20), (20, 30), (-100, None), (2000, None), (0, 0)]
+
+    assert satisfiable_spans(ranges, 1000) == [[0, 30], [500, 600], [900, 1000]]
+
+
+def test_satisfiable_spans_collapses_too_many_ranges():
+    ranges = [(i * 10, i * 10 + 1) for i in range(20)]
+
+    assert satisfiable_spans(ranges, 1000) == [[0, 191]]
+
+
+def test_single_range(client):
+    response = client.get('/audio', headers={'Range': 'bytes=10-19'})
+
+    assert response.status_code == 206
+    assert response.data == CONTENT[10:20]
+    assert response.headers['Content-Range'] == f"bytes 10-19/{len(CONTENT)}"
+
+
+@pytest.mark.parametrize('header', ['bytes=-0', f"bytes={len(CONTENT)}-", 'bytes=-0,5000-6000'])
+def test_unsatisfiable_range_is_416(client, header):
+    response = client.get('/audio', headers={'Range': header})
+
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == f"bytes */{len(CONTENT)}"
+
+
+def test_zero_suffix_ignored_next_to_satisfiable_range(client):
+    response = client.get('/audio', headers={'Range': 'bytes=-0,0-3'})
+
+    assert response.status_code == 206
+    assert response.data == CONTENT[:4]
+
+
+def test_overlapping_ranges_are_merged_into_one_part(client):
+    response = client.get('/audio', headers={'Range': 'bytes=0-9,5-14'})
+
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f"bytes 0-14/{len(CONTENT)}"
+    assert response.data == CONTENT[:15]
+
+
+def test_multiple_ranges_are_multipart(client):
+    response = client.get('/audio', headers={'Range': 'bytes=0-3,100-103'})
+
+    assert response.status_code == 206
+    assert response.mimetype == 'multipart/byteranges'
+    assert int(response.headers['Content-Length']) == len(response.data)
+    assert f"Content-Range: bytes 0-3/{len(CONTENT)}".encode() in response.data
+    assert CONTENT[100:104] in response.data
+
+
+def test_stale_if_range_sends_whole_file(client, file_info):
+    response = client.get('/audio', headers={'Range': 'bytes=0-3,100-103', 'If-Range': '"other"'})
+
+    assert response.status_code == 200
+    assert response.data == CONTENT
+
+
+def test_matching_etag_is_304(client, file_info):
+    etag = file_etag(file_info['size_bytes'], file_info['mtime'])
+
+    response = client.get('/audio', headers={'If-None-Match': f'"{etag}"'})
+
+    assert response.status_code == 304
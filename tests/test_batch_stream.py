@@ -0,0 +1,45 @@
+"""
+Lots /stream/batch en NDJSON: hits de cache, résolutions, statuts d'erreur
+"""
+import asyncio
+import json
+
+from batch_stream import stream_batch
+from extraction_pool import ExtractionOverloaded, ExtractionTimeout
+
+
+def run_batch(video_ids, lookup, resolve):
+    async def collect():
+        return [json.loads(line) async for line in stream_batch(video_ids, lookup, resolve)]
+    return asyncio.run(collect())
+
+
+def test_cache_hits_first_then_resolved_and_summary():
+    async def resolve(video_id):
+        return {'audio_url': f"https://example.com/{video_id}"}
+
+    lines = run_batch(['a', 'b'], lambda video_id: {'cached': True} if video_id == 'b' else None, resolve)
+
+    assert lines[0] == {'index': 1, 'video_id': 'b', 'status': 200, 'cached': True}
+    assert lines[1]['video_id'] == 'a' and lines[1]['status'] == 200
+    assert lines[2]['done'] is True
+    assert (lines[2]['cached'], lines[2]['resolved'], lines[2]['failed']) == (1, 1, 0)
+
+
+def test_pool_errors_keep_their_retry_later_status():
+    async def resolve(video_id):
+        if video_id == 'busy':
+            raise ExtractionOverloaded("Pool extraction saturé", "extraction")
+        if video_id == 'slow':
+            raise ExtractionTimeout("Extraction timeout after 45s", "extraction")
+        raise RuntimeError("boom")
+
+    lines = run_batch(['busy', 'slow', 'broken'], lambda video_id: None, resolve)
+    by_id = {line['video_id']: line for line in lines if 'video_id' in line}
+
+    assert by_id['busy']['status'] == 503
+    assert by_id['busy']['error'] == "Extraction service busy, retry later"
+    assert by_id['slow']['status'] == 504
+    assert by_id['slow']['error'] == "Extraction timed out"
+    assert by_id['broken']['status'] == 500
+    assert lines[-1]['failed'] == 3
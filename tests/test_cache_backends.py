@@ -0,0 +1,116 @@
+"""
+Backends du cache des URLs: mémoire, SQLite, Redis (contre un serveur RESP local)
+"""
+import time
+
+import pytest
+
+import cache_backends
+from cache_backends import MemoryBackend, RedisBackend, SQLiteBackend, create_backend
+from resp_server import RespServer
+
+
+def entry(ttl=60, **fields):
+    return {'url': 'https://example.com/a', 'refresh_after': time.time() + ttl, **fields}
+
+
+@pytest.fixture
+def sqlite_path(tmp_path):
+    return str(tmp_path / 'cache.db')
+
+
+def test_sqlite_enforces_max_entries_on_every_write(sqlite_path):
+    backend = SQLiteBackend(sqlite_path, 'stream', max_entries=3)
+    for i in range(9):
+        backend.put(f"v{i}", entry())
+
+    assert len(backend) == 3
+    assert [key for key, _ in backend.items()] == ['v6', 'v7', 'v8']
+    assert backend.get_stats()['evictions']['capacity'] == 6
+
+
+def test_sqlite_evicts_least_recently_read(sqlite_path):
+    backend = SQLiteBackend(sqlite_path, 'stream', max_entries=2)
+    backend.put('a', entry())
+    backend.put('b', entry())
+    time.sleep(0.01)
+    assert backend.get('a') is not None
+    backend.put('c', entry())
+
+    assert backend.get('b') is None
+    assert backend.get('a') is not None
+
+
+def test_sqlite_enforces_max_bytes(sqlite_path):
+    backend = SQLiteBackend(sqlite_path, 'stream', max_entries=100, max_bytes=1000)
+    for i in range(10):
+        backend.put(f"v{i}", entry(title='x' * 200))
+
+    stats = backend.get_stats()
+    assert 0 < stats['stored_bytes'] <= 1000
+    assert stats['evictions']['memory'] > 0
+    assert backend.get('v9') is not None
+
+
+def test_sqlite_namespaces_are_isolated(sqlite_path):
+    stream = SQLiteBackend(sqlite_path, 'stream', max_entries=1)
+    other = SQLiteBackend(sqlite_path, 'api_stream', max_entries=1)
+    stream.put('a', entry())
+    other.put('b', entry())
+
+    assert stream.get('a') is not None
+    assert other.get('a') is None
+    assert len(stream) == len(other) == 1
+
+
+def test_sqlite_hides_and_purges_expired_entries(sqlite_path):
+    backend = SQLiteBackend(sqlite_path, 'stream', max_entries=10)
+    backend.put('old', entry(ttl=-1))
+
+    assert backend.get('old') is None
+    assert backend.purge_expired() == 1
+
+
+def test_memory_backend_bounds():
+    backend = MemoryBackend(max_entries=2, max_bytes=10 ** 6)
+    for key in 'abc':
+        backend.put(key, entry())
+
+    assert [key for key, _ in backend.items()] == ['b', 'c']
+
+
+def test_redis_backend_against_local_resp_server():
+    with RespServer(password='secret') as server:
+        backend = RedisBackend(server.url, 'stream', prefix='test')
+        backend.put('a', entry(title='A'))
+        backend.put('b', entry())
+        backend.put('expired', entry(ttl=-1))
+
+        assert backend.get('a')['title'] == 'A'
+        assert backend.get('missing') is None
+        assert backend.get('expired') is None
+        assert sorted(key for key, _ in backend.items()) == ['a', 'b']
+        assert len(backend) == 2
+        assert backend.delete('a')
+        assert backend.clear() == 1
+        assert len(backend) == 0
+        assert server.store.commands[:2] == ['AUTH', 'SELECT']
+
+
+def test_redis_client_reconnects_after_connection_loss():
+    with RespServer() as server:
+        backend = RedisBackend(server.url, 'stream')
+        backend.put('a', entry())
+        backend.client._sock.close()
+
+        assert backend.get('a') is not None
+
+
+def test_create_backend_falls_back_to_memory_when_misconfigured(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_backends, 'CACHE_SQLITE_PATH', str(tmp_path / 'missing' / 'cache.db'))
+    assert isinstance(create_backend('stream', 10, 1000, kind='sqlite'), MemoryBackend)
+
+    monkeypatch.setattr(cache_backends, 'REDIS_URL', 'redis://localhost:notaport/0')
+    assert isinstance(create_backend('stream', 10, 1000, kind='redis'), MemoryBackend)
+
+    assert isinstance(create_backend('stream', 10, 1000, kind='nope'), MemoryBackend)
@@ -0,0 +1,78 @@
+"""
+Snapshots des caches mémoire: un fichier par application et par processus
+"""
+import os
+import time
+
+from cache_backends import MemoryBackend
+from cache_manager import AudioCacheManager, CacheSnapshotter
+from metadata_cache import MetadataCache
+from snapshot_files import list_snapshots, snapshot_path
+
+
+def audio_cache():
+    return AudioCacheManager(backend=MemoryBackend(100, 1024 * 1024))
+
+
+def url(video_id):
+    return f"https://example.com/{video_id}?expire={int(time.time()) + 6 * 3600}"
+
+
+def test_processes_and_apps_write_separate_files(tmp_path, monkeypatch):
+    directory = str(tmp_path)
+    first, second, other_app = audio_cache(), audio_cache(), audio_cache()
+    first.set('a', url('a'))
+    second.set('b', url('b'))
+    other_app.set('c', url('c'))
+
+    monkeypatch.setattr(os, 'getpid', lambda: 101)
+    CacheSnapshotter(first, 'main.stream', directory, interval=0).save()
+    CacheSnapshotter(other_app, 'simple.stream', directory, interval=0).save()
+    monkeypatch.setattr(os, 'getpid', lambda: 102)
+    CacheSnapshotter(second, 'main.stream', directory, interval=0).save()
+
+    assert len(list_snapshots(directory, 'main.stream')) == 2
+
+    restarted = audio_cache()
+    monkeypatch.setattr(os, 'getpid', lambda: 103)
+    CacheSnapshotter(restarted, 'main.stream', directory, interval=0).start()
+
+    assert restarted.get('a') and restarted.get('b')
+    assert restarted.get('c') is None
+
+
+def test_start_prunes_old_and_surplus_snapshots(tmp_path, monkeypatch):
+    directory = str(tmp_path)
+    cache = audio_cache()
+    cache.set('a', url('a'))
+    for pid in (1, 2, 3, 4):
+        monkeypatch.setattr(os, 'getpid', lambda pid=pid: pid)
+        CacheSnapshotter(cache, 'main.stream', directory, interval=0).save()
+    stale = snapshot_path(directory, 'main.stream', 1)
+    os.utime(stale, (time.time() - 7200, time.time() - 7200))
+
+    monkeypatch.setattr(os, 'getpid', lambda: 5)
+    CacheSnapshotter(audio_cache(), 'main.stream', directory, interval=0, max_age=3600, keep=2).start()
+
+    remaining = list_snapshots(directory, 'main.stream')
+    assert stale not in remaining
+    assert len(remaining) == 2
+
+
+def test_metadata_cache_round_trip_keeps_timestamps(tmp_path):
+    cache = MetadataCache(ttls={'song': 60}, max_ages={'song': 3600})
+    entry = cache.get_entry('song', 'v1', lambda: {'title': 'One'})
+    cache.get_entry('song', 'v2', lambda: {'title': 'Two'})
+    with cache._lock:
+        cache._entries[('song', 'v2')]['timestamp'] -= 7200
+    path = str(tmp_path / 'metadata.json.gz')
+
+    assert cache.snapshot(path) == 1
+
+    restored = MetadataCache(ttls={'song': 60}, max_ages={'song': 3600})
+    assert restored.restore(path) == (1, 0)
+    again = restored.get_entry('song', 'v1', lambda: None)
+    assert again['value'] == {'title': 'One'}
+    assert again['etag'] == entry['etag']
+    assert again['timestamp'] == entry['timestamp']
+    assert restored.get_stats()['misses'] == 0
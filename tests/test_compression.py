@@ -0,0 +1,102 @@
+"""
+Compression négociée: Accept-Encoding, seuil, stock des corps à ETag fort
+"""
+import gzip
+import os
+
+import pytest
+
+from compression import ResponseCompressor, conditional_compressed_json, parse_accept_encoding
+from http_caching import make_etag
+
+BODY = b'{"results":[' + b'{"title":"Song","videoId":"abc"},' * 200 + b'{}]}'
+
+
+@pytest.fixture
+def compressor():
+    compressor = ResponseCompressor(min_size=1024, cache_max_bytes=1024 * 1024)
+    # Sans dépendre de la présence du module brotli
+    compressor.encodings = ['gzip']
+    return compressor
+
+
+def test_parse_accept_encoding():
+    assert parse_accept_encoding('gzip, br;q=0.8, *;q=0, deflate;q=x') == {
+        'gzip': 1.0, 'br': 0.8, '*': 0.0, 'deflate': 0.0
+    }
+    assert parse_accept_encoding(None) == {}
+
+
+@pytest.mark.parametrize('accept_encoding, expected', [
+    ('gzip', 'gzip'),
+    ('br, gzip;q=0.5', 'gzip'),
+    ('*', 'gzip'),
+    ('gzip;q=0', None),
+    ('*;q=0', None),
+    ('identity', None),
+    (None, None),
+])
+def test_negotiate(compressor, accept_encoding, expected):
+    assert compressor.negotiate(accept_encoding) == expected
+
+
+def test_small_body_is_sent_as_is(compressor):
+    assert compressor.encode('gzip', b'{}', '"tag"') == (b'{}', '"tag"', {})
+
+
+def test_gzip_body_gets_weak_etag_and_vary(compressor):
+    body, etag, headers = compressor.encode('gzip', BODY, '"tag"')
+
+    assert gzip.decompress(body) == BODY
+    assert etag == 'W/"tag"'
+    assert headers == {'Vary': 'Accept-Encoding', 'Content-Encoding': 'gzip'}
+
+
+def test_refused_encoding_still_varies(compressor):
+    assert compressor.encode('gzip;q=0', BODY, '"tag"') == (BODY, '"tag"', {'Vary': 'Accept-Encoding'})
+
+
+def test_strong_etag_body_is_compressed_once(compressor):
+    first, _, _ = compressor.encode('gzip', BODY, '"tag"')
+    second, _, _ = compressor.encode('gzip', BODY, '"tag"')
+    compressor.encode('gzip', BODY, 'W/"weak"')
+
+    stats = compressor.get_stats()
+    assert first == second
+    assert stats['precompressed']['hits'] == 1
+    assert stats['precompressed']['entries'] == 1
+    assert stats['by_encoding']['gzip']['compressions'] == 2
+
+
+def test_incompressible_body_is_sent_as_is(compressor):
+    noise = os.urandom(4096)
+
+    assert compressor.encode('gzip', noise)[0] == noise
+    assert compressor.get_stats()['not_smaller'] == 1
+
+
+def test_304_echoes_the_weak_etag_of_the_compressed_200(compressor):
+    etag = make_etag(BODY)
+    status, body, headers = conditional_compressed_json(None, 'gzip', BODY, etag, 60, compressor=compressor)
+    assert status == 200
+    _, sent_etag, _ = compressor.encode('gzip', body, headers['ETag'])
+    assert sent_etag == 'W/' + etag
+
+    status, body, headers = conditional_compressed_json(sent_etag, 'gzip', BODY, etag, 60, compressor=compressor)
+
+    assert (status, body) == (304, b'')
+    assert headers['ETag'] == sent_etag
+    assert headers['Vary'] == 'Accept-Encoding'
+    assert compressor.get_stats()['by_encoding']['gzip']['compressions'] == 1
+
+
+def test_304_keeps_strong_etag_for_identity_or_small_bodies(compressor):
+    etag = make_etag(BODY)
+    _, _, headers = conditional_compressed_json('W/' + etag, None, BODY, etag, 60, compressor=compressor)
+    assert headers['ETag'] == etag
+
+    small_etag = make_etag(b'{}')
+    status, _, headers = conditional_compressed_json(small_etag, 'gzip', b'{}', small_etag, 60, compressor=compressor)
+    assert status == 304
+    assert headers['ETag'] == small_etag
+    assert 'Vary' not in headers
@@ -0,0 +1,56 @@
+"""
+Erreurs des pools d'extraction: une seule correspondance 503/504 par application
+"""
+import threading
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+from extraction_pool import ExtractionPool, ExtractionUnavailable, install_exception_handlers
+
+
+@pytest.fixture
+def release():
+    event = threading.Event()
+    yield event
+    event.set()
+
+
+def client_for(pool, release):
+    app = FastAPI()
+    install_exception_handlers(app)
+
+    @app.get("/call")
+    async def call(block: bool = False):
+        try:
+            return await pool.run(lambda: release.wait(5) if block else "ok")
+        except ExtractionUnavailable:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    return TestClient(app)
+
+
+def test_timeout_maps_to_504_with_pool_name(release):
+    client = client_for(ExtractionPool(max_workers=1, max_queue=0, timeout=0.05, name="metadata"), release)
+
+    response = client.get("/call", params={"block": True})
+
+    assert response.status_code == 504
+    assert response.json() == {"detail": "Metadata timed out"}
+
+
+def test_saturated_pool_maps_to_503(release):
+    client = client_for(ExtractionPool(max_workers=1, max_queue=0, timeout=0.05), release)
+    # Le thread bloqué garde sa place après le timeout de la première requête
+    assert client.get("/call", params={"block": True}).status_code == 504
+
+    response = client.get("/call")
+
+    assert response.status_code == 503
+    assert response.json() == {"detail": "Extraction service busy, retry later"}
@@ -0,0 +1,55 @@
+"""
+Validateurs HTTP: ETag, If-None-Match, max-age restant
+"""
+import pytest
+
+from http_caching import conditional_json, etag_matches, make_etag, remaining_max_age, serialize_json
+
+
+def test_etag_depends_on_body_only():
+    assert make_etag(b'{"a":1}') == make_etag(b'{"a":1}')
+    assert make_etag(b'{"a":1}') != make_etag(b'{"a":2}')
+    assert make_etag(b'x', weak=True) == 'W/' + make_etag(b'x')
+
+
+@pytest.mark.parametrize('if_none_match, matches', [
+    ('"abc"', True),
+    ('W/"abc"', True),
+    ('"other", "abc"', True),
+    ('*', True),
+    ('"other"', False),
+    ('abc', False),
+    ('', False),
+    (None, False),
+])
+def test_etag_matches_uses_weak_comparison(if_none_match, matches):
+    assert etag_matches(if_none_match, '"abc"') is matches
+    assert etag_matches(if_none_match, 'W/"abc"') is matches
+
+
+def test_conditional_json_304_keeps_cache_headers():
+    body = serialize_json({'title': 'Song'})
+    etag = make_etag(body)
+
+    status, sent, headers = conditional_json(etag, body, etag, 60, {'Age': '5'})
+
+    assert (status, sent) == (304, b'')
+    assert headers == {'Age': '5', 'Cache-Control': 'public, max-age=60', 'ETag': etag}
+
+
+def test_conditional_json_computes_missing_etag():
+    body = serialize_json([1, 2])
+
+    status, sent, headers = conditional_json('"stale"', body, None, 0)
+
+    assert (status, sent) == (200, body)
+    assert headers['ETag'] == make_etag(body)
+
+
+def test_remaining_max_age_never_negative():
+    assert remaining_max_age(600, stored_at=1000, now=1100) == 500
+    assert remaining_max_age(600, stored_at=1000, now=5000) == 0
+
+
+def test_serialize_json_falls_back_for_non_text_keys():
+    assert serialize_json({1: 'é'}) == '{"1":"é"}'.encode('utf-8')
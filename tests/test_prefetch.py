@@ -0,0 +1,69 @@
+"""
+Préchargement: file d'attente, re-vérification du cache, partage avec /stream
+"""
+import asyncio
+import threading
+
+from prefetch import LoopLoader, StreamPrefetcher
+from single_flight import AsyncSingleFlight
+
+
+def test_track_cached_while_queued_is_not_loaded():
+    prefetcher = StreamPrefetcher(max_workers=1)
+    release = threading.Event()
+    cached = set()
+    loaded = []
+
+    def load(video_id):
+        if video_id == 'busy':
+            release.wait(5)
+        loaded.append(video_id)
+        cached.add(video_id)
+        return True
+
+    prefetcher.prefetch(['busy', 'queued'], cached.__contains__, load)
+    # Un /stream met 'queued' en cache pendant qu'il attend son tour
+    cached.add('queued')
+    release.set()
+    prefetcher._executor.shutdown(wait=True)
+
+    assert loaded == ['busy']
+    stats = prefetcher.get_stats()
+    assert stats['already_cached'] == 1
+    assert stats['stored'] == 1
+    assert stats['in_flight'] == 0
+
+
+def test_loop_loader_joins_the_request_in_flight():
+    flight = AsyncSingleFlight()
+    extractions = []
+
+    async def resolve(video_id):
+        async def extract():
+            extractions.append(video_id)
+            await asyncio.sleep(0.1)
+            return {'success': True}
+        return await flight.do(video_id, extract)
+
+    async def prefetch_stream(video_id):
+        return (await resolve(video_id))['success']
+
+    loader = LoopLoader(prefetch_stream)
+
+    async def scenario():
+        loader.bind()
+        request = asyncio.ensure_future(resolve('abc'))
+        await asyncio.sleep(0.01)
+        prefetched = await asyncio.to_thread(loader, 'abc')
+        await request
+        return prefetched
+
+    assert asyncio.run(scenario()) is True
+    assert extractions == ['abc']
+
+
+def test_loop_loader_before_bind_loads_nothing():
+    async def prefetch_stream(video_id):
+        raise AssertionError("must not run")
+
+    assert LoopLoader(prefetch_stream)('abc') is False
@@ -0,0 +1,169 @@
+"""
+Téléchargements progressifs: flux pendant l'écriture, rattachement, pool
+borné, annulation et réponses tronquées
+"""
+import os
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("flask")
+
+from app.infrastructure.progressive_download import (  # noqa: E402
+    DownloadIncomplete,
+    DownloadsOverloaded,
+    ProgressiveDownloads,
+)
+
+CHUNK = b'x' * 1000
+
+
+def fake_download(path, chunks=5, fail=False, delay=0.02, gate=None):
+    """run(download) qui écrit un .part comme yt-dlp, puis le renomme (ou échoue)"""
+    def run(download):
+        if gate is not None:
+            gate.wait(5)
+        part = f"{path}.part"
+        with open(part, 'wb') as f:
+            for i in range(chunks):
+                f.write(CHUNK)
+                f.flush()
+                download.on_progress({
+                    'status': 'downloading', 'filename': path, 'tmpfilename': part,
+                    'downloaded_bytes': (i + 1) * len(CHUNK), 'total_bytes': chunks * len(CHUNK)
+                })
+                time.sleep(delay)
+        if fail:
+            return None
+        os.replace(part, path)
+        return {'file_path': path}
+    return run
+
+
+def read_all(download, **kwargs):
+    return b''.join(download.iter_bytes(chunk_size=512, **kwargs))
+
+
+def test_streams_whole_file_while_written(tmp_path):
+    downloads = ProgressiveDownloads(max_workers=1, max_queue=0)
+    download, started = downloads.start('abc', fake_download(str(tmp_path / 'abc.webm')))
+
+    assert started
+    assert download.wait_until_readable(5)
+    assert read_all(download) == CHUNK * 5
+    assert download.wait(5) == {'file_path': str(tmp_path / 'abc.webm')}
+    assert download.ext == 'webm'
+    assert downloads.get_stats()['completed'] == 1
+
+
+def test_concurrent_requests_attach_to_one_download(tmp_path):
+    downloads = ProgressiveDownloads(max_workers=1, max_queue=0)
+    run = fake_download(str(tmp_path / 'abc.webm'))
+    first, started = downloads.start('abc', run)
+    second, attached_started = downloads.start('abc', run)
+
+    assert started and not attached_started
+    assert first is second
+    assert read_all(first) == read_all(second) == CHUNK * 5
+    stats = downloads.get_stats()
+    assert (stats['started'], stats['attached']) == (1, 1)
+
+
+def test_failed_download_raises_instead_of_ending_cleanly(tmp_path):
+    downloads = ProgressiveDownloads(max_workers=1, max_queue=0)
+    download, _ = downloads.start('abc', fake_download(str(tmp_path / 'abc.webm'), fail=True))
+    received = []
+
+    with pytest.raises(DownloadIncomplete):
+        for chunk in download.iter_bytes(chunk_size=512):
+            received.append(chunk)
+
+    # Les octets écrits avant l'échec ont été envoyés, puis le flux est coupé
+    assert b''.join(received) == CHUNK * 5
+    assert download.wait(5) is None
+    assert downloads.get_stats()['failed'] == 1
+
+
+def test_download_failing_before_any_byte_raises(tmp_path):
+    downloads = ProgressiveDownloads(max_workers=1, max_queue=0)
+    download, _ = downloads.start('abc', lambda download: None)
+
+    with pytest.raises(DownloadIncomplete):
+        read_all(download)
+
+
+def test_stalled_download_raises_after_idle_timeout(tmp_path):
+    downloads = ProgressiveDownloads(max_workers=1, max_queue=0)
+    release = threading.Event()
+
+    def stalled(download):
+        fake_download(str(tmp_path / 'abc.webm'), chunks=1)(download)
+        release.wait(5)
+        return None
+
+    download, _ = downloads.start('abc', stalled)
+    with pytest.raises(DownloadIncomplete):
+        read_all(download, idle_timeout=0.2)
+    release.set()
+
+
+def test_pool_rejects_downloads_past_its_bound(tmp_path):
+    gate = threading.Event()
+    downloads = ProgressiveDownloads(max_workers=1, max_queue=1)
+    downloads.start('a', fake_download(str(tmp_path / 'a.webm'), gate=gate))
+    downloads.start('b', fake_download(str(tmp_path / 'b.webm'), gate=gate))
+
+    with pytest.raises(DownloadsOverloaded):
+        downloads.start('c', fake_download(str(tmp_path / 'c.webm'), gate=gate))
+    # Un video_id déjà en cours reste joignable même pool plein
+    downloads.start('a', fake_download(str(tmp_path / 'a.webm')))
+
+    gate.set()
+    assert downloads.get_stats()['rejected'] == 1
+
+
+def test_last_reader_leaving_cancels_the_download(tmp_path):
+    downloads = ProgressiveDownloads(max_workers=1, max_queue=0)
+    download, _ = downloads.start('abc', fake_download(str(tmp_path / 'abc.webm'), chunks=50))
+
+    stream = download.iter_bytes(chunk_size=512)
+    next(stream)
+    # Déconnexion du client: le serveur ferme le générateur
+    stream.close()
+
+    assert download.cancelled
+    assert download.wait(5) is None
+    assert downloads.get_stats()['cancelled'] == 1
+    assert not os.path.exists(tmp_path / 'abc.webm')
+    # Une nouvelle requête relance un téléchargement au lieu de rejoindre l'annulé
+    _, started = downloads.start('abc', fake_download(str(tmp_path / 'abc.webm')))
+    assert started
+
+
+def test_blocking_waiter_keeps_download_alive(tmp_path):
+    downloads = ProgressiveDownloads(max_workers=1, max_queue=0)
+    download, _ = downloads.start('abc', fake_download(str(tmp_path / 'abc.webm'), chunks=20))
+    waiter = threading.Thread(target=download.wait, args=(5,))
+    waiter.start()
+    while not download.waiters:
+        time.sleep(0.01)
+
+    stream = download.iter_bytes(chunk_size=512)
+    next(stream)
+    stream.close()
+    waiter.join()
+
+    assert not download.cancelled
+    assert download.result == {'file_path': str(tmp_path / 'abc.webm')}
+
+
+def test_active_paths_lists_files_being_written(tmp_path):
+    downloads = ProgressiveDownloads(max_workers=1, max_queue=0)
+    path = str(tmp_path / 'abc.webm')
+    download, _ = downloads.start('abc', fake_download(path, delay=0.2))
+
+    assert download.wait_until_readable(5)
+    assert downloads.active_paths() == {path, f"{path}.part"}
+    download.wait(5)
+    assert downloads.active_paths() == set()
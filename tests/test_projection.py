@@ -0,0 +1,93 @@
+"""
+Projection des résultats: profils, fields=, playlists
+"""
+import pytest
+
+from projection import (
+    COMPACT_THUMBNAIL_WIDTH, field_tree, is_projected, parse_fields, parse_profile, pick_thumbnail,
+    project, project_items, project_playlist
+)
+
+ITEM = {
+    'videoId': 'abc',
+    'title': 'Song',
+    'artists': [{'name': 'Artist', 'id': 'UC1', 'extra': True}],
+    'album': {'name': 'Album', 'id': 'MPRE1'},
+    'duration': '3:00',
+    'duration_seconds': 180,
+    'thumbnails': [
+        {'url': 'large', 'width': 544},
+        {'url': 'small', 'width': 60},
+        {'url': 'medium', 'width': COMPACT_THUMBNAIL_WIDTH},
+    ],
+    'isExplicit': False,
+}
+
+
+def test_parse_fields_sorts_and_deduplicates():
+    assert parse_fields(' title,videoId ,title,artists.name') == ('artists.name', 'title', 'videoId')
+    assert parse_fields(None) is None
+    assert parse_fields(' ') is None
+    assert parse_fields('title,') == ('title',)
+
+
+@pytest.mark.parametrize('fields', ['a..b', '1title', 'title;drop', ','.join(f"f{i}" for i in range(51))])
+def test_parse_fields_rejects_invalid(fields):
+    with pytest.raises(ValueError):
+        parse_fields(fields)
+
+
+def test_parse_profile():
+    assert parse_profile(None) == 'full'
+    assert parse_profile('COMPACT') == 'compact'
+    with pytest.raises(ValueError):
+        parse_profile('tiny')
+
+
+def test_field_tree_whole_field_wins_over_subfield():
+    assert field_tree(('artists', 'artists.name', 'title')) == {'artists': None, 'title': None}
+    assert field_tree(('album.id', 'album.name')) == {'album': {'id': None, 'name': None}}
+
+
+def test_project_recurses_into_lists_and_skips_missing():
+    projected = project([ITEM], field_tree(('artists.name', 'missing', 'title')))
+
+    assert projected == [{'artists': [{'name': 'Artist'}], 'title': 'Song'}]
+
+
+def test_pick_thumbnail():
+    assert pick_thumbnail(ITEM['thumbnails']) == 'medium'
+    assert pick_thumbnail([{'url': 'tiny', 'width': 10}, {'url': 'small', 'width': 60}]) == 'small'
+    assert pick_thumbnail(None) is None
+
+
+def test_compact_profile_then_fields():
+    assert project_items([ITEM], 'compact') == [{
+        'videoId': 'abc',
+        'title': 'Song',
+        'artists': [{'name': 'Artist', 'id': 'UC1'}],
+        'duration': '3:00',
+        'duration_seconds': 180,
+        'thumbnail': 'medium',
+    }]
+    assert project_items([ITEM], 'compact', ('thumbnail', 'videoId')) == [{'thumbnail': 'medium', 'videoId': 'abc'}]
+
+
+def test_compact_item_for_albums_uses_browse_id():
+    assert project_items([{'browseId': 'MPRE1', 'title': 'Album'}], 'compact')[0]['browseId'] == 'MPRE1'
+
+
+def test_project_playlist():
+    playlist = {'id': 'PL1', 'title': 'Mix', 'trackCount': 1, 'thumbnails': ITEM['thumbnails'],
+                'author': {'name': 'Me'}, 'tracks': [ITEM]}
+
+    assert project_playlist(playlist, fields=('title',)) == {**playlist, 'tracks': [{'title': 'Song'}]}
+    compact = project_playlist(playlist, 'compact')
+    assert 'author' not in compact and compact['thumbnail'] == 'medium'
+    assert compact['tracks'][0]['videoId'] == 'abc'
+
+
+def test_is_projected():
+    assert not is_projected('full', None)
+    assert is_projected('compact', None)
+    assert is_projected('full', ('title',))
@@ -0,0 +1,63 @@
+"""
+Recherche: même corps et même ETag au miss et au hit du cache
+"""
+import asyncio
+
+from extraction_pool import ExtractionPool
+from metadata_client import MetadataClient
+from search_cache import SearchCache
+
+
+class FakeYTMusic:
+    """ytmusicapi ne tronque pas à `limit`: renvoie toujours 25 résultats"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def search(self, query, filter=None, limit=20):
+        self.calls += 1
+        return [{'videoId': f"v{i}", 'title': f"{query} {i}"} for i in range(25)]
+
+
+def make_client(ytmusic):
+    return MetadataClient(ytmusic, pool=ExtractionPool(max_workers=1, max_queue=1, name="test"),
+                          search_cache=SearchCache(ttl=60), metadata_cache=None)
+
+
+def test_miss_and_hit_return_the_same_body_and_etag():
+    ytmusic = FakeYTMusic()
+    client = make_client(ytmusic)
+
+    miss = asyncio.run(client.search_response("daft punk", "songs", limit=10))
+    hit = asyncio.run(client.search_response("Daft  Punk", "songs", limit=10))
+
+    assert ytmusic.calls == 1
+    assert len(miss['value']) == 10
+    assert miss['body'] == hit['body']
+    assert miss['etag'] == hit['etag']
+
+
+def test_smaller_limit_is_served_from_a_larger_cached_search():
+    ytmusic = FakeYTMusic()
+    client = make_client(ytmusic)
+
+    asyncio.run(client.search_response("stromae", "songs", limit=20))
+    smaller = asyncio.run(client.search_response("stromae", "songs", limit=5))
+
+    assert ytmusic.calls == 1
+    assert [item['videoId'] for item in smaller['value']] == ['v0', 'v1', 'v2', 'v3', 'v4']
+
+
+def test_client_limits_do_not_pile_up_bodies_in_the_entry():
+    cache = SearchCache(ttl=60)
+    results = [{'videoId': f"v{i}"} for i in range(20)]
+    cache.set("daft punk", "songs", 20, results)
+
+    for limit in range(1, 21):
+        response = cache.get_response("daft punk", "songs", limit)
+        assert response['value'] == results[:limit]
+
+    entry = cache._entries[cache.make_key("daft punk", "songs")]
+    assert set(entry) == {'results', 'limit', 'timestamp', 'view'}
+    assert cache.get_response("daft punk", "songs", 20) is entry['view']
+    assert cache.get_response("daft punk", "songs", 5) is not cache.get_response("daft punk", "songs", 5)
@@ -0,0 +1,56 @@
+"""
+Session HTTP partagée des clients YTMusic: timeout par défaut
+"""
+import socket
+import threading
+
+import pytest
+
+pytest.importorskip("flask")
+requests = pytest.importorskip("requests")
+pytest.importorskip("ytmusicapi")
+
+from app.infrastructure.youtube_music_repository import create_http_session  # noqa: E402
+
+
+@pytest.fixture
+def stalled_server():
+    """Accepte les connexions et ne répond jamais"""
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(4)
+    accepted = []
+    stop = threading.Event()
+
+    def accept():
+        listener.settimeout(0.1)
+        while not stop.is_set():
+            try:
+                accepted.append(listener.accept()[0])
+            except OSError:
+                continue
+
+    thread = threading.Thread(target=accept, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{listener.getsockname()[1]}/"
+    stop.set()
+    thread.join()
+    for conn in accepted:
+        conn.close()
+    listener.close()
+
+
+def test_session_applies_default_timeout(stalled_server):
+    session = create_http_session(pool_size=2, timeout=0.2)
+
+    with pytest.raises(requests.exceptions.Timeout):
+        session.get(stalled_server)
+    with pytest.raises(requests.exceptions.Timeout):
+        session.post(stalled_server, json={})
+
+
+def test_explicit_timeout_still_wins(stalled_server):
+    session = create_http_session(pool_size=2, timeout=60)
+
+    with pytest.raises(requests.exceptions.Timeout):
+        session.get(stalled_server, timeout=0.2)